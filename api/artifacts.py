@@ -0,0 +1,65 @@
+# artifacts.py
+"""
+変換結果 (数出表・納品書・シールデータ) を置くディスク上の保存場所。
+
+セッションには出力のバイト列ではなく put() が返すハンドル (内容の SHA-256) だけを持たせ、
+ダウンロード時に read() でファイルから読み直す。同じ内容は1ファイルにまとまる。
+最終利用から ARTIFACT_TTL_HOURS を過ぎたものと、合計サイズが ARTIFACT_MAX_MB を
+超えた分を最終利用の古い順に削除する (削除済みのハンドルは read() が None を返す)。
+"""
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from .disk_cache import DiskLRU
+
+DEFAULT_STORE_DIR = os.path.join(tempfile.gettempdir(), 'mamameal-artifacts')
+DEFAULT_MAX_BYTES = int(float(os.environ.get('ARTIFACT_MAX_MB', '512')) * 1024 * 1024)
+DEFAULT_MAX_AGE = float(os.environ.get('ARTIFACT_TTL_HOURS', '24')) * 3600
+
+
+class ArtifactStore:
+    """内容アドレスのファイル置き場 (プロセス・スレッド間で共有可)"""
+
+    def __init__(self, store_dir: str = DEFAULT_STORE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.store_dir = store_dir
+        self._files = DiskLRU(store_dir, max_bytes=max_bytes, max_age=max_age)
+
+    def put(self, data: bytes) -> str:
+        """data を保存してハンドルを返す"""
+        handle = hashlib.sha256(data).hexdigest()
+        if self._files.lookup(handle) is not None:
+            return handle
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        self._files.write(handle, write, keep=True)
+        return handle
+
+    def path(self, handle: Optional[str]) -> Optional[str]:
+        """保存済みファイルのパス (期限切れ・削除済みなら None)"""
+        return self._files.lookup(handle) if handle else None
+
+    def read(self, handle: Optional[str]) -> Optional[bytes]:
+        path = self.path(handle)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+_DEFAULT_STORE: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """既定の設定 (一時ディレクトリの mamameal-artifacts) の保存場所"""
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        _DEFAULT_STORE = ArtifactStore(os.environ.get('ARTIFACT_DIR') or DEFAULT_STORE_DIR)
+    return _DEFAULT_STORE
@@ -0,0 +1,128 @@
+# batch.py
+"""
+注文PDFをまとめて数出表・納品書に変換するCLI。
+
+    python -m api.batch in_dir out_dir --workers 4 [--report report.json]
+
+in_dir 直下の *.pdf を変換し、out_dir に「<PDF名>_数出表.xlsm」「<PDF名>_納品書.xlsx」を書き出す。
+マスタとテンプレートは各ワーカープロセスで一度だけ準備する。ファイルごとの処理時間と
+結果を表示し (--report のJSONには段階ごとの内訳も含める)、失敗したファイルがあれば終了コード 1 を返す。
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from .order_pipeline import (
+    ASSETS_DIR, OrderConversionError, OrderResources, convert_order_pdf, load_order_resources, output_filenames,
+)
+from .tracing import RunTrace
+
+_RESOURCES: Optional[OrderResources] = None
+
+
+def _init_worker(assets_dir: str):
+    global _RESOURCES
+    _RESOURCES = load_order_resources(assets_dir)
+
+
+def _write_bytes(path: str, data: bytes):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def convert_file(pdf_path: str, out_dir: str, page_workers: Optional[int] = None) -> Dict:
+    """PDF1件を変換して out_dir に書き出し、結果 (status / seconds / outputs / error) を返す"""
+    start = time.perf_counter()
+    result = {'file': os.path.basename(pdf_path), 'status': 'ok', 'seconds': None, 'outputs': [], 'error': None}
+    trace = RunTrace('batch', file=result['file'])
+    try:
+        with open(pdf_path, 'rb') as f:
+            pdf_data = f.read()
+        outputs = convert_order_pdf(pdf_data, _RESOURCES, page_workers=page_workers, trace=trace)
+        original_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        for name, data in zip(output_filenames(original_name), outputs):
+            _write_bytes(os.path.join(out_dir, name), data)
+            result['outputs'].append(name)
+    except OrderConversionError as e:
+        result['status'], result['error'] = 'failed', str(e)
+    except Exception as e:
+        result['status'], result['error'] = 'error', f'{type(e).__name__}: {e}'
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['stages'] = trace.records
+    return result
+
+
+def run_batch(in_dir: str, out_dir: str, workers: int = 1, assets_dir: str = ASSETS_DIR) -> List[Dict]:
+    """in_dir のPDFを変換し、入力順 (ファイル名順) の結果リストを返す"""
+    pdf_paths = sorted(p for p in glob.glob(os.path.join(in_dir, '*')) if p.lower().endswith('.pdf'))
+    os.makedirs(out_dir, exist_ok=True)
+    # 親プロセスで一度準備しておく (テンプレート欠損はここで検出し、fork したワーカーはキャッシュを引き継ぐ)
+    _init_worker(assets_dir)
+
+    if workers <= 1 or len(pdf_paths) <= 1:
+        results = []
+        for path in pdf_paths:
+            results.append(convert_file(path, out_dir))
+            _print_result(results[-1])
+        return results
+
+    # ワーカー内でさらにページ並列のプロセスプールを作らないよう、ページ処理は逐次にする
+    results: Dict[str, Dict] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(assets_dir,)) as executor:
+        futures = {executor.submit(convert_file, path, out_dir, 0): path for path in pdf_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file': os.path.basename(path), 'status': 'error', 'seconds': None,
+                          'outputs': [], 'error': f'{type(e).__name__}: {e}'}
+            results[path] = result
+            _print_result(result)
+    return [results[path] for path in pdf_paths]
+
+
+def _print_result(result: Dict):
+    seconds = f"{result['seconds']:.2f}s" if result['seconds'] is not None else '-'
+    line = f"{result['status']:<6} {seconds:>8}  {result['file']}"
+    if result['error']:
+        line += f"  ({result['error']})"
+    print(line, flush=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='注文PDFを一括で数出表・納品書に変換する')
+    parser.add_argument('in_dir', help='注文PDFのディレクトリ')
+    parser.add_argument('out_dir', help='出力先ディレクトリ')
+    parser.add_argument('--workers', type=int, default=1, help='並列に処理するプロセス数 (既定: 1)')
+    parser.add_argument('--assets', default=ASSETS_DIR, help='マスタ・テンプレートのディレクトリ')
+    parser.add_argument('--report', help='結果をJSONで書き出すパス')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        results = run_batch(args.in_dir, args.out_dir, args.workers, args.assets)
+    except OrderConversionError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    print(f'{ok}/{len(results)} files converted in {elapsed:.2f}s (workers={args.workers})')
+    if args.report:
+        report = {'in_dir': args.in_dir, 'out_dir': args.out_dir, 'workers': args.workers,
+                  'seconds': round(elapsed, 3), 'results': results}
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if ok == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
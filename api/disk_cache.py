@@ -0,0 +1,102 @@
+# disk_cache.py
+"""
+1件1ファイルのディスク上の置き場 (最終利用の古い順に削除する LRU)。
+
+変換結果の保存場所 (artifacts)・Geminiの解析結果キャッシュ (gemini_cache)・注文PDFの変換結果キャッシュ
+(order_cache) が共通で使う。ファイルの更新時刻を最終利用時刻とみなし、読み出しのたびに更新する。
+書き込みは一時ファイルに書いてから os.replace で置き換えるため、読み出し側が書きかけのファイルを見ることはない。
+"""
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+
+class DiskLRU:
+    """directory 直下の <key><suffix> のファイル群 (プロセス・スレッド間で共有可)"""
+
+    def __init__(self, directory: str, suffix: str = '', max_bytes: int = 0, max_age: Optional[float] = None):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # 最終利用からの保存期間 (秒)。None なら期限なし
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """key のファイルのパス (なければ・期限切れなら None)。最終利用時刻を更新する"""
+        path = self.path(key)
+        try:
+            if self._expired(os.path.getmtime(path), time.time()):
+                self._remove(path)
+                return None
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def write(self, key: str, writer: Callable[[str], None], keep: bool = False) -> str:
+        """
+        writer(一時ファイルのパス) で書いたファイルを key として置き、容量を超えた分を削除する。
+        keep=True なら書いたファイル自体は容量を超えていても残す。OSError はそのまま送出する。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict(keep=key if keep else None)
+        return path
+
+    def evict(self, keep: Optional[str] = None):
+        """期限切れのファイルを削除し、合計サイズを max_bytes 以下にする (keep の key は残す)"""
+        keep_name = None if keep is None else keep + self.suffix
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in self._names():
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self._expired(stat.st_mtime, now):
+                    self._remove(path)
+                elif name == keep_name:
+                    entries.append((float('inf'), stat.st_size, path))
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes or mtime == float('inf'):
+                    break
+                self._remove(path)
+                total -= size
+
+    def clear(self):
+        """すべてのファイルを削除する"""
+        for name in self._names():
+            self._remove(os.path.join(self.directory, name))
+
+    def _names(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [n for n in names if n.endswith(self.suffix) and not n.endswith('.tmp')]
+
+    def _expired(self, mtime: float, now: float) -> bool:
+        return self.max_age is not None and now - mtime > self.max_age
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
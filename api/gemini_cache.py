@@ -0,0 +1,73 @@
+# gemini_cache.py
+"""
+Geminiによるシール抽出結果のディスクキャッシュ。
+
+キーは SHA-256(PDFのバイト列) + モデル名 + プロンプトのハッシュで、同じPDFを同じモデル・
+プロンプトで解析し直す場合はモデルを呼ばずに保存済みの blocks を返す。
+1件1ファイルのJSONとして保存し、古いもの (最終利用からの経過時間) と
+合計サイズの上限を超えた分を最終利用の古い順に削除する。
+"""
+import hashlib
+import json
+import os
+import time
+from typing import List, Optional
+
+from .disk_cache import DiskLRU
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'assets', '.cache', 'gemini')
+DEFAULT_MAX_BYTES = int(float(os.environ.get('GEMINI_CACHE_MAX_MB', '64')) * 1024 * 1024)
+DEFAULT_MAX_AGE = float(os.environ.get('GEMINI_CACHE_MAX_AGE_DAYS', '30')) * 24 * 3600
+
+
+def response_cache_key(pdf_data: bytes, model_name: str, prompt: str, part: str = '') -> str:
+    """PDF・モデル名・プロンプトからキャッシュキーを作る (part はページ分割時のページ範囲)"""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(pdf_data).digest())
+    h.update(model_name.encode('utf-8') + b'\0')
+    h.update(hashlib.sha256(prompt.encode('utf-8')).digest())
+    if part:
+        h.update(b'\0' + part.encode('utf-8'))
+    return h.hexdigest()
+
+
+class GeminiResponseCache:
+    """抽出済み blocks を保存するディスクキャッシュ (プロセス・スレッド間で共有可)"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self._files = DiskLRU(cache_dir, '.json', max_bytes, max_age)
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        path = self._files.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)['blocks']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, blocks: List[dict], **meta):
+        def write(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(meta, blocks=blocks, created=time.time()), f, ensure_ascii=False)
+        try:
+            self._files.write(key, write)
+        except OSError:
+            pass
+
+    def clear(self):
+        self._files.clear()
+
+
+_DEFAULT_CACHE: Optional[GeminiResponseCache] = None
+
+
+def get_response_cache() -> GeminiResponseCache:
+    """既定の設定 (api/assets/.cache/gemini) のキャッシュ"""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = GeminiResponseCache(os.environ.get('GEMINI_CACHE_DIR', DEFAULT_CACHE_DIR))
+    return _DEFAULT_CACHE
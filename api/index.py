@@ -0,0 +1,207 @@
+# index.py
+"""
+変換サービス (HTTP)。
+
+    python -m api.index --port 8000
+
+    POST /convert/order   注文PDF → 数出表 (.xlsm) と 納品書 (.xlsx) のzip
+                          ?part=template / ?part=nouhinsyo でどちらか一方だけを返す
+    POST /convert/seal    シールPDF → シールデータ (.xlsx)
+                          ?method=local|gemini|pages  ?model=...  ?cache=0  ?format=json
+    GET  /health          ワーカー数・受付中のジョブ数
+
+PDFは multipart の file フィールド、またはリクエスト本文そのもので送る。
+変換はプロセスプール (CONVERT_WORKERS) で実行し、実行中と待ちの合計が
+CONVERT_WORKERS + CONVERT_MAX_QUEUE を超える場合は 503 を返す。タイムアウトしたジョブも
+プールで実行が終わるまでは受付枠を使ったままにする (待ちの上限を超えて積まれないように)。
+"""
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import quote
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from .jobs import SEAL_METHODS, ModelUnavailable, init_worker, run_order_job, run_seal_job
+from .order_pipeline import OrderConversionError, output_filenames
+
+CONVERT_WORKERS = int(os.environ.get('CONVERT_WORKERS', '2'))
+CONVERT_MAX_QUEUE = int(os.environ.get('CONVERT_MAX_QUEUE', '8'))
+CONVERT_TIMEOUT = float(os.environ.get('CONVERT_TIMEOUT', '600'))
+
+XLSM_MIME = 'application/vnd.ms-excel.sheet.macroEnabled.12'
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+app = Flask(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(CONVERT_WORKERS + CONVERT_MAX_QUEUE)
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # スレッドで動くサーバーからforkしないよう spawn で起動する
+            _executor = ProcessPoolExecutor(
+                max_workers=CONVERT_WORKERS, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _release(_future=None):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+    _slots.release()
+
+
+def _run(job, *args, **kwargs):
+    """
+    ジョブをプールで実行する。受付枠がなければ None を返す。
+    受付枠はジョブの実行が終わったときに返す (タイムアウトで待つのをやめても、実行中は枠を使ったまま)。
+    """
+    global _pending
+    if not _slots.acquire(blocking=False):
+        return None
+    with _pending_lock:
+        _pending += 1
+    try:
+        future = _get_executor().submit(job, *args, **kwargs)
+    except BaseException:
+        _release()
+        raise
+    future.add_done_callback(_release)
+    try:
+        return future.result(timeout=CONVERT_TIMEOUT)
+    except BrokenProcessPool:
+        _reset_executor()
+        raise
+
+
+def _busy():
+    response = jsonify(error='混み合っています。しばらくしてから再度お試しください。')
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+def _error(message: str, status: int):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+
+def _read_pdf():
+    """multipart の file、なければ本文をPDFとして読む。戻り値: (bytes, ファイル名)"""
+    if request.mimetype == 'multipart/form-data':
+        uploaded = request.files.get('file')
+        if uploaded is None:
+            return b'', ''
+        return uploaded.read(), uploaded.filename or 'upload.pdf'
+    # 本文をフォームとして解釈させない
+    return request.get_data(parse_form_data=False), request.args.get('filename', 'upload.pdf')
+
+
+def _attachment(data: bytes, mimetype: str, filename: str) -> Response:
+    response = Response(data, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
+
+
+@app.errorhandler(Exception)
+def handle_exception(e):
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, TimeoutError):
+        return _error('変換がタイムアウトしました。', 504)
+    if isinstance(e, ModelUnavailable):
+        return _error(str(e), 503)
+    app.logger.exception('conversion failed')
+    return _error(f'エラーが発生しました: {e}', 500)
+
+
+@app.get('/health')
+def health():
+    return jsonify(workers=CONVERT_WORKERS, max_queue=CONVERT_MAX_QUEUE, pending=_pending)
+
+
+@app.post('/convert/order')
+def convert_order():
+    pdf_data, filename = _read_pdf()
+    if not pdf_data:
+        return _error('PDFが送られていません。', 400)
+    try:
+        result = _run(run_order_job, pdf_data, filename)
+    except OrderConversionError as e:
+        return _error(str(e), 422)
+    if result is None:
+        return _busy()
+
+    template_name, nouhinsyo_name = output_filenames(os.path.splitext(filename)[0])
+    part = request.args.get('part')
+    if part == 'template':
+        return _attachment(result['template'], XLSM_MIME, template_name)
+    if part == 'nouhinsyo':
+        return _attachment(result['nouhinsyo'], XLSX_MIME, nouhinsyo_name)
+
+    out = io.BytesIO()
+    # xlsx/xlsm は圧縮済みなので無圧縮で詰める
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr(template_name, result['template'])
+        zf.writestr(nouhinsyo_name, result['nouhinsyo'])
+        zf.writestr('stages.json', json.dumps(result['stages'], ensure_ascii=False))
+    return _attachment(out.getvalue(), 'application/zip', f"{os.path.splitext(filename)[0]}.zip")
+
+
+@app.post('/convert/seal')
+def convert_seal():
+    pdf_data, filename = _read_pdf()
+    if not pdf_data:
+        return _error('PDFが送られていません。', 400)
+    method = request.args.get('method', 'local')
+    if method not in SEAL_METHODS:
+        return _error(f"method は {', '.join(SEAL_METHODS)} のいずれかです。", 400)
+    result = _run(run_seal_job, pdf_data, method, request.args.get('model', 'gemini-2.5-flash'),
+                  request.args.get('cache', '1') != '0', filename)
+    if result is None:
+        return _busy()
+
+    seal_filename = os.path.splitext(filename)[0] + '_seal.xlsx'
+    if request.args.get('format') == 'json':
+        result['xlsx'] = base64.b64encode(result['xlsx']).decode('ascii')
+        result['filename'] = seal_filename
+        return jsonify(result)
+    return _attachment(result['xlsx'], XLSX_MIME, seal_filename)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='注文PDF・シールPDFの変換サービス')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+    _get_executor()
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# jobs.py
+"""
+変換サービス (api/index.py) のワーカープロセスで実行するジョブ。
+
+ワーカーは起動時に init_worker でマスタ・テンプレートを準備する (Gemini の設定は初回のシールジョブで1回だけ)。
+注文ジョブのたびにマスタ・テンプレートのファイルの版 (パス・更新時刻・サイズ) を確かめ、
+マスタのアップロードなどで変わっていれば準備し直す (変わっていなければ stat だけで済む)。
+ジョブの引数と戻り値はプロセス間で受け渡すため、bytes・dict などpickleできる値だけを使う。
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+from .masters import find_master_file
+from .order_cache import get_order_cache
+from .order_pipeline import ASSETS_DIR, NOUHINSYO_NAME, TEMPLATE_NAME, OrderResources, load_order_resources
+from .tracing import RunTrace
+
+SEAL_METHODS = ('local', 'gemini', 'pages')
+
+_ASSETS_DIR = ASSETS_DIR
+_RESOURCES: Optional[OrderResources] = None
+_RESOURCES_ERROR: Optional[Exception] = None
+_RESOURCES_KEY: Optional[Tuple] = None
+
+
+class ModelUnavailable(RuntimeError):
+    """Gemini を使うシール変換で GOOGLE_API_KEY が設定されていない"""
+
+
+def resources_key(assets_dir: str) -> Tuple:
+    """マスタ・テンプレートのファイルの版 (パス, 更新時刻, サイズ)。見つからないものは None"""
+    paths = [find_master_file(assets_dir, '商品マスタ'), find_master_file(assets_dir, '得意先マスタ'),
+             os.path.join(assets_dir, TEMPLATE_NAME), os.path.join(assets_dir, NOUHINSYO_NAME)]
+    key = []
+    for path in paths:
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        key.append((path, stat.st_mtime_ns, stat.st_size) if stat else None)
+    return tuple(key)
+
+
+def _load_resources():
+    global _RESOURCES, _RESOURCES_ERROR, _RESOURCES_KEY
+    _RESOURCES_KEY = resources_key(_ASSETS_DIR)
+    try:
+        _RESOURCES, _RESOURCES_ERROR = load_order_resources(_ASSETS_DIR), None
+    except Exception as e:
+        _RESOURCES, _RESOURCES_ERROR = None, e
+
+
+def init_worker(assets_dir: str = ASSETS_DIR):
+    """ワーカープロセスの初期化 (失敗しても起動は続け、注文ジョブの実行時にエラーを返す)"""
+    global _ASSETS_DIR
+    _ASSETS_DIR = assets_dir
+    _load_resources()
+
+
+def current_resources() -> OrderResources:
+    """現在のマスタ・テンプレートで準備したもの (ファイルが変わっていれば準備し直す)"""
+    if _RESOURCES_KEY is None or resources_key(_ASSETS_DIR) != _RESOURCES_KEY:
+        _load_resources()
+    if _RESOURCES is None:
+        raise _RESOURCES_ERROR
+    return _RESOURCES
+
+
+def run_order_job(pdf_data: bytes, filename: str = '') -> Dict:
+    """注文PDFを変換する。戻り値: template / nouhinsyo (bytes) と stages"""
+    resources = current_resources()
+    trace = RunTrace('service.order', file=filename)
+    # ワーカー内ではページ並列のプロセスプールを作らない
+    outputs, cached = get_order_cache().get_or_convert(pdf_data, resources, page_workers=0, trace=trace)
+    trace.log(cached=cached)
+    return {'template': outputs.template_bytes, 'nouhinsyo': outputs.nouhinsyo_bytes, 'stages': trace.records}
+
+
+def run_seal_job(pdf_data: bytes, method: str = 'local', model_name: str = 'gemini-2.5-flash',
+                 use_cache: bool = True, filename: str = '') -> Dict:
+    """シールPDFを変換する。戻り値: blocks / xlsx (bytes) / low_confidence / cached / recovered / stages"""
+    from .seal import (
+        build_seal_workbook, extract_seal_blocks, extract_seal_blocks_by_page, extract_seal_blocks_local,
+        get_gemini_model,
+    )
+
+    if method not in SEAL_METHODS:
+        raise ValueError(f"unknown seal method: {method}")
+    trace = RunTrace('service.seal', file=filename, model=model_name)
+    model = get_gemini_model(model_name)
+    with trace.span('extract', method=method):
+        if method == 'local':
+            extraction = extract_seal_blocks_local(pdf_data, model, model_name, use_cache=use_cache)
+        elif model is None:
+            raise ModelUnavailable("GOOGLE_API_KEY が設定されていないため、Gemini を使う変換はできません。")
+        elif method == 'pages':
+            extraction = extract_seal_blocks_by_page(pdf_data, model, model_name, use_cache=use_cache)
+        else:
+            extraction = extract_seal_blocks(pdf_data, model, model_name, use_cache=use_cache)
+    with trace.span('workbook', blocks=len(extraction.blocks)):
+        xlsx = build_seal_workbook(extraction.blocks, os.path.join(ASSETS_DIR, 'seal.xlsx'))
+    trace.log()
+    return {
+        'blocks': extraction.blocks, 'xlsx': xlsx, 'low_confidence': extraction.low_confidence,
+        'cached': extraction.cached, 'recovered': extraction.recovered, 'stages': trace.records,
+    }
@@ -0,0 +1,113 @@
+# master_join.py
+"""
+数出表・納品書に貼り付けるマスタを、注文に関係する行だけに絞る (MASTER_PASTE=joined のとき)。
+
+テンプレートの数式はマスタのシートを VLOOKUP / MATCH で引くだけなので、注文ごとに
+引かれうる行を元の順番のまま残せば、数式の結果は全件を貼り付けた場合と変わらない。
+    得意先マスタ: 得意先ＣＤ・得意先名・得意先名略称・得意先名カナが、PDFのクライアント
+                  (client_id / client_name) か貼り付け用シートの左端の列と一致する行
+    商品マスタ: 商品予定名が、弁当名・貼り付け用シートの文字列・テンプレートの数式にある
+                "*…*" のいずれかを含むか、商品名がそれらと一致する行
+ワイルドカードの検索 ("*"&名前&"*") は最初に一致した行を返すため、一致する行はすべて残す。
+数式は名前を SUBSTITUTE で加工してから検索する (半角・全角スペースを除く形と、半角スペースを全角に置き換える形がある)。
+どちらの形でも一致を取りこぼさないよう、照合は検索する側・マスタ側とも空白をすべて除き、全角・半角と
+大文字・小文字も区別せずに行う (残す行は Excel が一致とみなす行を必ず含む)。
+"""
+import re
+import threading
+import unicodedata
+import zipfile
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+import pandas as pd
+
+from .masters import file_sha256
+
+# 数式中の "*キャラ*" のような固定のワイルドカード検索
+_PATTERN_RE = re.compile(r'(?:"|&quot;)\*([^"*&<]+)\*(?:"|&quot;)')
+_DIGITS_RE = re.compile(r'^\d+$')
+_SPACE_RE = re.compile(r'\s+')
+
+CUSTOMER_KEY_COLUMNS = ['得意先ＣＤ', '得意先名', '得意先名略称', '得意先名カナ']
+
+_PATTERN_CACHE: Dict[str, FrozenSet[str]] = {}
+_PATTERN_LOCK = threading.Lock()
+
+
+def _norm(value) -> str:
+    """照合用の正規化 (NFKC + 空白をすべて除去 + 大文字小文字の区別なし)。Excel の検索より広めに一致させる"""
+    return _SPACE_RE.sub('', unicodedata.normalize('NFKC', str(value))).casefold()
+
+
+def master_header(df: pd.DataFrame) -> pd.DataFrame:
+    """テンプレートのマスタのシートをヘッダーだけにするための空のマスタ"""
+    header = df.iloc[:0].copy()
+    # 全件のマスタとはスナップショットのキャッシュキーを分ける
+    header.attrs = {'master_version': ('header',) + tuple(df.columns)}
+    return header
+
+
+def template_patterns(path: str) -> FrozenSet[str]:
+    """テンプレートの数式にある固定のワイルドカード検索の文字列 (テンプレートのハッシュごとにキャッシュ)"""
+    key = file_sha256(path)
+    with _PATTERN_LOCK:
+        cached = _PATTERN_CACHE.get(key)
+    if cached is not None:
+        return cached
+    patterns: Set[str] = set()
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            if name.startswith('xl/worksheets/') and name.endswith('.xml'):
+                xml = zf.read(name).decode('utf-8', errors='ignore')
+                patterns.update(_PATTERN_RE.findall(xml))
+    result = frozenset(patterns)
+    with _PATTERN_LOCK:
+        _PATTERN_CACHE[key] = result
+    return result
+
+
+def _sheet_strings(df: Optional[pd.DataFrame], columns: Optional[List] = None) -> Set[str]:
+    if df is None or df.empty:
+        return set()
+    values = df if columns is None else df[columns]
+    return {str(v).strip() for v in values.to_numpy().ravel() if str(v).strip()}
+
+
+def join_customer_master(df_customer_master: pd.DataFrame, client_data: Iterable[dict],
+                         df_paste_sheet: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """注文のクライアントに対応する得意先マスタの行 (元の順番のまま)"""
+    keys = _sheet_strings(df_paste_sheet, [df_paste_sheet.columns[0]]) if df_paste_sheet is not None else set()
+    for info in client_data:
+        keys.update(str(info.get(k, '')).strip() for k in ('client_id', 'client_name'))
+    keys = {_norm(k) for k in keys if k}
+    columns = [c for c in CUSTOMER_KEY_COLUMNS if c in df_customer_master.columns]
+    if not keys or not columns:
+        return df_customer_master
+    mask = pd.Series(False, index=df_customer_master.index)
+    for column in columns:
+        mask |= df_customer_master[column].map(_norm).isin(keys)
+    return df_customer_master[mask]
+
+
+def join_product_master(df_product_master: pd.DataFrame, names: Iterable[str],
+                        patterns: Iterable[str] = ()) -> pd.DataFrame:
+    """弁当名・数式の検索文字列に一致しうる商品マスタの行 (元の順番のまま)"""
+    if '商品予定名' not in df_product_master.columns:
+        return df_product_master
+    keys = {_norm(n) for n in names if str(n).strip() and not _DIGITS_RE.match(str(n).strip())}
+    keys.update(_norm(p) for p in patterns)
+    keys.discard('')
+    planned = df_product_master['商品予定名'].map(_norm)
+    mask = planned.map(lambda name: any(key in name for key in keys))
+    if '商品名' in df_product_master.columns:
+        mask |= df_product_master['商品名'].map(_norm).isin(keys)
+    return df_product_master[mask]
+
+
+def order_product_names(df_bento_sheet: Optional[pd.DataFrame], df_paste_sheet: Optional[pd.DataFrame]) -> Set[str]:
+    """商品マスタを引く可能性のある注文中の文字列 (弁当名・貼り付け用シートの値)"""
+    names = _sheet_strings(df_paste_sheet)
+    if df_bento_sheet is not None and '商品予定名' in df_bento_sheet.columns:
+        names |= _sheet_strings(df_bento_sheet, ['商品予定名'])
+    # 数式の SUBSTITUTE がスペースを除いても全角に置き換えても、_norm が両側の空白を除くので一致は保たれる
+    return names
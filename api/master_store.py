@@ -0,0 +1,241 @@
+# master_store.py
+"""
+商品マスタ・得意先マスタの版の保管庫と、照合用の派生データ (MasterIndex)。
+
+save_master_version はアップロードされたCSVを api/assets 直下の現在のマスタとして置き換え、
+同じ内容を版として api/assets/masters/<種類>/<版>.csv に残す (版はCSVの SHA-256 の先頭16桁)。
+同時に派生データを作って <版>.index.pkl に保存する。
+    商品マスタ: 商品予定名 → 正規化後の名前、ProductMatcher、商品予定名 → 商品名、商品ＣＤ → 行番号
+    得意先マスタ: 得意先ＣＤ → 行番号
+直前の版から引き継ぐのは正規化済みの商品予定名と、照合に使う列がまったく同じ場合の ProductMatcher だけで、
+照合に使う列が1行でも変われば ProductMatcher は全件から作り直す (changed_rows は変わった行数の記録のみ)。
+変換時は get_master_index が読み込んだマスタに対応する版の派生データを返す。保管庫になければ
+メモリ上で作るだけで、保管庫 (マニフェスト) へ書き込むのはアップロード時の save_master_version だけ。
+版の一覧を見るだけなら pandas を読み込まないよう、pandas と照合処理は使う関数の中で import する。
+"""
+import glob
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from .masters import file_sha256, invalidate_master_cache, read_master_file
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .product_matcher import ProductMatcher
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR_NAME = 'masters'
+MANIFEST_NAME = 'manifest.json'
+CODE_COLUMNS = {'商品マスタ': '商品ＣＤ', '得意先マスタ': '得意先ＣＤ'}
+# 種類ごとに残す版の数 (古いものからCSVと派生データを削除する)
+MASTER_HISTORY = int(os.environ.get('MASTER_HISTORY', '10'))
+
+_INDEX_CACHE: 'OrderedDict[tuple, MasterIndex]' = OrderedDict()
+_INDEX_CACHE_SIZE = 8
+_STORE_LOCK = threading.Lock()
+_MANIFEST_LOCK = threading.Lock()
+
+
+class MasterIndex:
+    """マスタ1版の派生データ"""
+
+    def __init__(self, kind: str, version: str, df: 'pd.DataFrame', previous: Optional['MasterIndex'] = None):
+        import pandas as pd
+        from .product_matcher import MATCH_COLUMNS, ProductMatcher, master_fingerprint, normalize_product_name
+
+        self.kind = kind
+        self.version = version
+        self.rows = len(df)
+        self.columns = list(df.columns)
+        self.row_hashes: Set[int] = set(pd.util.hash_pandas_object(df, index=False).tolist())
+        self.changed_rows = len(self.row_hashes - previous.row_hashes) if previous is not None else self.rows
+        self.normalized: Dict[str, str] = {}
+        self.name_map: Optional[Dict[str, str]] = None
+        self.fingerprint: Optional[str] = None
+        self.matcher: Optional['ProductMatcher'] = None
+
+        code_column = CODE_COLUMNS.get(kind)
+        self.codes: Dict[str, int] = {}
+        if code_column in df.columns:
+            for i, code in enumerate(df[code_column].astype(str)):
+                self.codes.setdefault(code.strip(), i)
+
+        if kind != '商品マスタ' or '商品予定名' not in df.columns:
+            return
+        reuse = previous.normalized if previous is not None else {}
+        names = df['商品予定名'].astype(str)
+        for name in names.unique():
+            self.normalized[name] = reuse[name] if name in reuse else normalize_product_name(name)
+        if '商品名' in df.columns:
+            # drop_duplicates(subset=['商品予定名']) と同じく、最初の行の商品名を使う
+            self.name_map = {}
+            for name, product in zip(df['商品予定名'], df['商品名']):
+                self.name_map.setdefault(name, product)
+        if all(col in df.columns for col in MATCH_COLUMNS):
+            self.fingerprint = master_fingerprint(df)
+            if previous is not None and previous.fingerprint == self.fingerprint:
+                self.matcher = previous.matcher
+            else:
+                self.matcher = ProductMatcher.from_master_df(df, self.normalized)
+
+    def matches(self, df: 'pd.DataFrame') -> bool:
+        """df がこの版から読み込んだものか (行数と列で確かめる)"""
+        return self.rows == len(df) and self.columns == list(df.columns)
+
+
+def _store_dir(base_path: str, kind: str) -> str:
+    return os.path.join(base_path, STORE_DIR_NAME, kind)
+
+
+def _index_path(base_path: str, kind: str, version: str) -> str:
+    return os.path.join(_store_dir(base_path, kind), f'{version}.index.pkl')
+
+
+def _read_manifest(base_path: str) -> Dict[str, List[dict]]:
+    try:
+        with open(os.path.join(base_path, STORE_DIR_NAME, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(base_path: str, manifest: Dict[str, List[dict]]):
+    path = os.path.join(base_path, STORE_DIR_NAME, MANIFEST_NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _load_index(base_path: str, kind: str, version: str) -> Optional[MasterIndex]:
+    try:
+        with open(_index_path(base_path, kind, version), 'rb') as f:
+            index = pickle.load(f)
+    except Exception:
+        return None
+    return index if isinstance(index, MasterIndex) else None
+
+
+def _remember(index: MasterIndex, base_path: str):
+    key = (os.path.abspath(base_path), index.kind, index.version)
+    with _STORE_LOCK:
+        _INDEX_CACHE[key] = index
+        _INDEX_CACHE.move_to_end(key)
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+
+
+def _cached(base_path: str, kind: str, version: str) -> Optional[MasterIndex]:
+    key = (os.path.abspath(base_path), kind, version)
+    with _STORE_LOCK:
+        index = _INDEX_CACHE.get(key)
+        if index is not None:
+            _INDEX_CACHE.move_to_end(key)
+        return index
+
+
+def _register_version(base_path: str, kind: str, source_path: str, df: 'pd.DataFrame') -> dict:
+    """source_path のCSVを版として保存し、派生データを作る。戻り値: マニフェストの項目"""
+    with _MANIFEST_LOCK:
+        return _register_version_locked(base_path, kind, source_path, df)
+
+
+def _register_version_locked(base_path: str, kind: str, source_path: str, df: 'pd.DataFrame') -> dict:
+    version = file_sha256(source_path)[:16]
+    store_dir = _store_dir(base_path, kind)
+    os.makedirs(store_dir, exist_ok=True)
+
+    manifest = _read_manifest(base_path)
+    entries = [e for e in manifest.get(kind, []) if e['version'] != version]
+    previous = None
+    for entry in reversed(entries):
+        previous = _cached(base_path, kind, entry['version']) or _load_index(base_path, kind, entry['version'])
+        if previous is not None:
+            break
+
+    with open(source_path, 'rb') as f:
+        raw = f.read()
+    csv_path = os.path.join(store_dir, f'{version}.csv')
+    if not os.path.exists(csv_path):
+        with open(csv_path, 'wb') as f:
+            f.write(raw)
+
+    entry = {'version': version, 'filename': os.path.basename(source_path),
+             'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'rows': len(df), 'changed_rows': None}
+    if not df.empty:
+        index = MasterIndex(kind, version, df, previous)
+        entry['changed_rows'] = index.changed_rows
+        tmp_path = f'{_index_path(base_path, kind, version)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _index_path(base_path, kind, version))
+        _remember(index, base_path)
+
+    entries.append(entry)
+    for old in entries[:-MASTER_HISTORY] if MASTER_HISTORY > 0 else []:
+        for name in (f"{old['version']}.csv", f"{old['version']}.index.pkl"):
+            try:
+                os.remove(os.path.join(store_dir, name))
+            except OSError:
+                pass
+    manifest[kind] = entries[-MASTER_HISTORY:] if MASTER_HISTORY > 0 else entries
+    _write_manifest(base_path, manifest)
+    return entry
+
+
+def save_master_version(base_path: str, kind: str, filename: str, data: bytes) -> dict:
+    """
+    アップロードされたマスタCSVを現在のマスタとして置き換え (同じ種類の古いCSVは削除)、
+    版として保存して派生データを作る。戻り値: マニフェストの項目 (version, filename, rows, changed_rows など)
+    """
+    for old in glob.glob(os.path.join(base_path, f'*{kind}*.csv')):
+        os.remove(old)
+    save_path = os.path.join(base_path, filename)
+    with open(save_path, 'wb') as f:
+        f.write(data)
+    invalidate_master_cache(base_path)
+
+    df = read_master_file(save_path)
+    try:
+        return _register_version(base_path, kind, save_path, df)
+    except Exception:
+        # 派生データは変換時にも作れるため、保存自体は成功とする
+        logger.warning("failed to register master version for %s", save_path, exc_info=True)
+        return {'version': None, 'filename': filename, 'rows': len(df), 'changed_rows': None}
+
+
+def get_master_index(df: 'pd.DataFrame', kind: str) -> Optional[MasterIndex]:
+    """
+    read_master_file で読み込んだマスタに対応する版の派生データ。
+    保管庫になければメモリ上で作る (保存はしない)。ファイルから読み込んだものでなければ None。
+    """
+    path = df.attrs.get('master_path')
+    if df.empty or not path or not os.path.exists(path):
+        return None
+    base_path = os.path.dirname(path)
+    try:
+        version = file_sha256(path)[:16]
+        index = _cached(base_path, kind, version)
+        if index is None:
+            index = _load_index(base_path, kind, version)
+            if index is None:
+                # 手で置いたマスタなど。変換 (読み取り) から保管庫には書き込まない
+                index = MasterIndex(kind, version, df)
+            _remember(index, base_path)
+    except Exception:
+        logger.warning("failed to load master index for %s", path, exc_info=True)
+        return None
+    return index if index is not None and index.matches(df) else None
+
+
+def list_master_versions(base_path: str, kind: str) -> List[dict]:
+    """保存されている版 (新しい順)"""
+    return list(reversed(_read_manifest(base_path).get(kind, [])))
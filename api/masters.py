@@ -0,0 +1,175 @@
+# masters.py
+"""
+商品マスタ・得意先マスタCSVの読み込みとキャッシュ。
+
+マスタは (パス, 更新時刻, サイズ) をキーにプロセス内でキャッシュし、
+文字コードは先頭バイトの判定で一度だけ決める。読み込んだDataFrameは
+api/assets/.cache にpickleとして保存し、再起動直後のプロセスでもCSVの解析を省く。
+ファイル名の確認だけなら pandas を読み込まないよう、pandas は使う関数の中で import する。
+"""
+import codecs
+import glob
+import hashlib
+import io
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+CACHE_DIR_NAME = '.cache'
+FALLBACK_ENCODINGS = ['utf-8-sig', 'utf-8', 'cp932', 'shift_jis']
+
+_MASTER_CACHE: Dict[str, Tuple[Tuple[int, int], 'pd.DataFrame']] = {}
+_MASTER_LOCK = threading.Lock()
+_FILE_HASHES: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+def sniff_encoding(raw: bytes) -> str:
+    """BOMと試しデコードで文字コードを判定する (utf-8-sig → utf-8 → cp932 → shift_jis)"""
+    if raw.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    for encoding in ('utf-8', 'cp932'):
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'shift_jis'
+
+
+def find_master_file(base_path: str, file_pattern: str) -> Optional[str]:
+    """file_pattern を含む最新のCSVのパスを返す"""
+    search_path = os.path.join(base_path, f'*{file_pattern}*.csv')
+    list_of_files = glob.glob(search_path)
+    if not list_of_files:
+        return None
+    return max(list_of_files, key=os.path.getmtime)
+
+
+def _file_version(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_sha256(path: str) -> str:
+    """ファイル内容のSHA-256 (更新時刻とサイズが変わらない限り再計算しない)"""
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _FILE_HASHES.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _FILE_HASHES[path] = (version, digest)
+    return digest
+
+
+def _sidecar_path(path: str, version: Tuple[int, int]) -> str:
+    cache_dir = os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+    name = os.path.basename(path)
+    return os.path.join(cache_dir, f'{name}.{version[0]}.{version[1]}.pkl')
+
+
+def _parse_csv(raw: bytes) -> 'pd.DataFrame':
+    import pandas as pd
+    encodings = [sniff_encoding(raw)] + FALLBACK_ENCODINGS
+    for encoding in encodings:
+        try:
+            df = pd.read_csv(io.BytesIO(raw), encoding=encoding, dtype=str).fillna('')
+            if not df.empty:
+                df.columns = df.columns.str.strip()
+                return df
+        except Exception:
+            continue
+    return pd.DataFrame()
+
+
+def _read_sidecar(sidecar: str) -> Optional['pd.DataFrame']:
+    import pandas as pd
+    try:
+        return pd.read_pickle(sidecar)
+    except Exception:
+        return None
+
+
+def _write_sidecar(sidecar: str, df: 'pd.DataFrame'):
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        tmp_path = f'{sidecar}.{os.getpid()}.tmp'
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, sidecar)
+    except Exception:
+        pass
+
+
+def read_master_file(path: str) -> 'pd.DataFrame':
+    """
+    マスタCSVを読み込む。同じ版ならプロセス内キャッシュ、なければpickleのサイドカー、
+    どちらもなければCSVを解析する。返すDataFrameはキャッシュと共有されるため変更しないこと。
+    """
+    key = os.path.abspath(path)
+    version = _file_version(path)
+    with _MASTER_LOCK:
+        cached = _MASTER_CACHE.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    sidecar = _sidecar_path(key, version)
+    df = _read_sidecar(sidecar) if os.path.exists(sidecar) else None
+    if df is None:
+        with open(path, 'rb') as f:
+            df = _parse_csv(f.read())
+        if not df.empty:
+            _write_sidecar(sidecar, df)
+    if not df.empty:
+        df.attrs['master_version'] = (os.path.basename(path),) + version
+        df.attrs['master_path'] = key
+        with _MASTER_LOCK:
+            _MASTER_CACHE[key] = (version, df)
+    return df
+
+
+def master_version(df: 'pd.DataFrame'):
+    """
+    マスタDataFrameの版を表すハッシュ可能な値。
+    read_master_file で読み込んだものは (ファイル名, 更新時刻, サイズ)、それ以外は内容のハッシュ。
+    """
+    version = df.attrs.get('master_version')
+    if version is not None:
+        return version
+    if df.empty:
+        return ()
+    import pandas as pd
+    hashed = pd.util.hash_pandas_object(df, index=False)
+    return (hashlib.sha1(hashed.values.tobytes()).hexdigest(),)
+
+
+def load_master_csv(base_path, file_pattern):
+    """Load master CSV from assets directory."""
+    import pandas as pd
+    latest_file = find_master_file(base_path, file_pattern)
+    if latest_file is None:
+        return pd.DataFrame(), None
+    df = read_master_file(latest_file)
+    if df.empty:
+        return pd.DataFrame(), None
+    return df, os.path.basename(latest_file)
+
+
+def invalidate_master_cache(base_path: str):
+    """base_path 配下のマスタのキャッシュを破棄し、現在のCSVに対応しない古いサイドカーを削除する"""
+    base = os.path.abspath(base_path)
+    with _MASTER_LOCK:
+        for key in [k for k in _MASTER_CACHE if os.path.dirname(k) == base]:
+            del _MASTER_CACHE[key]
+    cache_dir = os.path.join(base, CACHE_DIR_NAME)
+    for sidecar in glob.glob(os.path.join(cache_dir, '*.pkl')):
+        source = os.path.join(base, os.path.basename(sidecar).rsplit('.', 3)[0])
+        if os.path.exists(source) and _sidecar_path(source, _file_version(source)) == sidecar:
+            continue
+        try:
+            os.remove(sidecar)
+        except OSError:
+            pass
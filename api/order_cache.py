@@ -0,0 +1,120 @@
+# order_cache.py
+"""
+注文PDF変換 (convert_order_pdf) の結果キャッシュ。
+
+キーは SHA-256(PDFのバイト列) + 商品マスタ・得意先マスタの版 + 両テンプレートのハッシュ + マスタの貼り付け方
++ 変換処理の版 (PIPELINE_VERSION)・出力方式 (XLSX_WRITER)・zipの圧縮レベル (XLSX_COMPRESSLEVEL) で、
+同じPDFを同じマスタ・テンプレートで変換し直す場合は保存済みの数出表・納品書をそのまま返す。
+1件1ファイル (2つの出力を無圧縮で詰めたzip) として保存し、合計サイズが ORDER_CACHE_MAX_MB を
+超えた分を最終利用の古い順に削除する。マスタを差し替えたときは clear() で全件破棄する。
+同じキーの変換が同時に来た場合は1回だけ変換し、他はその結果を待つ。この待ち合わせはプロセス内だけで、
+変換サービスのワーカープロセス同士は変換中のロックを共有しない (別のプロセスに同じPDFが届けばそれぞれ変換し、
+結果のファイルは後から保存したもので置き換わる)。
+"""
+import hashlib
+import os
+import threading
+import zipfile
+from typing import Dict, Optional, Tuple
+
+from .disk_cache import DiskLRU
+from .masters import master_version
+from .order_pipeline import ASSETS_DIR, PIPELINE_VERSION, OrderOutputs, OrderResources, convert_order_pdf
+from .sheet_writer import COMPRESSLEVEL
+from .tracing import RunTrace
+from .workbooks import XLSX_WRITER, file_sha256
+
+DEFAULT_CACHE_DIR = os.path.join(ASSETS_DIR, '.cache', 'orders')
+DEFAULT_MAX_BYTES = int(float(os.environ.get('ORDER_CACHE_MAX_MB', '256')) * 1024 * 1024)
+
+_TEMPLATE_MEMBER = 'template'
+_NOUHINSYO_MEMBER = 'nouhinsyo'
+
+
+def order_cache_key(pdf_data: bytes, resources: OrderResources) -> str:
+    """PDF・マスタの版・テンプレート・変換処理と出力の設定からキャッシュキーを作る"""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(pdf_data).digest())
+    for df in (resources.product_master, resources.customer_master):
+        h.update(repr(master_version(df)).encode('utf-8') + b'\0')
+    for prepared in (resources.template, resources.nouhinsyo):
+        h.update(file_sha256(prepared.path).encode('ascii'))
+    h.update(resources.master_paste.encode('ascii'))
+    h.update(f'\0{PIPELINE_VERSION}\0{XLSX_WRITER}\0{COMPRESSLEVEL}'.encode('utf-8'))
+    return h.hexdigest()
+
+
+class OrderResultCache:
+    """変換結果を保存するディスクキャッシュ (単一実行はプロセス内のみ)"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self._files = DiskLRU(cache_dir, '.zip', max_bytes)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._files.max_bytes > 0
+
+    def get(self, key: str) -> Optional[OrderOutputs]:
+        path = self._files.lookup(key)
+        if path is None:
+            return None
+        try:
+            with zipfile.ZipFile(path) as zf:
+                return OrderOutputs(zf.read(_TEMPLATE_MEMBER), zf.read(_NOUHINSYO_MEMBER))
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def put(self, key: str, outputs: OrderOutputs):
+        def write(tmp_path):
+            # xlsx/xlsm は圧縮済みなので無圧縮で詰める
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+                zf.writestr(_TEMPLATE_MEMBER, outputs.template_bytes)
+                zf.writestr(_NOUHINSYO_MEMBER, outputs.nouhinsyo_bytes)
+        try:
+            self._files.write(key, write)
+        except OSError:
+            pass
+
+    def get_or_convert(self, pdf_data: bytes, resources: OrderResources, page_workers: Optional[int] = None,
+                       trace: RunTrace = None) -> Tuple[OrderOutputs, bool]:
+        """キャッシュにあればそれを、なければ変換して保存した結果を返す。戻り値: (出力, キャッシュ利用の有無)"""
+        if not self.enabled:
+            return convert_order_pdf(pdf_data, resources, page_workers, trace), False
+        trace = trace or RunTrace.disabled()
+        with trace.span('cache_lookup'):
+            key = order_cache_key(pdf_data, resources)
+            outputs = self.get(key)
+        if outputs is not None:
+            return outputs, True
+
+        with self._lock:
+            inflight = self._inflight.setdefault(key, threading.Lock())
+        with inflight:
+            # 同じキーを先に変換していたリクエストがあれば、その結果を使う
+            outputs = self.get(key)
+            if outputs is not None:
+                return outputs, True
+            try:
+                outputs = convert_order_pdf(pdf_data, resources, page_workers, trace)
+                self.put(key, outputs)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return outputs, False
+
+    def clear(self):
+        self._files.clear()
+
+
+_DEFAULT_CACHE: Optional[OrderResultCache] = None
+
+
+def get_order_cache() -> OrderResultCache:
+    """既定の設定 (api/assets/.cache/orders) のキャッシュ"""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = OrderResultCache(os.environ.get('ORDER_CACHE_DIR') or DEFAULT_CACHE_DIR)
+    return _DEFAULT_CACHE
@@ -0,0 +1,201 @@
+# order_pipeline.py
+"""
+注文PDF → 数出表 (template.xlsm)・納品書 (nouhinsyo.xlsx) の変換処理。
+
+Streamlitの「数出表・納品書作成」タブとバッチCLI (api.batch) の共通処理。
+マスタとテンプレートのスナップショットはプロセス内でキャッシュされるため、
+同じプロセスで続けて変換する場合は2件目以降の準備がほぼ不要になる。
+
+MASTER_PASTE=joined の場合、テンプレートにはマスタのヘッダーだけを貼り付けておき、
+変換ごとに注文に関係する行だけを書き込む (master_join を参照)。
+"""
+import os
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+from .master_join import (
+    join_customer_master, join_product_master, master_header, order_product_names, template_patterns,
+)
+from .master_store import get_master_index
+from .masters import load_master_csv
+from .pdf_utils import (
+    MATCH_COLUMNS, ParsedOrderPdf, collect_page_tasks, export_detailed_client_data_to_dataframe,
+    extract_bento_range_for_bento, find_correct_anchor_for_bento,
+    match_bento_data, pdf_to_excel_data_for_paste_sheet,
+)
+from .tracing import RunTrace
+from .workbooks import PreparedTemplate, build_workbook, get_prepared_template
+from .xlsx_patch import SheetPatch
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), 'assets')
+TEMPLATE_NAME = 'template.xlsm'
+NOUHINSYO_NAME = 'nouhinsyo.xlsx'
+# マスタの貼り付け方: 'full' はテンプレートに全件、'joined' (実験的) は変換ごとに注文に関係する行だけ
+MASTER_PASTE = os.environ.get('MASTER_PASTE', 'full')
+# 変換処理の版。出力が変わる変更をしたら上げる (変換結果キャッシュのキーに含め、古い結果を使わないようにする)
+PIPELINE_VERSION = 1
+
+
+class OrderConversionError(Exception):
+    """利用者に表示するメッセージ付きの変換エラー"""
+
+
+class OrderResources(NamedTuple):
+    product_master: pd.DataFrame
+    customer_master: pd.DataFrame
+    template: PreparedTemplate
+    nouhinsyo: PreparedTemplate
+    master_paste: str = 'full'
+
+
+class OrderOutputs(NamedTuple):
+    template_bytes: bytes
+    nouhinsyo_bytes: bytes
+
+
+def load_order_resources(assets_dir: str = ASSETS_DIR, trace: RunTrace = None,
+                         master_paste: str = None) -> OrderResources:
+    """マスタを読み込み、マスタ貼り付け済みのテンプレートを用意する"""
+    trace = trace or RunTrace.disabled()
+    master_paste = master_paste or MASTER_PASTE
+    with trace.span('masters'):
+        df_product_master, _ = load_master_csv(assets_dir, "商品マスタ")
+        df_customer_master, _ = load_master_csv(assets_dir, "得意先マスタ")
+        # 照合用の派生データ (保存済みならそれを読み込むだけ) を先に用意しておく
+        get_master_index(df_product_master, "商品マスタ")
+
+    template_path = os.path.join(assets_dir, TEMPLATE_NAME)
+    nouhinsyo_path = os.path.join(assets_dir, NOUHINSYO_NAME)
+    if not os.path.exists(template_path) or not os.path.exists(nouhinsyo_path):
+        raise OrderConversionError("テンプレートファイルが見つかりません。")
+
+    with trace.span('templates'):
+        product_sheet, customer_sheet = df_product_master, df_customer_master
+        if master_paste == 'joined':
+            product_sheet, customer_sheet = master_header(df_product_master), master_header(df_customer_master)
+        template = get_prepared_template(
+            template_path, {"商品マスタ": product_sheet, "得意先マスタ": customer_sheet}, keep_vba=True
+        )
+        # 納品書には得意先マスタのみ貼り付ける
+        nouhinsyo = get_prepared_template(nouhinsyo_path, {"得意先マスタ": customer_sheet})
+        # パッチ書き込みの元になる保存済みパッケージもここで作っておく
+        template.warm()
+        nouhinsyo.warm()
+    return OrderResources(df_product_master, df_customer_master, template, nouhinsyo, master_paste)
+
+
+def bento_sheet_from_tables(tables, df_product_master: pd.DataFrame, trace: RunTrace = None):
+    """抽出済みの表から弁当の一覧を取り出して商品マスタと照合する (見つからなければ None)"""
+    trace = trace or RunTrace.disabled()
+    with trace.span('bento_table'):
+        if not tables:
+            return None
+        main_table = max(tables, key=len)
+        anchor_col = find_correct_anchor_for_bento(main_table)
+        if anchor_col == -1:
+            return None
+        bento_list = extract_bento_range_for_bento(main_table, anchor_col)
+        if not bento_list:
+            return None
+    with trace.span('match', bentos=len(bento_list)):
+        matched_data = match_bento_data(bento_list, df_product_master)
+    return pd.DataFrame(matched_data, columns=MATCH_COLUMNS)
+
+
+def bento_sheet_for_nouhinsyo(df_bento_sheet, df_product_master: pd.DataFrame):
+    """納品書用に商品予定名から商品名を引いた表 (商品マスタに商品名がなければ None)"""
+    if df_bento_sheet is None or df_product_master.empty or '商品名' not in df_product_master.columns:
+        return None
+    index = get_master_index(df_product_master, '商品マスタ')
+    if index is not None and index.name_map is not None:
+        master_map = index.name_map
+    else:
+        master_map = df_product_master.drop_duplicates(subset=['商品予定名']).set_index('商品予定名')['商品名'].to_dict()
+    df_bento_for_nouhin = df_bento_sheet.copy()
+    df_bento_for_nouhin['商品名'] = df_bento_for_nouhin['商品予定名'].map(master_map)
+    return df_bento_for_nouhin[['商品予定名', 'パン箱入数', '商品名']]
+
+
+def joined_master_patches(resources: OrderResources, df_paste_sheet, df_bento_sheet, client_data):
+    """注文に関係するマスタの行を、ヘッダーだけ貼り付けたマスタのシートの2行目から書き込むパッチ"""
+    patches = {}
+    if not resources.product_master.empty:
+        names = order_product_names(df_bento_sheet, df_paste_sheet)
+        df = join_product_master(resources.product_master, names, template_patterns(resources.template.path))
+        patches["商品マスタ"] = SheetPatch(df, start_row=2)
+    if not resources.customer_master.empty:
+        df = join_customer_master(resources.customer_master, client_data, df_paste_sheet)
+        patches["得意先マスタ"] = SheetPatch(df, start_row=2)
+    return patches
+
+
+def convert_order_pdf(pdf_data: bytes, resources: Optional[OrderResources] = None,
+                      page_workers: Optional[int] = None, trace: RunTrace = None) -> OrderOutputs:
+    """
+    注文PDFのバイト列から数出表・納品書を作る。
+    resources を省略した場合は ASSETS_DIR のマスタとテンプレートを使う。
+    trace を渡すと段階ごとの計測を記録する。
+    """
+    trace = trace or RunTrace.disabled()
+    if resources is None:
+        resources = load_order_resources(trace=trace)
+
+    try:
+        with trace.span('parse'):
+            parsed_pdf = ParsedOrderPdf(pdf_data)
+    except Exception as e:
+        raise OrderConversionError("PDFデータの抽出に失敗しました。") from e
+
+    with parsed_pdf:
+        with trace.span('paste_sheet', pages=len(parsed_pdf.pages)):
+            df_paste_sheet = pdf_to_excel_data_for_paste_sheet(parsed_pdf)
+        if df_paste_sheet is None:
+            raise OrderConversionError("PDFデータの抽出に失敗しました。")
+        # 弁当の表とクライアント情報は1回の走査で集め、処理の済んだページから解析結果を破棄する
+        with trace.span('pages'):
+            page_results = collect_page_tasks(('bento_table', 'client_info'), parsed_pdf, workers=page_workers)
+    tables, error = page_results['bento_table']
+    if error is not None:
+        raise error
+    df_bento_sheet = bento_sheet_from_tables(tables, resources.product_master, trace)
+    # クライアント情報は途中のページで失敗しても、それまでに読めた分を使う
+    client_data = page_results['client_info'][0]
+    df_client_sheet = None
+    with trace.span('client_info'):
+        if client_data:
+            df_client_sheet = export_detailed_client_data_to_dataframe(client_data)
+
+    master_patches = {}
+    if resources.master_paste == 'joined':
+        with trace.span('join_masters'):
+            master_patches = joined_master_patches(resources, df_paste_sheet, df_bento_sheet, client_data)
+
+    # 数出表
+    template_patches = {"貼り付け用": SheetPatch.paste(df_paste_sheet)}
+    template_patches.update({name: p for name, p in master_patches.items() if name in resources.template.sheetnames})
+    if df_bento_sheet is not None and "注文弁当の抽出" in resources.template.sheetnames:
+        template_patches["注文弁当の抽出"] = SheetPatch.safe_write(df_bento_sheet)
+    if df_client_sheet is not None and "クライアント抽出" in resources.template.sheetnames:
+        template_patches["クライアント抽出"] = SheetPatch.safe_write(df_client_sheet)
+
+    # 納品書
+    nouhinsyo_patches = {"貼り付け用": SheetPatch.paste(df_paste_sheet)}
+    if "得意先マスタ" in master_patches and "得意先マスタ" in resources.nouhinsyo.sheetnames:
+        nouhinsyo_patches["得意先マスタ"] = master_patches["得意先マスタ"]
+    df_bento_for_nouhin = bento_sheet_for_nouhinsyo(df_bento_sheet, resources.product_master)
+    if df_bento_for_nouhin is not None and "注文弁当の抽出" in resources.nouhinsyo.sheetnames:
+        nouhinsyo_patches["注文弁当の抽出"] = SheetPatch.safe_write(df_bento_for_nouhin)
+    if df_client_sheet is not None and "クライアント抽出" in resources.nouhinsyo.sheetnames:
+        nouhinsyo_patches["クライアント抽出"] = SheetPatch.safe_write(df_client_sheet)
+
+    with trace.span('write_template'):
+        template_bytes = build_workbook(resources.template, template_patches)
+    with trace.span('write_nouhinsyo'):
+        nouhinsyo_bytes = build_workbook(resources.nouhinsyo, nouhinsyo_patches)
+    return OrderOutputs(template_bytes, nouhinsyo_bytes)
+
+
+def output_filenames(original_name: str):
+    """ダウンロード・バッチ出力のファイル名 (数出表, 納品書)"""
+    return f"{original_name}_数出表.xlsm", f"{original_name}_納品書.xlsx"
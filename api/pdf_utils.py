@@ -14,82 +14,315 @@ logging.getLogger('pdfminer.pdfdocument').setLevel(logging.ERROR)
 logging.getLogger('pdfminer.psparser').setLevel(logging.ERROR)
 logging.getLogger('pdfminer.pdfparser').setLevel(logging.ERROR)
 
+import io
+import multiprocessing
+import os
+import threading
+import numpy as np
 import pandas as pd
 import pdfplumber
+from pdfplumber.utils.text import WordExtractor
 import re
-import unicodedata
-from typing import List, Dict, Any
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import List, Dict, Any, Callable, Optional, Sequence
+
+from .product_matcher import MATCH_COLUMNS, ProductMatcher, get_product_matcher, normalize_product_name
+
+def _cache_key(name: str, kwargs: Dict[str, Any]):
+    return (name, tuple(sorted(kwargs.items())))
+
+class ParsedPage:
+    """pdfplumberのページをラップし、words / lines / text / table の結果をページ単位でキャッシュする"""
+
+    def __init__(self, page):
+        self._page = page
+        self._cache: Dict[Any, Any] = {}
+
+    @property
+    def page_number(self) -> int:
+        return self._page.page_number
+
+    @property
+    def width(self) -> float:
+        return self._page.width
+
+    @property
+    def height(self) -> float:
+        return self._page.height
+
+    def memo(self, key, compute: Callable[[], Any]):
+        """keyに対する計算結果を一度だけ求めて保持する"""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def chars(self) -> List[Dict[str, Any]]:
+        return self._page.chars
+
+    @property
+    def lines(self) -> List[Dict[str, Any]]:
+        return self.memo('lines', lambda: self._page.lines)
+
+    @property
+    def rects(self) -> List[Dict[str, Any]]:
+        return self.memo('rects', lambda: self._page.rects)
+
+    def extract_words(self, **kwargs) -> List[Dict[str, Any]]:
+        tolerances = _layout_tolerances(kwargs)
+        if tolerances:
+            return get_page_layout(self, *tolerances).words
+        return self.memo(_cache_key('words', kwargs), lambda: self._page.extract_words(**kwargs))
+
+    def extract_text(self, **kwargs) -> str:
+        tolerances = _layout_tolerances(kwargs, allow_layout_flag=True)
+        if tolerances:
+            return get_page_layout(self, *tolerances).text
+        return self.memo(_cache_key('text', kwargs), lambda: self._page.extract_text(**kwargs))
+
+    def extract_table(self, table_settings=None):
+        settings = table_settings or {}
+        return self.memo(_cache_key('table', settings), lambda: self._page.extract_table(settings))
+
+    def release(self):
+        """このページの解析結果 (キャッシュとpdfplumberのオブジェクト) を破棄する。再度使うと解析し直す"""
+        self._cache.clear()
+        self._page.close()
+
+class ParsedOrderPdf:
+    """
+    注文PDFを一度だけ開き、各抽出関数で共有するためのドキュメントモデル。
+    ページの解析結果は ParsedPage が初回アクセス時に計算してキャッシュする。
+    """
+
+    def __init__(self, pdf_file):
+        if isinstance(pdf_file, (bytes, bytearray)):
+            data = bytes(pdf_file)
+        elif isinstance(pdf_file, (str, os.PathLike)):
+            with open(pdf_file, 'rb') as f:
+                data = f.read()
+        else:
+            data = pdf_file.read()
+        self.data = data
+        self._pdf = pdfplumber.open(io.BytesIO(data))
+        self.pages = [ParsedPage(page) for page in self._pdf.pages]
+        self._keyword_pages = None
+
+    def keyword_pages(self) -> Optional[Dict[str, List[int]]]:
+        """PAGE_ROUTING_KEYWORDS ごとの、その語を含みうるページ番号 (0始まり)。初回に一度だけ走査する"""
+        if self._keyword_pages is None:
+            self._keyword_pages = scan_page_keywords(self.data, PAGE_ROUTING_KEYWORDS, len(self.pages)) or {}
+        return self._keyword_pages or None
+
+    def iter_pages(self, indices: Sequence[int] = None, keep: int = None):
+        """
+        ページを順に返し、処理の済んだページの解析結果を破棄する (直近 keep ページ分だけ残す)。
+        pdfplumber は文書を閉じるまで各ページの解析結果を保持するため、ページ数に比例して
+        メモリが増えないよう、全ページを走査する処理はこれを使う。
+        """
+        keep = PAGE_KEEP_PARSED if keep is None else keep
+        done = deque()
+        for i in range(len(self.pages)) if indices is None else indices:
+            page = self.pages[i]
+            yield page
+            done.append(page)
+            while len(done) > keep:
+                done.popleft().release()
+
+    def pages_for(self, keywords: Sequence[str]) -> List[int]:
+        """keywords のいずれかを含みうるページ番号 (走査できない・無効のときは全ページ)"""
+        index = self.keyword_pages() if PAGE_PRESCAN else None
+        if index is None or any(kw not in index for kw in keywords):
+            return list(range(len(self.pages)))
+        return sorted(set().union(*(index[kw] for kw in keywords)))
+
+    def close(self):
+        self._pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# iter_pages で解析結果を残しておくページ数 (これより前に処理したページの解析結果は破棄する)
+PAGE_KEEP_PARSED = int(os.environ.get('PDF_PAGE_KEEP_PARSED', '1') or 0)
+
+# ページレイアウトの計算回数 (テストでextract_wordsの重複実行を検出するためのカウンタ)
+LAYOUT_STATS = {'word_extractions': 0}
+
+def reset_layout_stats():
+    LAYOUT_STATS['word_extractions'] = 0
+
+def _layout_tolerances(kwargs: Dict[str, Any], allow_layout_flag: bool = False):
+    """PageLayoutで代替できる引数(tolerance指定のみ)なら (x_tolerance, y_tolerance) を返す"""
+    kwargs = dict(kwargs)
+    if allow_layout_flag and kwargs.pop('layout', False):
+        return None
+    if kwargs.pop('keep_blank_chars', False):
+        return None
+    x_tolerance = kwargs.pop('x_tolerance', 3)
+    y_tolerance = kwargs.pop('y_tolerance', 3)
+    if kwargs:
+        return None
+    return x_tolerance, y_tolerance
+
+class PageLayout:
+    """
+    1ページ分のレイアウト情報。words・縦罫線・文書の左右端を tolerance の組ごとに一度だけ計算し、
+    境界線の検出・行のグループ化・extract_text のフォールバックで共有する。
+    """
+
+    def __init__(self, page, x_tolerance: float = 3, y_tolerance: float = 3):
+        self._page = page
+        self.x_tolerance = x_tolerance
+        self.y_tolerance = y_tolerance
+        extractor = WordExtractor(x_tolerance=x_tolerance, y_tolerance=y_tolerance, keep_blank_chars=False)
+        self._wordmap = extractor.extract_wordmap(page.chars)
+        LAYOUT_STATS['word_extractions'] += 1
+        self.words = [word for word, _ in self._wordmap.tuples]
+        self.doc_left = min(word['x0'] for word in self.words) if self.words else None
+        self.doc_right = max(word['x1'] for word in self.words) if self.words else None
+        self._text = None
+        self._vertical_rules: Dict[float, List[float]] = {}
+        self._columns = None
+
+    @property
+    def text(self) -> str:
+        """page.extract_text(layout=False) と同じ文字列を、抽出済みのwordsから組み立てる"""
+        if self._text is None:
+            self._text = self._wordmap.to_textmap(y_tolerance=self.y_tolerance, presorted=True).as_string
+        return self._text
+
+    def vertical_rules(self, tolerance: float = 2) -> List[float]:
+        if tolerance not in self._vertical_rules:
+            self._vertical_rules[tolerance] = sorted(list(set(
+                round(line['x0'], 1) for line in self._page.lines if line['height'] > 0 and line['width'] < tolerance
+            )))
+        return self._vertical_rules[tolerance]
+
+    @property
+    def columns(self) -> 'WordColumns':
+        if self._columns is None:
+            self._columns = WordColumns(self.words)
+        return self._columns
+
+class WordColumns:
+    """
+    1ページ分の words を列ごとの NumPy 配列 (x0, x1, top) で持ち、行のグループ化と
+    境界線による列の割り当てをページ全体でまとめて計算する。
+    結果は get_line_groups / split_line_using_boundaries と同じになる (並べ替えはどちらも安定ソート)。
+    """
+
+    def __init__(self, words: List[Dict[str, Any]]):
+        self.texts = [word['text'] for word in words]
+        self.x0 = np.fromiter((word['x0'] for word in words), dtype=np.float64, count=len(words))
+        self.x1 = np.fromiter((word['x1'] for word in words), dtype=np.float64, count=len(words))
+        self.top = np.fromiter((word['top'] for word in words), dtype=np.float64, count=len(words))
+        self._groups: Dict[float, List[np.ndarray]] = {}
+
+    def line_group_indices(self, y_tolerance: float = 1.2) -> List[np.ndarray]:
+        """行ごとの words の添字 (行は top 順、行内は x0 順)"""
+        if y_tolerance not in self._groups:
+            if not self.texts:
+                self._groups[y_tolerance] = []
+            else:
+                order = np.argsort(self.top, kind='stable')
+                # top 順に並べた隣同士の差が y_tolerance を超えたところで行を切る
+                breaks = np.flatnonzero(np.abs(np.diff(self.top[order])) > y_tolerance) + 1
+                starts = np.zeros(len(order), dtype=np.intp)
+                starts[breaks] = 1
+                line_ids = np.cumsum(starts)
+                order = order[np.lexsort((self.x0[order], line_ids))]
+                self._groups[y_tolerance] = np.split(order, breaks)
+        return self._groups[y_tolerance]
+
+    def column_indices(self, boundaries: List[float]) -> np.ndarray:
+        """各 word の中心が入る列 (boundaries[i] <= 中心 < boundaries[i+1] の i、どこにも入らなければ -1)"""
+        bounds = np.asarray(boundaries, dtype=np.float64)
+        centers = (self.x0 + self.x1) / 2
+        columns = np.searchsorted(bounds, centers, side='right') - 1
+        columns[(columns < 0) | (columns >= len(bounds) - 1)] = -1
+        return columns
+
+    def split_lines(self, y_tolerance: float, boundaries: List[float]) -> List[List[str]]:
+        """各行を split_line_using_boundaries と同じ規則で列ごとの文字列にする"""
+        column_of = self.column_indices(boundaries).tolist()
+        rows = []
+        for group in self.line_group_indices(y_tolerance):
+            cells = [""] * (len(boundaries) - 1)
+            for i in group.tolist():
+                column = column_of[i]
+                if column >= 0:
+                    cells[column] = (cells[column] + " " + self.texts[i]).strip()
+            rows.append(cells)
+        return rows
+
+def get_page_layout(page, x_tolerance: float = 3, y_tolerance: float = 3) -> PageLayout:
+    """ParsedPage ならキャッシュ済みのレイアウトを返し、素のpdfplumberページならその場で計算する"""
+    if isinstance(page, ParsedPage):
+        return page.memo(('layout', x_tolerance, y_tolerance), lambda: PageLayout(page, x_tolerance, y_tolerance))
+    return PageLayout(page, x_tolerance, y_tolerance)
+
+@contextmanager
+def open_order_pdf(pdf_file_obj):
+    """ParsedOrderPdf はそのまま使い、それ以外(ファイルオブジェクト・bytes・パス)はその場で開く"""
+    if isinstance(pdf_file_obj, ParsedOrderPdf):
+        yield pdf_file_obj
+    else:
+        with ParsedOrderPdf(pdf_file_obj) as pdf:
+            yield pdf
 
 def safe_write_df(worksheet, df, start_row=1):
-    """DataFrameをExcelシートに安全に書き込む"""
-    num_cols = df.shape[1]
-    if worksheet.max_row >= start_row:
-        for row_idx in range(start_row, worksheet.max_row + 2):
-            for col_idx in range(1, num_cols + 2):
-                worksheet.cell(row=row_idx, column=col_idx).value = None
-    for r_idx, row_data in enumerate(df.itertuples(index=False), start=start_row):
-        for c_idx, value in enumerate(row_data, start=1):
-            worksheet.cell(row=r_idx, column=c_idx, value=value)
+    """DataFrameをExcelシートに安全に書き込む (start_row 行目以降の 1〜列数+1 列の値を空にしてから書き込む)"""
+    from .sheet_writer import clear_values, write_dataframe
+    clear_values(worksheet, start_row, df.shape[1] + 1)
+    write_dataframe(worksheet, df, start_row=start_row)
 
 def paste_dataframe_to_sheet(ws, df, start_row=1, start_col=1):
-    """DataFrameをExcelシートに貼り付ける"""
-    # ヘッダーを貼り付け
-    for c_idx, col_name in enumerate(df.columns, start=start_col):
-        ws.cell(row=start_row, column=c_idx, value=col_name)
-    
-    # データを貼り付け
-    for r_idx, row in df.iterrows():
-        for c_idx, value in enumerate(row, start=start_col):
-            ws.cell(row=start_row + r_idx + 1, column=c_idx, value=value)
-
-def match_bento_data(pdf_bento_list: List[str], master_df: pd.DataFrame) -> List[List[str]]:
+    """DataFrameをExcelシートに貼り付ける (ヘッダー + 値を行単位でまとめて書き込む)"""
+    from .sheet_writer import write_dataframe
+    write_dataframe(ws, df, start_row=start_row, start_col=start_col, header=True)
+
+def match_bento_data(pdf_bento_list: List[str], master_df: pd.DataFrame, matcher: ProductMatcher = None) -> List[List[str]]:
     """
     PDFの弁当名リストを商品マスタと照合し、関連データを返す。
     CSVのヘッダー問題を吸収し、安全な列名でデータを取得する。
+    照合には商品マスタの版ごとにキャッシュされる ProductMatcher を使う。
     """
     if master_df is None or master_df.empty:
         return [[name, "", "", ""] for name in pdf_bento_list]
 
     master_df.columns = master_df.columns.str.strip()
 
-    # --- ▼修正点：取得する列名を変更 ---
-    required_cols = ['商品予定名', 'パン箱入数', '売価単価', '弁当区分']
-    # --- ▲修正点▲ ---
+    required_cols = MATCH_COLUMNS
 
     if not all(col in master_df.columns for col in required_cols):
         missing = ", ".join([col for col in required_cols if col not in master_df.columns])
         return [[name, "", f"マスタ列不足: {missing}", ""] for name in pdf_bento_list]
-    
-    master_tuples = master_df[required_cols].astype(str).to_records(index=False).tolist()
+
+    if matcher is None:
+        matcher = get_product_matcher(master_df)
     matched_results = []
-    
-    # --- ▼修正点：変数名を分かりやすく変更 ---
-    norm_master = [
-        (unicodedata.normalize('NFKC', name).replace(" ", ""), name, pan_box, price, bento_type)
-        for name, pan_box, price, bento_type in master_tuples
-    ]
-    # --- ▲修正点▲ ---
 
     for pdf_name in pdf_bento_list:
         pdf_name_stripped = pdf_name.strip()
-        norm_pdf = unicodedata.normalize('NFKC', pdf_name_stripped).replace(" ", "")
+        norm_pdf = normalize_product_name(pdf_name_stripped)
         result_data = [pdf_name_stripped, "", "", ""]
         best_match = None
         
         # 1. 完全一致で検索
-        for norm_m, orig_m, pan_box, price, bento_type in norm_master:
-            if norm_m == norm_pdf:
-                best_match = [orig_m, pan_box, price, bento_type]
-                break
+        row = matcher.exact(norm_pdf)
+        if row is not None:
+            best_match = list(row)
         
-        # 2. 部分一致で検索
+        # 2. 部分一致で検索 (最も長い商品予定名を採用)
         if not best_match:
-            candidates = []
-            for norm_m, orig_m, pan_box, price, bento_type in norm_master:
-                if norm_m and norm_m in norm_pdf:
-                    candidates.append((orig_m, pan_box, price, bento_type))
-            if candidates:
-                best_match = max(candidates, key=lambda x: len(x[0]))
+            best_match = matcher.longest_substring(norm_pdf)
 
         if best_match:
             result_data = best_match
@@ -99,42 +332,44 @@ def match_bento_data(pdf_bento_list: List[str], master_df: pd.DataFrame) -> List
     return matched_results
 
 # ──────────────────────────────────────────────
-# 以下の関数は変更ありません
+# クライアント情報の抽出と行・列の組み立て
 # ──────────────────────────────────────────────
-def extract_detailed_client_info_from_pdf(pdf_file_obj):
+def extract_detailed_client_info_from_pdf(pdf_file_obj, workers: int = None, chunk_size: int = None):
     client_data = []
     try:
-        with pdfplumber.open(pdf_file_obj) as pdf:
-            for page in pdf.pages:
-                rows = extract_text_with_layout(page)
-                if not rows: continue
-                garden_row_idx = -1
-                for i, row in enumerate(rows):
-                    if '園名' in ''.join(str(c) for c in row if c):
-                        garden_row_idx = i
-                        break
-                if garden_row_idx == -1: continue
-                current_client_id, current_client_name = None, None
-                for i in range(garden_row_idx + 1, len(rows)):
-                    row = rows[i]
-                    if '10001' in ''.join(str(c) for c in row if c): break
-                    if not any(str(c).strip() for c in row): continue
-                    if row and row[0]:
-                        left_cell = str(row[0]).strip()
-                        if re.match(r'^\d+$', left_cell):
-                            if current_client_id and current_client_name:
-                                client_info = extract_meal_numbers_from_row(rows, i - 1, current_client_id, current_client_name)
-                                if client_info: client_data.append(client_info)
-                            current_client_id, current_client_name = left_cell, None
-                        elif not re.match(r'^\d+$', left_cell) and current_client_id:
-                            current_client_name = left_cell
-                if current_client_id and current_client_name:
-                    client_info = extract_meal_numbers_from_row(rows, len(rows) - 1, current_client_id, current_client_name)
-                    if client_info: client_data.append(client_info)
+        with open_order_pdf(pdf_file_obj) as pdf:
+            collect_pages('client_info', pdf, client_data, workers=workers, chunk_size=chunk_size)
     except Exception:
         pass
     return client_data
 
+def _collect_client_info_from_page(page, client_data):
+    rows = extract_text_with_layout(page)
+    if not rows: return
+    garden_row_idx = -1
+    for i, row in enumerate(rows):
+        if '園名' in ''.join(str(c) for c in row if c):
+            garden_row_idx = i
+            break
+    if garden_row_idx == -1: return
+    current_client_id, current_client_name = None, None
+    for i in range(garden_row_idx + 1, len(rows)):
+        row = rows[i]
+        if '10001' in ''.join(str(c) for c in row if c): break
+        if not any(str(c).strip() for c in row): continue
+        if row and row[0]:
+            left_cell = str(row[0]).strip()
+            if re.match(r'^\d+$', left_cell):
+                if current_client_id and current_client_name:
+                    client_info = extract_meal_numbers_from_row(rows, i - 1, current_client_id, current_client_name)
+                    if client_info: client_data.append(client_info)
+                current_client_id, current_client_name = left_cell, None
+            elif not re.match(r'^\d+$', left_cell) and current_client_id:
+                current_client_name = left_cell
+    if current_client_id and current_client_name:
+        client_info = extract_meal_numbers_from_row(rows, len(rows) - 1, current_client_id, current_client_name)
+        if client_info: client_data.append(client_info)
+
 def extract_meal_numbers_from_row(rows, row_idx, client_id, client_name):
     client_info = {'client_id': client_id, 'client_name': client_name, 'student_meals': [], 'teacher_meals': []}
     rows_to_check = []
@@ -163,20 +398,19 @@ def export_detailed_client_data_to_dataframe(client_data):
     return pd.DataFrame(df_data)
 
 def extract_text_with_layout(page) -> List[List[str]]:
-    words = page.extract_words(x_tolerance=3, y_tolerance=3, keep_blank_chars=False)
-    if not words: return []
-    boundaries = get_vertical_boundaries(page)
+    if isinstance(page, ParsedPage):
+        return page.memo('layout_rows', lambda: _extract_text_with_layout(page))
+    return _extract_text_with_layout(page)
+
+def _extract_text_with_layout(page) -> List[List[str]]:
+    layout = get_page_layout(page, x_tolerance=3, y_tolerance=3)
+    if not layout.words: return []
+    boundaries = get_vertical_boundaries(page, layout=layout)
     if len(boundaries) < 2:
-        text = page.extract_text(layout=False, x_tolerance=3, y_tolerance=3)
+        text = layout.text
         return [[line] for line in text.split('\n') if line.strip()] if text else []
-    row_groups = get_line_groups(words, y_tolerance=1.5)
-    result_rows = []
-    for group in row_groups:
-        sorted_group = sorted(group, key=lambda w: w['x0'])
-        columns = split_line_using_boundaries(sorted_group, boundaries)
-        if any(cell.strip() for cell in columns):
-            result_rows.append(columns)
-    return result_rows
+    rows = layout.columns.split_lines(1.5, boundaries)
+    return [columns for columns in rows if any(cell.strip() for cell in columns)]
 
 def get_line_groups(words: List[Dict[str, Any]], y_tolerance: float = 1.2) -> List[List[Dict[str, Any]]]:
     if not words: return []
@@ -191,13 +425,12 @@ def get_line_groups(words: List[Dict[str, Any]], y_tolerance: float = 1.2) -> Li
     groups.append(sorted(current_group, key=lambda w: w['x0']))
     return groups
 
-def get_vertical_boundaries(page, tolerance: float = 2) -> List[float]:
-    lines = page.lines
-    v_lines_x = sorted(list(set(round(line['x0'], 1) for line in lines if line['height'] > 0 and line['width'] < tolerance)))
-    words = page.extract_words()
-    if not words: return v_lines_x
-    doc_left = min(word['x0'] for word in words)
-    doc_right = max(word['x1'] for word in words)
+def get_vertical_boundaries(page, tolerance: float = 2, layout: PageLayout = None) -> List[float]:
+    if layout is None:
+        layout = get_page_layout(page)
+    v_lines_x = list(layout.vertical_rules(tolerance))
+    if not layout.words: return v_lines_x
+    doc_left, doc_right = layout.doc_left, layout.doc_right
     boundaries = sorted(list(set([round(doc_left, 1)] + v_lines_x + [round(doc_right, 1)])))
     merged = []
     if boundaries:
@@ -219,7 +452,7 @@ def split_line_using_boundaries(line: List[Dict[str, Any]], boundaries: List[flo
 
 def pdf_to_excel_data_for_paste_sheet(pdf_file):
     try:
-        with pdfplumber.open(pdf_file) as pdf:
+        with open_order_pdf(pdf_file) as pdf:
             if not pdf.pages: return None
             page = pdf.pages[0]
             rows = extract_text_with_layout(page)
@@ -230,17 +463,179 @@ def pdf_to_excel_data_for_paste_sheet(pdf_file):
     except Exception:
         return None
 
-def extract_table_from_pdf_for_bento(pdf_file_obj):
+def extract_table_from_pdf_for_bento(pdf_file_obj, workers: int = None, chunk_size: int = None):
     tables = []
-    with pdfplumber.open(pdf_file_obj) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            if not text or not any(kw in text for kw in ["園名", "飯あり", "キャラ弁"]): continue
-            if not page.lines: continue
-            table = page.extract_table({"vertical_strategy": "lines", "horizontal_strategy": "lines"})
-            if table: tables.append(table)
+    with open_order_pdf(pdf_file_obj) as pdf:
+        collect_pages('bento_table', pdf, tables, workers=workers, chunk_size=chunk_size)
     return tables
 
+def _collect_bento_table_from_page(page, tables):
+    text = page.extract_text()
+    if not text or not any(kw in text for kw in ["園名", "飯あり", "キャラ弁"]): return
+    if not page.lines: return
+    table = page.extract_table({"vertical_strategy": "lines", "horizontal_strategy": "lines"})
+    if table: tables.append(table)
+
+# ──────────────────────────────────────────────
+# ページの振り分け (キーワードによる事前走査)
+# ──────────────────────────────────────────────
+# pdfium で各ページの文字だけを取り出し (pdfminer による解析より一桁速い)、抽出処理ごとの
+# キーワードを構成する文字がすべて含まれるページだけを処理する。文字の集合で判定するため、
+# 文字の並び順が pdfminer と違っても対象ページを取りこぼさない。PDF_PAGE_PRESCAN=0 で無効
+PAGE_PRESCAN = os.environ.get('PDF_PAGE_PRESCAN', '1') != '0'
+PAGE_ROUTING_KEYWORDS = ('園名', '飯あり', 'キャラ弁')
+# かな・漢字 (pdfium の文字が一つもこれに当たらなければ、文字コードの対応が取れていないとみなす)
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]')
+
+def scan_page_keywords(pdf_data: bytes, keywords: Sequence[str], num_pages: int) -> Optional[Dict[str, List[int]]]:
+    """キーワードごとに、その文字をすべて含むページ番号のリストを返す (走査できなければ None)"""
+    try:
+        import pypdfium2 as pdfium  # pdfplumber の依存として入っている
+        doc = pdfium.PdfDocument(pdf_data)
+    except Exception:
+        return None
+    try:
+        if len(doc) != num_pages:
+            return None
+        index = {kw: [] for kw in keywords}
+        for i in range(num_pages):
+            page = doc[i]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+            chars = set(text)
+            # 文字が取れないページ (画像のみなど) や、pdfium が文字を正しく読めないページ (置換文字 U+FFFD を含む・
+            # かな漢字が一つもない) は判定できないため、すべての処理の対象にする
+            unknown = not text.strip() or '\ufffd' in text or not _CJK_RE.search(text)
+            for kw in keywords:
+                if unknown or all(c in chars for c in kw):
+                    index[kw].append(i)
+        return index
+    except Exception:
+        return None
+    finally:
+        doc.close()
+
+# ──────────────────────────────────────────────
+# ページ単位の並列処理 (ProcessPoolExecutor)
+# ──────────────────────────────────────────────
+# PDF_PAGE_WORKERS が 2 以上のときだけ並列処理を行う (既定は逐次処理)
+PAGE_WORKERS = int(os.environ.get('PDF_PAGE_WORKERS', '0') or 0)
+PAGE_CHUNK_SIZE = int(os.environ.get('PDF_PAGE_CHUNK_SIZE', '8') or 8)
+
+_PAGE_POOL: Optional[ProcessPoolExecutor] = None
+_PAGE_POOL_WORKERS = 0
+_PAGE_POOL_LOCK = threading.Lock()
+
+_PAGE_COLLECTORS = {
+    'client_info': _collect_client_info_from_page,
+    'bento_table': _collect_bento_table_from_page,
+}
+# 各処理が結果を出しうるページのキーワード (いずれかを含むページだけを処理する)
+_PAGE_KEYWORDS = {
+    'client_info': ('園名',),
+    'bento_table': ('園名', '飯あり', 'キャラ弁'),
+}
+
+def _apply_page_tasks(pdf: ParsedOrderPdf, page_tasks: Dict[int, List[str]], outcome: Dict[str, list]):
+    """
+    page_tasks のページを iter_pages で順に処理し、outcome[task] = [結果のリスト, 例外] に集める。
+    ある処理で例外が起きたら、その処理だけ以降のページを処理しない (他の処理は続ける)。
+    """
+    indices = sorted(page_tasks)
+    for i, page in zip(indices, pdf.iter_pages(indices)):
+        for task in page_tasks[i]:
+            entry = outcome[task]
+            if entry[1] is not None:
+                continue
+            try:
+                _PAGE_COLLECTORS[task](page, entry[0])
+            except Exception as e:
+                entry[1] = e
+    return outcome
+
+def _collect_page_range(page_tasks: Dict[int, List[str]], tasks: Sequence[str], pdf_bytes: bytes):
+    """ワーカープロセス側: PDFを自分で開き、page_tasks のページの結果を集める"""
+    outcome = {task: [[], None] for task in tasks}
+    try:
+        with ParsedOrderPdf(pdf_bytes) as pdf:
+            _apply_page_tasks(pdf, page_tasks, outcome)
+    except Exception as e:
+        for entry in outcome.values():
+            entry[1] = entry[1] or e
+    return outcome
+
+def _get_page_pool(workers: int) -> ProcessPoolExecutor:
+    """ページ単位の処理用のプロセスプール (初回に作り、以降は同じプロセス数なら再利用する)"""
+    global _PAGE_POOL, _PAGE_POOL_WORKERS
+    with _PAGE_POOL_LOCK:
+        if _PAGE_POOL is not None and _PAGE_POOL_WORKERS != workers:
+            _PAGE_POOL.shutdown(wait=False, cancel_futures=True)
+            _PAGE_POOL = None
+        if _PAGE_POOL is None:
+            # Streamlit・変換サービスのスレッドからforkしないよう spawn で起動する
+            _PAGE_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _PAGE_POOL_WORKERS = workers
+        return _PAGE_POOL
+
+def _reset_page_pool():
+    global _PAGE_POOL
+    with _PAGE_POOL_LOCK:
+        if _PAGE_POOL is not None:
+            _PAGE_POOL.shutdown(wait=False, cancel_futures=True)
+        _PAGE_POOL = None
+
+def collect_page_tasks(tasks: Sequence[str], pdf: ParsedOrderPdf, workers: int = None,
+                       chunk_size: int = None) -> Dict[str, list]:
+    """
+    複数の処理をPDFの1回の走査でまとめて行う。各ページには、そのページのキーワードに該当する
+    処理だけを適用し、処理の済んだページの解析結果は破棄する (ParsedOrderPdf.iter_pages)。
+    戻り値: {task: [ページ順の結果のリスト, 途中で起きた例外 (なければ None)]}
+    workers が 2 以上で対象ページ数が chunk_size を超える場合はページごとにプロセスへ分配するが、
+    結果は逐次処理と同じになる。ワーカープロセスが使えなくなった場合はこのプロセスで処理し直す。
+    """
+    workers = PAGE_WORKERS if workers is None else workers
+    chunk_size = max(1, PAGE_CHUNK_SIZE if chunk_size is None else chunk_size)
+    page_tasks: Dict[int, List[str]] = {}
+    for task in tasks:
+        for i in pdf.pages_for(_PAGE_KEYWORDS[task]):
+            page_tasks.setdefault(i, []).append(task)
+    outcome = {task: [[], None] for task in tasks}
+    indices = sorted(page_tasks)
+    if workers < 2 or len(indices) <= chunk_size:
+        return _apply_page_tasks(pdf, page_tasks, outcome)
+    chunks = [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)]
+    try:
+        pool = _get_page_pool(workers)
+        futures = [pool.submit(_collect_page_range, {i: page_tasks[i] for i in chunk}, tasks, pdf.data)
+                   for chunk in chunks]
+        results = [future.result() for future in futures]
+    except (BrokenProcessPool, RuntimeError):
+        _reset_page_pool()
+        return _apply_page_tasks(pdf, page_tasks, outcome)
+    for result in results:
+        for task, (chunk_results, error) in result.items():
+            entry = outcome[task]
+            if entry[1] is not None:
+                continue
+            entry[0].extend(chunk_results)
+            entry[1] = error
+    return outcome
+
+def collect_pages(task: str, pdf: ParsedOrderPdf, results: list, workers: int = None, chunk_size: int = None):
+    """
+    task のキーワードを含みうるページに task の処理を適用し、ページ順に results へ追加する。
+    途中で例外が起きた場合は、それまでのページの結果を追加してから送出する。
+    """
+    found, error = collect_page_tasks((task,), pdf, workers=workers, chunk_size=chunk_size)[task]
+    results.extend(found)
+    if error is not None:
+        raise error
+    return results
+
 def find_correct_anchor_for_bento(table, target_row_text="赤"):
     for r_idx, row in enumerate(table):
         if target_row_text in ''.join(str(c) for c in row if c):
@@ -267,3 +662,160 @@ def extract_bento_range_for_bento(table, start_col):
         cell_text = header_row[col] if col < len(header_row) else ""
         if cell_text and str(cell_text).strip(): bento_list.append(str(cell_text).strip())
     return bento_list
+
+# ========================================================
+# シールPDF (4列 × 5行のブロック) のルールベース抽出
+# ========================================================
+SEAL_GRID_COLUMNS = 4
+SEAL_GRID_ROWS = 5
+# 格子の罫線とみなす線・矩形の辺の最短の長さ (pt)
+SEAL_RULE_MIN_LENGTH = 20
+# 罫線がない場合に、ブロックの境目とみなす words の隙間 (pt)
+SEAL_WORD_GAP = 12
+SEAL_DATE_PATTERN = re.compile(r'^\d{1,2}/\d{1,2}$')
+SEAL_MEAL_COUNT_PATTERN = re.compile(r'^\d+(?:\+\d+)?$')
+
+def extract_seal_blocks_from_pdf(pdf_file_obj) -> List[Dict[str, Any]]:
+    """
+    シールPDFの各ページをブロックの格子 (罫線・文字の隙間から求め、求まらなければ等分) に分け、ブロックごとに
+    client_name / preparations / class_name / meal_count / date / grade と confidence (0〜1) を返す。
+    並びはページ順、ページ内は左上から右へ・上から下へ。
+    """
+    blocks = []
+    with open_order_pdf(pdf_file_obj) as pdf:
+        for page_index, page in enumerate(pdf.iter_pages()):
+            blocks.extend(_collect_seal_blocks_from_page(page, page_index))
+    return blocks
+
+def _cluster_positions(values: List[float], tolerance: float = 2) -> List[float]:
+    """近い (tolerance 以内で連なる) 位置をまとめ、それぞれの平均を返す"""
+    groups: List[List[float]] = []
+    for value in sorted(values):
+        if groups and value - groups[-1][-1] <= tolerance:
+            groups[-1].append(value)
+        else:
+            groups.append([value])
+    return [sum(group) / len(group) for group in groups]
+
+def _seal_rule_positions(page, axis: str) -> List[float]:
+    """罫線 (lines と rects の辺) の位置。axis='x' は縦の罫線の x、'y' は横の罫線の top"""
+    values = []
+    for line in page.lines:
+        if axis == 'x' and line['width'] < 2 and line['height'] >= SEAL_RULE_MIN_LENGTH:
+            values.append(line['x0'])
+        elif axis == 'y' and line['height'] < 2 and line['width'] >= SEAL_RULE_MIN_LENGTH:
+            values.append(line['top'])
+    for rect in page.rects:
+        if axis == 'x' and rect['height'] >= SEAL_RULE_MIN_LENGTH:
+            values.extend((rect['x0'], rect['x1']))
+        elif axis == 'y' and rect['width'] >= SEAL_RULE_MIN_LENGTH:
+            values.extend((rect['top'], rect['bottom']))
+    return _cluster_positions(values)
+
+def _seal_word_gaps(words: List[Dict[str, Any]], lo: str, hi: str) -> List[float]:
+    """words を lo〜hi の軸に投影したときの、SEAL_WORD_GAP 以上の隙間の中央"""
+    spans = sorted((word[lo], word[hi]) for word in words)
+    gaps = []
+    end = spans[0][1]
+    for start, stop in spans[1:]:
+        if start - end >= SEAL_WORD_GAP:
+            gaps.append((start + end) / 2)
+        end = max(end, stop)
+    return gaps
+
+def _seal_cell(bounds: List[float], position: float) -> int:
+    return min(max(bisect_right(bounds, position) - 1, 0), len(bounds) - 2)
+
+def _seal_grid_bounds(page, words: List[Dict[str, Any]], axis: str, size: float, count: int) -> List[float]:
+    """
+    1軸分のブロックの境界 [0, …, size]。words の間にある罫線 → words の隙間 → 等分 の順に試し、
+    count 個以下に分かれ、文字のある区間のすべてにクライアント名 (〜様) があるものを使う
+    (ブロック内の下線や行間で1つのブロックを分けてしまう場合は次の方法にする)。
+    """
+    lo, hi = ('x0', 'x1') if axis == 'x' else ('top', 'bottom')
+    start, end = min(word[lo] for word in words), max(word[hi] for word in words)
+    centers = [((word[lo] + word[hi]) / 2, word['text'].endswith('様')) for word in words]
+    for inner in ([p for p in _seal_rule_positions(page, axis) if start < p < end],
+                  _seal_word_gaps(words, lo, hi)):
+        if not inner or len(inner) >= count:
+            continue
+        bounds = [0] + inner + [size]
+        filled = {_seal_cell(bounds, center) for center, _ in centers}
+        if filled <= {_seal_cell(bounds, center) for center, anchor in centers if anchor}:
+            return bounds
+    return [size * i / count for i in range(count + 1)]
+
+def _collect_seal_blocks_from_page(page, page_index: int) -> List[Dict[str, Any]]:
+    layout = get_page_layout(page)
+    if not layout.words:
+        return []
+    xs = _seal_grid_bounds(page, layout.words, 'x', page.width, SEAL_GRID_COLUMNS)
+    ys = _seal_grid_bounds(page, layout.words, 'y', page.height, SEAL_GRID_ROWS)
+    cells: Dict[tuple, List[Dict[str, Any]]] = {}
+    for word in layout.words:
+        col = _seal_cell(xs, (word['x0'] + word['x1']) / 2)
+        row = _seal_cell(ys, (word['top'] + word['bottom']) / 2)
+        cells.setdefault((row, col), []).append(word)
+    blocks = []
+    for (row, col), words in sorted(cells.items()):
+        block = parse_seal_block(words)
+        block['page'], block['row'], block['col'] = page_index, row, col
+        block['bbox'] = (xs[col], ys[row], xs[col + 1], ys[row + 1])
+        blocks.append(block)
+    return blocks
+
+def parse_seal_block(words: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    1ブロック分のwordsを行にまとめ、上から クライアント名(〜様) → 準備物 → クラス名(最も大きい文字)
+    → 弁当数、最下行の左に日付(MM/DD)・右に学年、として読み取る。
+    confidence は必須5項目 (準備物以外) の形式チェックの通過率で、使われなかった行があれば下げる。
+    """
+    block = {'client_name': '', 'preparations': [], 'class_name': '', 'meal_count': '', 'date': '', 'grade': ''}
+    lines = get_line_groups(words, y_tolerance=3)
+    if not lines:
+        block['confidence'] = 0.0
+        return block
+    texts = [' '.join(w['text'] for w in line).strip() for line in lines]
+    used = set()
+
+    client_idx = next((i for i, text in enumerate(texts) if text.endswith('様')), None)
+    if client_idx is not None:
+        block['client_name'] = texts[client_idx]
+        used.add(client_idx)
+
+    bottom_idx = len(lines) - 1
+    if bottom_idx != client_idx:
+        bottom = lines[bottom_idx]
+        date_word = next((w for w in bottom if SEAL_DATE_PATTERN.match(w['text'])), None)
+        if date_word is not None:
+            block['date'] = date_word['text']
+            rest = [w['text'] for w in bottom if w is not date_word and w['x0'] > date_word['x0']]
+            block['grade'] = ' '.join(rest)
+            used.add(bottom_idx)
+
+    start = client_idx + 1 if client_idx is not None else 0
+    middle = [i for i in range(start, len(lines)) if i not in used]
+    count_idx = next((i for i in middle if SEAL_MEAL_COUNT_PATTERN.match(texts[i].replace(' ', ''))), None)
+    if count_idx is not None:
+        block['meal_count'] = texts[count_idx].replace(' ', '')
+        used.add(count_idx)
+    class_candidates = [i for i in middle if i != count_idx and (count_idx is None or i < count_idx)]
+    if class_candidates:
+        class_idx = max(class_candidates, key=lambda i: max(w['bottom'] - w['top'] for w in lines[i]))
+        block['class_name'] = texts[class_idx]
+        used.add(class_idx)
+        for i in class_candidates:
+            if i < class_idx:
+                block['preparations'].extend(w['text'] for w in lines[i])
+                used.add(i)
+
+    checks = [
+        block['client_name'].endswith('様'),
+        bool(block['class_name']),
+        bool(SEAL_MEAL_COUNT_PATTERN.match(block['meal_count'])),
+        bool(SEAL_DATE_PATTERN.match(block['date'])),
+        bool(block['grade']),
+    ]
+    unused_lines = len(lines) - len(used)
+    block['confidence'] = round(max(0.0, sum(checks) / len(checks) - 0.1 * unused_lines), 2)
+    return block
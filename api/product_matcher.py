@@ -0,0 +1,146 @@
+# product_matcher.py
+"""
+商品マスタの商品予定名に対する照合インデックス。
+
+match_bento_data は弁当名ごとにマスタ全件を走査していたため、マスタ件数 × 弁当数の
+比較が毎回発生していた。ProductMatcher はマスタ1版につき一度だけ構築し、
+完全一致はハッシュ表、部分一致 (最長の商品予定名を採用) は Aho–Corasick オートマトンで引く。
+"""
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+MATCH_COLUMNS = ['商品予定名', 'パン箱入数', '売価単価', '弁当区分']
+
+MasterRow = Tuple[str, str, str, str]
+
+
+def normalize_product_name(name: str) -> str:
+    """照合用の正規化 (NFKC + 半角スペース除去)"""
+    return unicodedata.normalize('NFKC', name).replace(" ", "")
+
+
+class ProductMatcher:
+    """
+    商品マスタ行 (商品予定名, パン箱入数, 売価単価, 弁当区分) の照合インデックス。
+
+    - exact(): 正規化後の名前が一致する最初のマスタ行
+    - longest_substring(): 正規化後の名前に含まれるマスタ行のうち、元の商品予定名が
+      最も長いもの (同じ長さならマスタ上で先の行)
+    どちらも従来の線形走査と同じ行を返す。
+    normalized (商品予定名 → 正規化後の名前) を渡すと、そこにある名前は正規化し直さない。
+    """
+
+    def __init__(self, rows: Sequence[MasterRow], normalized: Optional[Dict[str, str]] = None):
+        self.rows: List[MasterRow] = [tuple(row) for row in rows]
+        self._exact: Dict[str, int] = {}
+        best_by_pattern: Dict[str, int] = {}
+        normalized = normalized or {}
+        for idx, row in enumerate(self.rows):
+            norm = normalized.get(row[0])
+            if norm is None:
+                norm = normalize_product_name(row[0])
+            self._exact.setdefault(norm, idx)
+            if norm and (norm not in best_by_pattern or self._better(idx, best_by_pattern[norm]) == idx):
+                best_by_pattern[norm] = idx
+        self._build_automaton(best_by_pattern)
+
+    @classmethod
+    def from_master_df(cls, master_df: pd.DataFrame, normalized: Optional[Dict[str, str]] = None) -> 'ProductMatcher':
+        return cls(master_df[MATCH_COLUMNS].astype(str).to_records(index=False).tolist(), normalized)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _better(self, a: int, b: int) -> int:
+        """部分一致候補の優先順位: 元の名前が長い方、同じなら先の行"""
+        if b == -1: return a
+        if a == -1: return b
+        len_a, len_b = len(self.rows[a][0]), len(self.rows[b][0])
+        if len_a != len_b:
+            return a if len_a > len_b else b
+        return min(a, b)
+
+    def _build_automaton(self, best_by_pattern: Dict[str, int]):
+        goto: List[Dict[str, int]] = [{}]
+        output: List[int] = [-1]
+        for pattern, idx in best_by_pattern.items():
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    output.append(-1)
+                node = nxt
+            output[node] = idx
+
+        # 失敗遷移をBFSで張り、各ノードの出力に接尾辞ノードの最良候補をまとめておく
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                output[nxt] = self._better(output[nxt], output[fail[nxt]])
+                queue.append(nxt)
+        self._goto, self._fail, self._output = goto, fail, output
+
+    def exact(self, norm_name: str) -> Optional[MasterRow]:
+        idx = self._exact.get(norm_name)
+        return self.rows[idx] if idx is not None else None
+
+    def longest_substring(self, norm_name: str) -> Optional[MasterRow]:
+        goto, fail, output = self._goto, self._fail, self._output
+        node, best = 0, -1
+        for ch in norm_name:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node] != -1:
+                best = self._better(best, output[node])
+        return self.rows[best] if best != -1 else None
+
+
+_MATCHER_CACHE: 'OrderedDict[str, ProductMatcher]' = OrderedDict()
+_MATCHER_CACHE_SIZE = 4
+_MATCHER_LOCK = threading.Lock()
+
+
+def master_fingerprint(master_df: pd.DataFrame) -> str:
+    """照合に使う列の内容から商品マスタの版を識別するハッシュ"""
+    hashed = pd.util.hash_pandas_object(master_df[MATCH_COLUMNS].astype(str), index=False)
+    return hashlib.sha1(hashed.values.tobytes()).hexdigest()
+
+
+def get_product_matcher(master_df: pd.DataFrame) -> ProductMatcher:
+    """
+    商品マスタの版ごとに ProductMatcher を一度だけ構築して使い回す。
+    マスタ保管庫 (master_store) に保存済みの照合インデックスがあればそれを使う。
+    """
+    from .master_store import get_master_index
+
+    key = master_fingerprint(master_df)
+    with _MATCHER_LOCK:
+        matcher = _MATCHER_CACHE.get(key)
+        if matcher is not None:
+            _MATCHER_CACHE.move_to_end(key)
+            return matcher
+    index = get_master_index(master_df, '商品マスタ')
+    if index is not None and index.matcher is not None and index.fingerprint == key:
+        matcher = index.matcher
+    else:
+        matcher = ProductMatcher.from_master_df(master_df)
+    with _MATCHER_LOCK:
+        _MATCHER_CACHE[key] = matcher
+        while len(_MATCHER_CACHE) > _MATCHER_CACHE_SIZE:
+            _MATCHER_CACHE.popitem(last=False)
+    return matcher
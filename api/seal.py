@@ -0,0 +1,487 @@
+# seal.py
+"""
+シールPDF → シールデータ (seal.xlsx の「Gemini抽出データ」シート) の変換処理。
+
+Geminiへの問い合わせは数分かかることがあるため、結果の blocks は
+gemini_cache のディスクキャッシュに保存し、同じPDF・モデル・プロンプトなら再利用する。
+ページ数の多いPDFは extract_seal_blocks_by_page でページ単位に分割して並列に問い合わせ、
+ページ順に結合する (1回の出力が短くなるため途中で切れにくい)。
+extract_seal_blocks_streaming はストリーミング応答を BlockStreamParser で逐次解析し、
+ブロックが閉じるたびに呼び出し側へ渡す。
+extract_seal_blocks_local は pdf_utils のルールベース抽出を使い、信頼度の低いブロックだけを
+そのブロックの範囲を描画した画像でGeminiに問い合わせる (model がなければルールベースのみ)。
+model は generate_content(contents, generation_config=...) を持つオブジェクトであればよい。
+google.generativeai と openpyxl は読み込みが重いため、使うときに import する。
+"""
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from .gemini_cache import GeminiResponseCache, get_response_cache, response_cache_key
+
+SEAL_PROMPT = """
+このPDFはシール表です。横4つ × 縦5つ(合計約20個)のブロックで構成されています。
+各ブロックには以下の情報が含まれています:
+1. クライアント名 (最上部): 小学校名または幼稚園名 + 「様」
+2. 準備物 (クライアント名のすぐ下): パン箱入数、ご飯150gなど
+3. クラス名 (中央、大きめの文字): チューリップ、さくらなど
+4. 弁当数 (クラス名の下): 数値(例: 35、35+1)
+5. 日付 (ブロック左下): MM/DD形式
+6. 学年 (ブロック右下): 年長、年中など
+
+以下のJSON形式で、全てのブロック情報を抽出してください:
+{
+  "blocks": [
+    {
+      "client_name": "博多南衆参コース様",
+      "preparations": ["パン箱入数", "ご飯150g"],
+      "class_name": "チューリップ",
+      "meal_count": "35",
+      "date": "12/10",
+      "grade": "年長"
+    }
+  ]
+}
+重要: 全てのブロックを抽出してください。完全で有効なJSONのみを返してください。
+"""
+
+SEAL_BLOCK_PROMPT = """
+この画像はシール1枚分 (1ブロック) です。以下の情報が含まれています:
+1. クライアント名 (最上部): 小学校名または幼稚園名 + 「様」
+2. 準備物 (クライアント名のすぐ下): パン箱入数、ご飯150gなど
+3. クラス名 (中央、大きめの文字): チューリップ、さくらなど
+4. 弁当数 (クラス名の下): 数値(例: 35、35+1)
+5. 日付 (ブロック左下): MM/DD形式
+6. 学年 (ブロック右下): 年長、年中など
+
+以下のJSON形式で返してください:
+{"blocks": [{"client_name": "", "preparations": [], "class_name": "", "meal_count": "", "date": "", "grade": ""}]}
+完全で有効なJSONのみを返してください。
+"""
+
+# ルールベース抽出でこの信頼度未満のブロックはGeminiで読み直す
+SEAL_CONFIDENCE_THRESHOLD = float(os.environ.get('SEAL_CONFIDENCE_THRESHOLD', '0.8'))
+
+# ページ分割モードの設定 (1リクエストあたりのページ数・同時リクエスト数・ページごとの再試行回数)
+SEAL_PAGES_PER_REQUEST = int(os.environ.get('SEAL_PAGES_PER_REQUEST', '1'))
+SEAL_MAX_CONCURRENCY = int(os.environ.get('SEAL_MAX_CONCURRENCY', '4'))
+SEAL_RETRIES = int(os.environ.get('SEAL_RETRIES', '2'))
+SEAL_RETRY_WAIT = 2.0
+
+SEAL_SHEET_NAME = "Gemini抽出データ"
+SEAL_HEADERS = ['クライアント名', 'クラス名', '準備物', '弁当数', '日付', '学年']
+
+_GENAI_LOCK = threading.Lock()
+_GENAI_API_KEY: Optional[str] = None
+
+
+class SealExtraction(NamedTuple):
+    blocks: List[dict]
+    recovered: bool  # 出力が途中で切れており、完結したブロックだけを回復した
+    cached: bool     # キャッシュから返した
+    low_confidence: int = 0  # ルールベース抽出で信頼度が低いまま残ったブロック数
+
+
+def get_gemini_model(model_name: str, api_key: Optional[str] = None):
+    """
+    Geminiのモデルを返す (APIキーがなければ None)。
+    genai.configure はプロセスごとに、APIキーが変わったときだけ呼ぶ。
+    """
+    api_key = (api_key if api_key is not None else os.environ.get('GOOGLE_API_KEY') or '').strip()
+    if not api_key:
+        return None
+    import google.generativeai as genai
+    global _GENAI_API_KEY
+    with _GENAI_LOCK:
+        if _GENAI_API_KEY != api_key:
+            genai.configure(api_key=api_key)
+            _GENAI_API_KEY = api_key
+    return genai.GenerativeModel(model_name)
+
+
+def parse_seal_response(text: str):
+    """
+    Geminiの出力テキストから blocks を取り出す。
+    途中で切れたJSONは最後の完結したブロックまでで閉じて回復を試みる。
+    戻り値: (blocks, recovered)
+    """
+    text = text.strip()
+    if text.startswith("```json"): text = text[7:]
+    if text.endswith("```"): text = text[:-3]
+
+    recovered = False
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        # Find the last complete block by looking for "},"
+        last_complete = text.rfind("},")
+        if last_complete == -1:
+            raise e
+        try:
+            data = json.loads(text[:last_complete + 1] + "]}")
+        except json.JSONDecodeError:
+            # Try another approach - wrap as array
+            try:
+                data = json.loads(text[:last_complete + 1] + "]")
+            except json.JSONDecodeError:
+                raise e
+        recovered = True
+
+    blocks = data if isinstance(data, list) else data.get('blocks', [])
+    return blocks, recovered
+
+
+def _generate_blocks(model, pdf_data: bytes, prompt: str, mime_type: str = "application/pdf"):
+    response = model.generate_content([
+        {"mime_type": mime_type, "data": pdf_data},
+        prompt
+    ], generation_config={"response_mime_type": "application/json"})
+    return parse_seal_response(response.text)
+
+
+def extract_seal_blocks(pdf_data: bytes, model, model_name: str, prompt: str = SEAL_PROMPT,
+                        cache: Optional[GeminiResponseCache] = None, use_cache: bool = True) -> SealExtraction:
+    """
+    シールPDFをGeminiで解析して blocks を返す。
+    use_cache=False でもキャッシュの読み出しを飛ばすだけで、新しい結果は保存する。
+    途中で切れた出力から回復した結果は不完全なためキャッシュしない。
+    """
+    cache = cache if cache is not None else get_response_cache()
+    key = response_cache_key(pdf_data, model_name, prompt)
+    if use_cache:
+        blocks = cache.get(key)
+        if blocks is not None:
+            return SealExtraction(blocks, False, True)
+
+    blocks, recovered = _generate_blocks(model, pdf_data, prompt)
+    if not recovered:
+        cache.put(key, blocks, model=model_name)
+    return SealExtraction(blocks, recovered, False)
+
+
+class BlockStreamParser:
+    """
+    ストリーミングで届くJSONテキストから blocks の要素を逐次取り出すパーサ。
+
+    {"blocks": [{...}, ...]} の "blocks" の配列か、最上位が [{...}, ...] の配列の要素
+    (オブジェクト) が閉じた時点で feed() の戻り値として返す。それ以外のキーの配列は読み飛ばす。
+    前後の ```json 等は無視する。
+    """
+
+    def __init__(self):
+        self._buf = ''
+        self._pos = 0          # 次に読む位置
+        self._stack = []       # 開いている '{' / '['
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1  # 読み取り中の最上位のオブジェクトの文字列 (キー) の開始位置
+        self._last_key = None    # 最上位のオブジェクトで直前に読んだ文字列 (配列の前ならそのキー)
+        self._array_key = None   # 最上位のオブジェクト直下で開いている配列のキー
+        self._start = -1       # 読み取り中のブロックの開始位置
+        self._block_depth = 0
+        self._started = False
+        self.blocks: List[dict] = []
+
+    @property
+    def complete(self) -> bool:
+        """最上位のJSONが閉じている (途中で切れていない)"""
+        return self._started and not self._stack
+
+    def _in_blocks_array(self) -> bool:
+        """いま開いている配列がブロックの配列 (最上位の [ か {"blocks": [ ) か"""
+        return self._stack == ['['] or (self._stack == ['{', '['] and self._array_key == 'blocks')
+
+    def feed(self, text: str) -> List[dict]:
+        self._buf += text
+        new_blocks = []
+        buf, i = self._buf, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_start != -1:
+                        try:
+                            self._last_key = json.loads(buf[self._string_start:i + 1])
+                        except json.JSONDecodeError:
+                            self._last_key = None
+                        self._string_start = -1
+            elif ch == '"':
+                self._in_string = True
+                if self._stack == ['{']:
+                    self._string_start = i
+            elif ch in '{[':
+                if ch == '[' and self._stack == ['{']:
+                    self._array_key = self._last_key
+                # ブロックの配列の直下に開いたオブジェクトがブロック
+                if ch == '{' and self._start == -1 and self._in_blocks_array():
+                    self._start, self._block_depth = i, len(self._stack) + 1
+                self._stack.append(ch)
+                self._started = True
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if ch == '}' and self._start != -1 and len(self._stack) == self._block_depth - 1:
+                    try:
+                        new_blocks.append(json.loads(buf[self._start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._start = -1
+            i += 1
+        self._pos = i
+        # 読み終えた部分は捨てる (読み取り中のブロック・キーは残す)
+        keep = min(p for p in (self._start, self._string_start, self._pos) if p != -1)
+        self._buf, self._pos = buf[keep:], self._pos - keep
+        if self._start != -1:
+            self._start -= keep
+        if self._string_start != -1:
+            self._string_start -= keep
+        self.blocks.extend(new_blocks)
+        return new_blocks
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text or ''
+    except ValueError:
+        # テキストを含まないチャンク (終了理由のみ等)
+        return ''
+
+
+def extract_seal_blocks_streaming(pdf_data: bytes, model, model_name: str, prompt: str = SEAL_PROMPT,
+                                  cache: Optional[GeminiResponseCache] = None, use_cache: bool = True,
+                                  on_block: Optional[Callable[[dict], None]] = None) -> SealExtraction:
+    """
+    ストリーミング応答でシールPDFを解析し、ブロックが閉じるたびに on_block(block) を呼ぶ。
+    応答が途中で切れた (または途中でエラーになった) 場合は受け取り済みのブロックだけを返す。
+    """
+    cache = cache if cache is not None else get_response_cache()
+    key = response_cache_key(pdf_data, model_name, prompt)
+    if use_cache:
+        blocks = cache.get(key)
+        if blocks is not None:
+            for block in blocks:
+                if on_block: on_block(block)
+            return SealExtraction(blocks, False, True)
+
+    parser = BlockStreamParser()
+    text_parts = []
+    try:
+        response = model.generate_content([
+            {"mime_type": "application/pdf", "data": pdf_data},
+            prompt
+        ], generation_config={"response_mime_type": "application/json"}, stream=True)
+        for chunk in response:
+            text = _chunk_text(chunk)
+            text_parts.append(text)
+            for block in parser.feed(text):
+                if on_block: on_block(block)
+    except Exception:
+        if not parser.blocks:
+            raise
+        return SealExtraction(parser.blocks, True, False)
+
+    if not parser.blocks:
+        # 想定外の形の出力は従来どおり全文を解析する
+        blocks, recovered = parse_seal_response(''.join(text_parts))
+        for block in blocks:
+            if on_block: on_block(block)
+    else:
+        blocks, recovered = parser.blocks, not parser.complete
+    if not recovered:
+        cache.put(key, blocks, model=model_name)
+    return SealExtraction(blocks, recovered, False)
+
+
+def split_pdf_pages(pdf_data: bytes, pages_per_chunk: int = 1) -> List[Tuple[range, bytes]]:
+    """PDFを pages_per_chunk ページずつの小さなPDFに分割する。戻り値: [(ページ番号の範囲, PDFのバイト列)]"""
+    import pypdfium2 as pdfium  # pdfplumber の依存として入っている
+
+    src = pdfium.PdfDocument(pdf_data)
+    try:
+        chunks = []
+        for start in range(0, len(src), pages_per_chunk):
+            pages = range(start, min(start + pages_per_chunk, len(src)))
+            dst = pdfium.PdfDocument.new()
+            dst.import_pages(src, list(pages))
+            out = io.BytesIO()
+            dst.save(out)
+            dst.close()
+            chunks.append((pages, out.getvalue()))
+        return chunks
+    finally:
+        src.close()
+
+
+def extract_seal_blocks_by_page(pdf_data: bytes, model, model_name: str, prompt: str = SEAL_PROMPT,
+                                cache: Optional[GeminiResponseCache] = None, use_cache: bool = True,
+                                pages_per_request: int = None, max_concurrency: int = None,
+                                retries: int = None) -> SealExtraction:
+    """
+    シールPDFをページ単位 (pages_per_request ページずつ) に分けて並列に解析し、ページ順に blocks を結合する。
+    出力が途中で切れた・エラーになったページはそのページだけ retries 回まで再試行する。
+    キャッシュは (元のPDF, ページ範囲) ごとに保存するため、一部のページだけの再解析にも効く。
+    """
+    cache = cache if cache is not None else get_response_cache()
+    pages_per_request = max(1, pages_per_request or SEAL_PAGES_PER_REQUEST)
+    max_concurrency = max(1, max_concurrency or SEAL_MAX_CONCURRENCY)
+    retries = max(0, SEAL_RETRIES if retries is None else retries)
+
+    def run(chunk):
+        pages, chunk_data = chunk
+        key = response_cache_key(pdf_data, model_name, prompt, part=f'pages={pages.start}-{pages.stop}')
+        if use_cache:
+            blocks = cache.get(key)
+            if blocks is not None:
+                return blocks, False, True
+        for attempt in range(retries + 1):
+            try:
+                blocks, recovered = _generate_blocks(model, chunk_data, prompt)
+            except Exception as e:
+                if attempt == retries:
+                    raise RuntimeError(f"{pages.start + 1}ページ目以降の解析に失敗しました: {e}") from e
+            else:
+                if not recovered:
+                    cache.put(key, blocks, model=model_name)
+                    return blocks, False, False
+                if attempt == retries:
+                    return blocks, True, False
+            time.sleep(SEAL_RETRY_WAIT * (attempt + 1))
+
+    chunks = split_pdf_pages(pdf_data, pages_per_request)
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks) or 1)) as executor:
+        results = list(executor.map(run, chunks))
+
+    blocks = [block for chunk_blocks, _, _ in results for block in chunk_blocks]
+    recovered = any(r[1] for r in results)
+    cached = bool(results) and all(r[2] for r in results)
+    return SealExtraction(blocks, recovered, cached)
+
+
+def render_pdf_region(pdf_data: bytes, page_index: int, bbox, scale: float = 3) -> bytes:
+    """
+    1ページの bbox (pdfplumberの座標: x0, top, x1, bottom) をPNGに描画する。
+    PDFのまま切り抜いてもテキスト層にはページ全体が残るため、画像にして送る。
+    """
+    import pypdfium2 as pdfium  # pdfplumber の依存として入っている
+
+    src = pdfium.PdfDocument(pdf_data)
+    try:
+        page = src[page_index]
+        width, height = page.get_width(), page.get_height()
+        x0, top, x1, bottom = bbox
+        bitmap = page.render(scale=scale, crop=(x0, height - bottom, width - x1, top))
+        out = io.BytesIO()
+        bitmap.to_pil().save(out, format='PNG')
+        return out.getvalue()
+    finally:
+        src.close()
+
+
+def _first_block(found) -> Optional[dict]:
+    """読み直しの結果の先頭のブロック (空・ブロックの形でない場合は None)"""
+    if isinstance(found, list) and found and isinstance(found[0], dict):
+        return found[0]
+    return None
+
+
+def extract_seal_blocks_local(pdf_data: bytes, model=None, model_name: str = '', prompt: str = SEAL_BLOCK_PROMPT,
+                              cache: Optional[GeminiResponseCache] = None, use_cache: bool = True,
+                              threshold: float = None, max_concurrency: int = None) -> SealExtraction:
+    """
+    ルールベースでブロックを抽出し、confidence が threshold 未満のブロックだけをGeminiで読み直す。
+    Geminiで読み直したブロックは confidence を 1.0 とし source='gemini' を付ける。
+    model が None (APIキーなし) の場合や読み直しに失敗した・結果が空やブロックの形でない場合は
+    ルールベースの結果をそのまま返す。
+    """
+    # pdfplumber が使えない環境でもAIのみの抽出は動くよう、ここで読み込む
+    from .pdf_utils import extract_seal_blocks_from_pdf
+
+    threshold = SEAL_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    blocks = extract_seal_blocks_from_pdf(pdf_data)
+    low = [i for i, block in enumerate(blocks) if block['confidence'] < threshold]
+    if model is None or not low:
+        return SealExtraction(blocks, False, False, len(low))
+
+    cache = cache if cache is not None else get_response_cache()
+    max_concurrency = max(1, max_concurrency or SEAL_MAX_CONCURRENCY)
+
+    def reread(idx):
+        block = blocks[idx]
+        key = response_cache_key(pdf_data, model_name, prompt, part=f"block={block['page']}-{block['row']}-{block['col']}")
+        found = cache.get(key) if use_cache else None
+        if found is None:
+            try:
+                image = render_pdf_region(pdf_data, block['page'], block['bbox'])
+                found, recovered = _generate_blocks(model, image, prompt, mime_type="image/png")
+            except Exception:
+                return None
+            if recovered or _first_block(found) is None:
+                return None
+            cache.put(key, found, model=model_name)
+        first = _first_block(found)
+        if first is None:
+            return None
+        position = {k: block[k] for k in ('page', 'row', 'col', 'bbox')}
+        return dict(first, confidence=1.0, source='gemini', **position)
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(low))) as executor:
+        rereads = list(executor.map(reread, low))
+    remaining = 0
+    for idx, block in zip(low, rereads):
+        if block is None:
+            remaining += 1
+        else:
+            blocks[idx] = block
+    return SealExtraction(blocks, False, False, remaining)
+
+
+def seal_row(block: dict) -> list:
+    """ブロック1件を SEAL_HEADERS の順の行にする"""
+    prep = block.get('preparations', [])
+    prep_text = ', '.join(prep) if isinstance(prep, list) else str(prep)
+    return [
+        block.get('client_name', ''),
+        block.get('class_name', ''),
+        prep_text,
+        block.get('meal_count', ''),
+        block.get('date', ''),
+        block.get('grade', '')
+    ]
+
+
+def build_seal_workbook(blocks: List[dict], seal_path: str) -> bytes:
+    """seal.xlsx (なければ書き込み専用の新規ブック) の「Gemini抽出データ」シートに blocks を書き込んで保存する"""
+    from openpyxl import Workbook, load_workbook
+    from .sheet_writer import save_workbook_bytes, write_rows
+
+    rows = [SEAL_HEADERS] + [seal_row(block) for block in blocks]
+    if not os.path.exists(seal_path):
+        # テンプレートがなければ行を流し込むだけなので、セルを保持しない書き込み専用のブックにする
+        wb = Workbook(write_only=True)
+        write_rows(wb.create_sheet(title=SEAL_SHEET_NAME), rows)
+        return save_workbook_bytes(wb)
+
+    wb = load_workbook(seal_path)
+
+    if SEAL_SHEET_NAME in wb.sheetnames:
+        ws = wb[SEAL_SHEET_NAME]
+        ws.sheet_state = 'visible'  # Make sure sheet is visible
+        ws.delete_rows(1, ws.max_row + 1)
+    else:
+        ws = wb.create_sheet(title=SEAL_SHEET_NAME)
+
+    try:
+        wb.active = ws
+    except ValueError:
+        pass  # Ignore if can't set active
+    write_rows(ws, rows)
+    return save_workbook_bytes(wb)
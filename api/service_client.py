@@ -0,0 +1,70 @@
+# service_client.py
+"""
+変換サービス (api/index.py) のクライアント。
+
+CONVERSION_SERVICE_URL が設定されていれば Streamlit はサービスに変換を依頼し、
+接続できない・混み合っている (503) 場合は ServiceUnavailable を送出する (呼び出し側はその場で変換する)。
+"""
+import base64
+import io
+import json
+import os
+import urllib.error
+import urllib.request
+import zipfile
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from .order_pipeline import OrderConversionError, OrderOutputs
+
+CONVERSION_SERVICE_URL = os.environ.get('CONVERSION_SERVICE_URL', '').rstrip('/')
+CONVERSION_SERVICE_TIMEOUT = float(os.environ.get('CONVERSION_SERVICE_TIMEOUT', '600'))
+
+
+class ServiceUnavailable(Exception):
+    """サービスに接続できない、または受付枠がない"""
+
+
+def _post(path: str, pdf_data: bytes, params: Dict[str, str], url: Optional[str]) -> bytes:
+    base = (url or CONVERSION_SERVICE_URL).rstrip('/')
+    if not base:
+        raise ServiceUnavailable('CONVERSION_SERVICE_URL is not set')
+    req = urllib.request.Request(f"{base}{path}?{urlencode(params)}", data=pdf_data, method='POST',
+                                 headers={'Content-Type': 'application/pdf'})
+    try:
+        with urllib.request.urlopen(req, timeout=CONVERSION_SERVICE_TIMEOUT) as res:
+            return res.read()
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        try:
+            message = json.loads(body)['error']
+        except Exception:
+            message = body.decode('utf-8', 'replace')[:200]
+        if e.code == 503:
+            raise ServiceUnavailable(message) from e
+        if e.code == 422:
+            raise OrderConversionError(message) from e
+        raise RuntimeError(f"conversion service error {e.code}: {message}") from e
+    except (urllib.error.URLError, ConnectionError) as e:
+        raise ServiceUnavailable(str(e)) from e
+
+
+def convert_order_remote(pdf_data: bytes, filename: str, url: str = None) -> Tuple[OrderOutputs, List[Dict]]:
+    """注文PDFをサービスで変換する。戻り値: (OrderOutputs, 段階ごとの計測)"""
+    body = _post('/convert/order', pdf_data, {'filename': filename}, url)
+    with zipfile.ZipFile(io.BytesIO(body)) as zf:
+        names = zf.namelist()
+        template = next(n for n in names if n.endswith('.xlsm'))
+        nouhinsyo = next(n for n in names if n.endswith('.xlsx'))
+        stages = json.loads(zf.read('stages.json')) if 'stages.json' in names else []
+        return OrderOutputs(zf.read(template), zf.read(nouhinsyo)), stages
+
+
+def convert_seal_remote(pdf_data: bytes, filename: str, method: str, model_name: str,
+                        use_cache: bool = True, url: str = None) -> Dict:
+    """シールPDFをサービスで変換する。戻り値の xlsx はデコード済みの bytes"""
+    params = {'filename': filename, 'method': method, 'model': model_name, 'cache': '1' if use_cache else '0',
+              'format': 'json'}
+    result = json.loads(_post('/convert/seal', pdf_data, params, url))
+    result['xlsx'] = base64.b64decode(result['xlsx'])
+    return result
@@ -0,0 +1,102 @@
+# sheet_writer.py
+"""
+openpyxl のシートへのまとめ書き込みと、圧縮レベルを指定した保存。
+
+ws.cell() はセルごとに座標の確認と辞書の検索をし、df.iterrows() は行ごとに Series を作るため、
+マスタの貼り付け (数万セル) ではこの2つが処理時間の大半を占めていた。write_rows は
+itertuples の値のタプルからセルを直接作ってシートに登録し、書き込み専用のシート
+(Workbook(write_only=True)) には行をそのまま append する。文字列の値は openpyxl がセルごとに
+正規表現で不正な文字を確かめるため、行の文字列をまとめて1回だけ確かめ、問題がなければ型の判定を省いて登録する。
+保存時の zip の圧縮レベルは XLSX_COMPRESSLEVEL (0〜9、1 は速く 9 は小さい。未設定は zlib の既定値)。
+"""
+import datetime
+import io
+import itertools
+import os
+import zipfile
+from typing import Iterable, Optional, Sequence
+
+import pandas as pd
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE, Cell
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+from openpyxl.writer.excel import ExcelWriter
+
+_level = os.environ.get('XLSX_COMPRESSLEVEL', '').strip()
+COMPRESSLEVEL: Optional[int] = int(_level) if _level else None
+
+# openpyxl が文字列をそのまま保持する上限 (超える分は切り詰められる)
+_MAX_STRING = 32767
+
+
+def _plain_strings(row: Sequence) -> bool:
+    """行の文字列の値がすべて、openpyxl で変換・型の判定が不要なもの (数式・エラー値・不正な文字・上限超えでない) か"""
+    strings = [v for v in row if type(v) is str]
+    if not strings:
+        return False
+    for v in strings:
+        # 数式は '=' で始まり、エラー値 (#N/A など) は '#' で始まる
+        if v[:1] in ('=', '#') or len(v) > _MAX_STRING:
+            return False
+    return ILLEGAL_CHARACTERS_RE.search('\n'.join(strings)) is None
+
+
+def write_rows(ws, rows: Iterable[Sequence], start_row: int = 1, start_col: int = 1) -> int:
+    """
+    rows (値の並びの列) を start_row 行目・start_col 列目から1行ずつ書き込む。戻り値: 書き込んだ行数
+    既存のセルは値だけを書き換える (書式はそのまま)。
+    """
+    if isinstance(ws, WriteOnlyWorksheet):
+        # 書き込み専用のシートは先頭から順に追記するしかないため、空の行・列で位置を合わせる
+        for _ in range(start_row - 1):
+            ws.append([])
+        pad = [None] * (start_col - 1)
+        count = 0
+        for row in rows:
+            ws.append(pad + list(row))
+            count += 1
+        return count
+
+    cells = ws._cells
+    r_idx = start_row - 1
+    for r_idx, row in enumerate(rows, start=start_row):
+        plain = _plain_strings(row)
+        for c_idx, value in enumerate(row, start=start_col):
+            cell = cells.get((r_idx, c_idx))
+            if cell is None:
+                cell = cells[(r_idx, c_idx)] = Cell(ws, row=r_idx, column=c_idx)
+            if plain and type(value) is str:
+                # cell.value = value と同じ結果 (確認済みの文字列)
+                cell._value = value
+                cell.data_type = 's'
+            else:
+                cell.value = value
+    count = r_idx - start_row + 1
+    if count:
+        # ws.append の書き込み位置 (ws.cell() を使った場合と同じく更新する)
+        ws._current_row = max(ws._current_row, r_idx)
+    return count
+
+
+def write_dataframe(ws, df: pd.DataFrame, start_row: int = 1, start_col: int = 1, header: bool = False) -> int:
+    """DataFrameの値 (header=True なら列名の行から) を write_rows で書き込む。戻り値: 書き込んだ行数"""
+    rows = df.itertuples(index=False, name=None)
+    if header:
+        rows = itertools.chain([tuple(df.columns)], rows)
+    return write_rows(ws, rows, start_row, start_col)
+
+
+def clear_values(ws, start_row: int = 1, max_col: Optional[int] = None):
+    """start_row 行目以降 (max_col 列目まで) の既存セルの値を空にする (書式は残す)"""
+    for (row, col), cell in ws._cells.items():
+        if row >= start_row and (max_col is None or col <= max_col):
+            cell.value = None
+
+
+def save_workbook_bytes(wb, compresslevel: Optional[int] = COMPRESSLEVEL) -> bytes:
+    """wb.save() と同じ内容を、compresslevel で圧縮したバイト列として返す"""
+    out = io.BytesIO()
+    archive = zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=compresslevel)
+    # openpyxl.writer.excel.save_workbook と同じく更新日時を保存時刻にする
+    wb.properties.modified = datetime.datetime.utcnow()
+    ExcelWriter(wb, archive).save()
+    return out.getvalue()
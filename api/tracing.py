@@ -0,0 +1,134 @@
+# tracing.py
+"""
+変換処理の段階ごとの計測 (経過時間・CPU時間・RSSの増減・tracemallocの最大使用量)。
+
+    trace = RunTrace('order', file='注文.pdf')
+    with trace.span('parse'):
+        ...
+    trace.log()        # 1段階1行のJSONを 'mamameal.trace' ロガーへ
+    trace.records      # 画面表示・レポート用の dict のリスト
+
+span は入れ子にでき、記録は終了順ではなく開始順に並ぶ。tracemalloc は処理が
+数倍遅くなるため PIPELINE_TRACE_MEMORY=1 (または trace_memory=True) のときだけ使う。
+ログは標準エラー出力に出し、PIPELINE_TRACE_LOG を指定するとそのファイルにも追記する。
+RSS は段階の終了時の値 (rss_mib) と開始時からの増減 (rss_delta_mib) で、/proc/self/statm の読めない
+環境では記録しない。合計の行の process_rss_peak_mib はプロセス起動からの最大RSSで、その回の変換の値ではない。
+"""
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_MEMORY = os.environ.get('PIPELINE_TRACE_MEMORY', '0') == '1'
+TRACE_LOG = os.environ.get('PIPELINE_TRACE_LOG', '')
+
+logger = logging.getLogger('mamameal.trace')
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    if TRACE_LOG:
+        logger.addHandler(logging.FileHandler(TRACE_LOG, encoding='utf-8'))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def current_rss_mib() -> Optional[float]:
+    """プロセスの現在のRSS (MiB)。/proc/self/statm の読めない環境では None"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(resident * os.sysconf('SC_PAGE_SIZE') / 2**20, 1)
+
+
+def process_peak_rss_mib() -> Optional[float]:
+    """プロセス起動からの最大RSS (MiB)。取得できない環境では None"""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KiB、macOS はバイト
+    return round(maxrss / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+class RunTrace:
+    """1回の変換の計測結果"""
+
+    def __init__(self, pipeline: str, trace_memory: bool = None, enabled: bool = True, **attrs):
+        self.pipeline = pipeline
+        self.run_id = uuid.uuid4().hex[:12]
+        self.attrs = attrs
+        self.enabled = enabled
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self.records: List[Dict[str, Any]] = []
+        self._stack: List[Dict[str, Any]] = []
+        self._started_tracemalloc = False
+
+    @classmethod
+    def disabled(cls) -> 'RunTrace':
+        """何も記録しないトレース (trace 引数を省略したときの既定値)"""
+        return cls('', enabled=False)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # 親の span の最大値を退避してから、この span の分を測り直す
+            if self._stack:
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        name = f"{self._stack[-1]['stage']}.{name}" if self._stack else name
+        record = {'stage': name, 'depth': len(self._stack), **attrs, '_peak': 0}
+        self.records.append(record)
+        self._stack.append(record)
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss_mib()
+        try:
+            yield
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu, 4)
+            if rss is not None:
+                record['rss_mib'] = current_rss_mib()
+                record['rss_delta_mib'] = round(record['rss_mib'] - rss, 1)
+            self._stack.pop()
+            peak = record.pop('_peak')
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record['py_peak_mib'] = round(peak / 2**20, 2)
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+                tracemalloc.reset_peak()
+            if not self._stack and self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    @property
+    def total_wall_s(self) -> float:
+        return round(sum(r.get('wall_s', 0) for r in self.records if r['depth'] == 0), 4)
+
+    def log(self, **extra):
+        """各段階と合計を1行ずつJSONでログに出す"""
+        if not self.enabled:
+            return
+        base = {'pipeline': self.pipeline, 'run_id': self.run_id, **self.attrs, **extra}
+        for record in self.records:
+            logger.info(json.dumps({**base, **record}, ensure_ascii=False, default=str))
+        logger.info(json.dumps({**base, 'stage': 'total', 'depth': 0, 'wall_s': self.total_wall_s,
+                                'rss_mib': current_rss_mib(), 'process_rss_peak_mib': process_peak_rss_mib()},
+                               ensure_ascii=False, default=str))
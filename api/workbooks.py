@@ -0,0 +1,142 @@
+# workbooks.py
+"""
+数出表 (template.xlsm)・納品書 (nouhinsyo.xlsx) テンプレートの準備。
+
+テンプレートへのマスタ貼り付けはマスタが変わらない限り毎回同じ結果になるため、
+「テンプレート + 現在のマスタ貼り付け済み」の状態をpickleしたスナップショットとして
+(テンプレートのハッシュ, マスタの版) ごとにキャッシュし、各リクエストにはその複製を渡す。
+複製はpickleの復元だけで済み、load_workbook とマスタの貼り付けより大幅に速い。
+"""
+import copyreg
+import io
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict
+from zipfile import ZipFile
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.indexed_list import IndexedList
+
+from .masters import file_sha256, master_version
+from .pdf_utils import paste_dataframe_to_sheet
+from .sheet_writer import save_workbook_bytes
+from .xlsx_patch import SheetPatch, apply_sheet_patches, patch_workbook
+
+logger = logging.getLogger(__name__)
+
+# 出力エンジン: 'patch' はシートXMLを直接書き換える (失敗時は openpyxl)、'openpyxl' は常に openpyxl
+XLSX_WRITER = os.environ.get('XLSX_WRITER', 'patch')
+
+_SNAPSHOT_CACHE: 'OrderedDict[tuple, PreparedTemplate]' = OrderedDict()
+_SNAPSHOT_CACHE_SIZE = 4
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+def clear_sheet(ws):
+    """Clear all cells in a worksheet."""
+    if ws.max_row > 0:
+        ws.delete_rows(1, ws.max_row)
+
+
+def paste_masters(wb, masters: Dict[str, pd.DataFrame]):
+    """
+    マスタをシート名ごとにクリアして貼り付ける (空のマスタ・存在しないシートは飛ばす)。
+    行がなく列だけあるマスタ (master_join.master_header) はヘッダーだけを貼り付ける。
+    """
+    for sheet_name, df in masters.items():
+        if df is not None and len(df.columns) and sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+            clear_sheet(ws)
+            paste_dataframe_to_sheet(ws, df)
+
+
+def _rebuild_indexed_list(items, state):
+    indexed = IndexedList.__new__(IndexedList)
+    list.extend(indexed, items)
+    indexed.__dict__.update(state)
+    return indexed
+
+def _reduce_indexed_list(indexed):
+    # 既定のpickleは IndexedList.append 経由で要素を戻すため重複した要素が落ち、
+    # セルが参照するスタイル番号がずれる。リストと索引をそのまま復元する。
+    return _rebuild_indexed_list, (list(indexed), dict(indexed.__dict__))
+
+def _dumps_workbook(wb) -> bytes:
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[IndexedList] = _reduce_indexed_list
+    pickler.dump(wb)
+    return buf.getvalue()
+
+
+class PreparedTemplate:
+    """マスタ貼り付け済みテンプレートのスナップショット"""
+
+    def __init__(self, path: str, keep_vba: bool, masters: Dict[str, pd.DataFrame]):
+        self.path = path
+        self.keep_vba = keep_vba
+        with open(path, 'rb') as f:
+            self.template_data = f.read()
+        wb = load_workbook(io.BytesIO(self.template_data), keep_vba=keep_vba)
+        paste_masters(wb, masters)
+        self.sheetnames = wb.sheetnames
+        # VBAを保持するアーカイブ (ZipFile) はpickleできないため、複製時にテンプレートから作り直す
+        wb.vba_archive = None
+        self._snapshot = _dumps_workbook(wb)
+        self._package = None
+
+    def clone(self):
+        """スナップショットから新しいWorkbookを作る (マスタの貼り付けは済んでいる)"""
+        wb = pickle.loads(self._snapshot)
+        if self.keep_vba:
+            wb.vba_archive = ZipFile(io.BytesIO(self.template_data))
+        return wb
+
+    @property
+    def package(self) -> bytes:
+        """スナップショットを保存したxlsx/xlsmのバイト列 (パッチ書き込みの元になる)"""
+        self.warm('patch')
+        return self._package
+
+    def warm(self, engine: str = None):
+        """engine での書き込みに使うものを先に作っておく (パッチ書き込みなら保存済みパッケージ。初回のみ)"""
+        if (engine or XLSX_WRITER) == 'patch' and self._package is None:
+            # パッチ書き込みでは書き換えないパートをこの圧縮のままコピーするため、出力の圧縮レベルもここで決まる
+            self._package = save_workbook_bytes(self.clone())
+
+
+def get_prepared_template(path: str, masters: Dict[str, pd.DataFrame], keep_vba: bool = False) -> PreparedTemplate:
+    """(テンプレートのハッシュ, マスタの版) ごとに PreparedTemplate を一度だけ作って使い回す"""
+    key = (
+        file_sha256(path), keep_vba,
+        tuple((name, master_version(df) if df is not None else None) for name, df in sorted(masters.items())),
+    )
+    with _SNAPSHOT_LOCK:
+        prepared = _SNAPSHOT_CACHE.get(key)
+        if prepared is not None:
+            _SNAPSHOT_CACHE.move_to_end(key)
+            return prepared
+    prepared = PreparedTemplate(path, keep_vba, masters)
+    with _SNAPSHOT_LOCK:
+        _SNAPSHOT_CACHE[key] = prepared
+        while len(_SNAPSHOT_CACHE) > _SNAPSHOT_CACHE_SIZE:
+            _SNAPSHOT_CACHE.popitem(last=False)
+    return prepared
+
+
+def build_workbook(prepared: PreparedTemplate, patches: Dict[str, SheetPatch], engine: str = None) -> bytes:
+    """スナップショットに patches を書き込み、保存済みのバイト列を返す"""
+    engine = engine or XLSX_WRITER
+    if engine == 'patch':
+        try:
+            return patch_workbook(prepared.package, patches)
+        except Exception:
+            logger.warning("sheet XML patch failed for %s; falling back to openpyxl", prepared.path, exc_info=True)
+    wb = prepared.clone()
+    apply_sheet_patches(wb, patches)
+    return save_workbook_bytes(wb)
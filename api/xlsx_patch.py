@@ -0,0 +1,309 @@
+# xlsx_patch.py
+"""
+xlsx/xlsm パッケージを zip のまま書き換える出力エンジン。
+
+openpyxl でブック全体を読み込んで保存し直す代わりに、書き込み対象のワークシートXMLだけを
+作り直し、それ以外のパート (vbaProject.bin を含む) は圧縮済みのバイト列のままコピーする。
+書き込み内容は SheetPatch で表し、apply_sheet_patches で openpyxl にも同じ内容を適用できる
+(パッチに失敗した場合のフォールバック用)。
+
+書き込む文字列は共有文字列 (sharedStrings.xml) に追加せず、セル内の文字列 (t="inlineStr") として書く。
+openpyxl 経由の出力とはセルの型の表現が違うが、Excel で開いたときの値は同じ。
+"""
+import datetime
+import io
+import math
+import numbers
+import posixpath
+import re
+import sys
+import zipfile
+from typing import Dict, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.exceptions import IllegalCharacterError
+
+from .pdf_utils import safe_write_df
+from .sheet_writer import COMPRESSLEVEL, write_rows
+
+_SHEET_DATA_RE = re.compile(r'<sheetData\s*/>|<sheetData>(.*?)</sheetData>', re.S)
+_ROW_RE = re.compile(r'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_REF_RE = re.compile(r'^([A-Z]+)(\d+)$')
+_DIMENSION_RE = re.compile(r'<dimension\b[^>]*/>')
+_CALC_PR_RE = re.compile(r'<calcPr\b([^>]*?)/>')
+
+CALC_CHAIN_PART = 'xl/calcChain.xml'
+
+
+class SheetPatch:
+    """
+    1シート分の書き込み内容 (DataFrameの値をヘッダーなしで start_row 行目・1列目から書き込む)。
+    clear=True の場合は safe_write_df と同じく、書き込み前に start_row 〜 最終行+1 の
+    1〜列数+1 列を空にする。
+    """
+
+    def __init__(self, df: pd.DataFrame, clear: bool = False, start_row: int = 1):
+        self.df = df
+        self.clear = clear
+        self.start_row = start_row
+
+    @classmethod
+    def paste(cls, df: pd.DataFrame) -> 'SheetPatch':
+        """貼り付け用シートへの書き込み (クリアせずに A1 から上書き)"""
+        return cls(df)
+
+    @classmethod
+    def safe_write(cls, df: pd.DataFrame, start_row: int = 1) -> 'SheetPatch':
+        """safe_write_df と同じ書き込み"""
+        return cls(df, clear=True, start_row=start_row)
+
+    @property
+    def clear_columns(self) -> int:
+        return self.df.shape[1] + 1 if self.clear else 0
+
+    def iter_rows(self):
+        return self.df.itertuples(index=False)
+
+
+def apply_sheet_patches(wb, patches: Dict[str, SheetPatch]):
+    """openpyxl の Workbook に SheetPatch を適用する (パッチ書き込みのフォールバック)"""
+    for sheet_name, patch in patches.items():
+        ws = wb[sheet_name]
+        if patch.clear:
+            safe_write_df(ws, patch.df, start_row=patch.start_row)
+            continue
+        write_rows(ws, patch.iter_rows(), start_row=patch.start_row)
+
+
+# ──────────────────────────────────────────────
+# セルXMLの生成 (openpyxl の書き出しと同じ型判定)
+# ──────────────────────────────────────────────
+def _cell_xml(ref: str, value, style: Optional[str]) -> str:
+    attrs = f' r="{ref}"' + (f' s="{style}"' if style is not None else '')
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c{attrs} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Number):
+        if math.isnan(value) or math.isinf(value):
+            return f'<c{attrs} t="n"><v/></c>'
+        return f'<c{attrs} t="n"><v>{"%.16g" % value}</v></c>'
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        # 日付の書式設定は openpyxl に任せる
+        raise TypeError('date values are written through openpyxl')
+    if not isinstance(value, str):
+        value = str(value)
+    value = value[:32767]
+    if ILLEGAL_CHARACTERS_RE.search(value):
+        raise IllegalCharacterError(f"{value} cannot be used in worksheets.")
+    if len(value) > 1 and value.startswith('='):
+        return f'<c{attrs}><f>{escape(value[1:])}</f><v/></c>'
+    if value in ERROR_CODES:
+        return f'<c{attrs} t="e"><v>{escape(value)}</v></c>'
+    if value == '':
+        return f'<c{attrs} t="inlineStr"/>'
+    stripped = value.strip()
+    space = ' xml:space="preserve"' if stripped and stripped != value else ''
+    return f'<c{attrs} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+
+
+def _empty_cell_xml(ref: str, style: Optional[str]) -> Optional[str]:
+    # openpyxl は値もスタイルもないセルを書き出さない
+    return f'<c r="{ref}" s="{style}"/>' if style is not None else None
+
+
+# ──────────────────────────────────────────────
+# ワークシートXMLの書き換え
+# ──────────────────────────────────────────────
+def _parse_sheet_data(inner: str) -> Dict[int, Tuple[str, Dict[int, Tuple[Optional[str], str]]]]:
+    """sheetData を {行番号: (rowの属性, {列番号: (スタイル, セルXML)})} に分解する"""
+    rows = {}
+    for row_match in _ROW_RE.finditer(inner):
+        row_attrs = dict(_ATTR_RE.findall(row_match.group(1)))
+        if 'r' not in row_attrs:
+            raise ValueError('row element without r attribute')
+        cells = {}
+        for cell_match in _CELL_RE.finditer(row_match.group(2) or ''):
+            cell_attrs = dict(_ATTR_RE.findall(cell_match.group(1)))
+            ref = _REF_RE.match(cell_attrs.get('r', ''))
+            if not ref:
+                raise ValueError('cell element without r attribute')
+            cells[column_index_from_string(ref.group(1))] = (cell_attrs.get('s'), cell_match.group(0))
+        rows[int(row_attrs['r'])] = (row_match.group(1), cells)
+    return rows
+
+
+def _row_xml(row_number: int, raw_attrs: Optional[str], cells: Dict[int, Tuple[Optional[str], str]]) -> str:
+    if raw_attrs is None:
+        attrs = f' r="{row_number}"'
+    else:
+        # spans は列範囲のヒントなので書き換え後は外す
+        attrs = re.sub(r'\s+spans="[^"]*"', '', raw_attrs)
+    body = ''.join(xml for _, (_, xml) in sorted(cells.items()) if xml)
+    return f'<row{attrs}>{body}</row>' if body else f'<row{attrs}/>'
+
+
+def patch_sheet_xml(xml: str, patch: SheetPatch) -> str:
+    match = _SHEET_DATA_RE.search(xml)
+    if match is None:
+        raise ValueError('sheetData not found')
+    rows = _parse_sheet_data(match.group(1) or '')
+    cell_rows = [r for r, (_, cells) in rows.items() if cells]
+    max_row = max(cell_rows) if cell_rows else 1
+
+    def cells_of(row_number):
+        if row_number not in rows:
+            rows[row_number] = (None, {})
+        return rows[row_number][1]
+
+    if patch.clear_columns and max_row >= patch.start_row:
+        for row_number in range(patch.start_row, max_row + 2):
+            cells = rows.get(row_number, (None, {}))[1]
+            for col in range(1, patch.clear_columns + 1):
+                if col in cells:
+                    style = cells[col][0]
+                    cells[col] = (style, _empty_cell_xml(f'{get_column_letter(col)}{row_number}', style))
+
+    for row_number, values in enumerate(patch.iter_rows(), start=patch.start_row):
+        for col, value in enumerate(values, start=1):
+            if value is None:
+                continue
+            cells = cells_of(row_number)
+            style = cells[col][0] if col in cells else None
+            cells[col] = (style, _cell_xml(f'{get_column_letter(col)}{row_number}', value, style))
+
+    body = ''.join(_row_xml(r, raw_attrs, cells) for r, (raw_attrs, cells) in sorted(rows.items()))
+    xml = xml[:match.start()] + f'<sheetData>{body}</sheetData>' + xml[match.end():]
+
+    occupied = [(r, c) for r, (_, cells) in rows.items() for c, (_, cell) in cells.items() if cell]
+    if occupied:
+        min_row, max_row = min(r for r, _ in occupied), max(r for r, _ in occupied)
+        min_col, max_col = min(c for _, c in occupied), max(c for _, c in occupied)
+        ref = f'{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}'
+        xml = _DIMENSION_RE.sub(f'<dimension ref="{ref}"/>', xml, count=1)
+    return xml
+
+
+# ──────────────────────────────────────────────
+# パッケージ (zip) の書き換え
+# ──────────────────────────────────────────────
+def _sheet_parts(zin: zipfile.ZipFile) -> Dict[str, str]:
+    """シート名 → ワークシートXMLのパート名"""
+    workbook_xml = zin.read('xl/workbook.xml').decode('utf-8')
+    rels_xml = zin.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+    targets = {}
+    for rel in re.finditer(r'<Relationship\b([^>]*)/?>', rels_xml):
+        attrs = dict(_ATTR_RE.findall(rel.group(1)))
+        target = attrs.get('Target', '')
+        target = target[1:] if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        targets[attrs.get('Id')] = target
+    parts = {}
+    for sheet in re.finditer(r'<sheet\b([^>]*)/?>', workbook_xml):
+        attrs = dict(_ATTR_RE.findall(sheet.group(1)))
+        rel_id = next((v for k, v in attrs.items() if k.endswith(':id')), None)
+        parts[_unescape_attr(attrs.get('name', ''))] = targets.get(rel_id)
+    return parts
+
+
+def _unescape_attr(value: str) -> str:
+    return (value.replace('&quot;', '"').replace('&apos;', "'")
+            .replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&'))
+
+
+def _drop_calc_chain(name: str, data: bytes) -> bytes:
+    text = data.decode('utf-8')
+    if name == '[Content_Types].xml':
+        text = re.sub(r'<Override\b[^>]*PartName="/xl/calcChain.xml"[^>]*/>', '', text)
+    elif name == 'xl/_rels/workbook.xml.rels':
+        text = re.sub(r'<Relationship\b[^>]*Target="[^"]*calcChain.xml"[^>]*/>', '', text)
+    return text.encode('utf-8')
+
+
+def _ensure_full_calc_on_load(data: bytes) -> bytes:
+    # 書き込んだセルを参照する数式のキャッシュ値は古いため、開いたときに再計算させる
+    text = data.decode('utf-8')
+    match = _CALC_PR_RE.search(text)
+    if match is None or 'fullCalcOnLoad=' in match.group(1):
+        return data
+    text = text[:match.start()] + f'<calcPr{match.group(1)} fullCalcOnLoad="1"/>' + text[match.end():]
+    return text.encode('utf-8')
+
+
+# 圧縮データのままのコピーは zipfile の内部 (fp・filelist・NameToInfo・start_dir・FileHeader) を使うため、
+# 内部の作りが同じ版 (3.8〜3.13) だけで行う。それ以外は展開して圧縮し直す (遅いが公開APIのみ)
+_RAW_COPY = (3, 8) <= sys.version_info[:2] <= (3, 13) and hasattr(zipfile, 'sizeFileHeader') \
+    and hasattr(zipfile.ZipInfo, 'FileHeader')
+
+
+def _copy_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """圧縮済みのデータを展開せずにそのままコピーする (ZIP64 が要る大きさのパートは圧縮し直す)"""
+    if not _RAW_COPY or max(info.file_size, info.compress_size, zout.fp.tell()) >= zipfile.ZIP64_LIMIT:
+        zout.writestr(info, zin.read(info))
+        return
+    zin.fp.seek(info.header_offset)
+    header = zin.fp.read(zipfile.sizeFileHeader)
+    name_len, extra_len = int.from_bytes(header[26:28], 'little'), int.from_bytes(header[28:30], 'little')
+    zin.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+    raw = zin.fp.read(info.compress_size)
+
+    out_info = zipfile.ZipInfo(info.filename, info.date_time)
+    out_info.compress_type = info.compress_type
+    out_info.external_attr = info.external_attr
+    out_info.create_system = info.create_system
+    out_info.flag_bits = info.flag_bits & ~0x08
+    out_info.CRC, out_info.compress_size, out_info.file_size = info.CRC, info.compress_size, info.file_size
+    out_info.header_offset = zout.fp.tell()
+    zout.fp.write(out_info.FileHeader(False))
+    zout.fp.write(raw)
+    zout.filelist.append(out_info)
+    zout.NameToInfo[out_info.filename] = out_info
+    zout.start_dir = zout.fp.tell()
+
+
+def _rewritten_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """書き換えたパートの ZipInfo。日時は元のパートのものを使い、同じ入力なら同じバイト列になるようにする"""
+    out_info = zipfile.ZipInfo(info.filename, info.date_time)
+    out_info.external_attr = 0o600 << 16
+    return out_info
+
+
+def patch_workbook(package: bytes, patches: Dict[str, SheetPatch], compresslevel: Optional[int] = COMPRESSLEVEL) -> bytes:
+    """
+    package (xlsx/xlsm のバイト列) の指定シートに patches を書き込んだ新しいパッケージを返す。
+    書き換えたパートだけ compresslevel で圧縮し直し、それ以外は圧縮データのままコピーする。
+    出力は package と patches だけで決まる (実行時刻などに依存しない)。
+    """
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(package)) as zin:
+        parts = _sheet_parts(zin)
+        targets = {}
+        for sheet_name, patch in patches.items():
+            part = parts.get(sheet_name)
+            if part is None:
+                raise KeyError(f'Worksheet {sheet_name} does not exist.')
+            targets[part] = patch
+        has_calc_chain = CALC_CHAIN_PART in zin.NameToInfo
+
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zout:
+            for info in zin.infolist():
+                name = info.filename
+                if name == CALC_CHAIN_PART:
+                    continue
+                if name in targets:
+                    xml = patch_sheet_xml(zin.read(name).decode('utf-8'), targets[name])
+                    zout.writestr(_rewritten_info(info), xml.encode('utf-8'), zipfile.ZIP_DEFLATED, compresslevel)
+                elif name == 'xl/workbook.xml':
+                    zout.writestr(_rewritten_info(info), _ensure_full_calc_on_load(zin.read(name)),
+                                  zipfile.ZIP_DEFLATED, compresslevel)
+                elif has_calc_chain and name in ('[Content_Types].xml', 'xl/_rels/workbook.xml.rels'):
+                    zout.writestr(_rewritten_info(info), _drop_calc_chain(name, zin.read(name)),
+                                  zipfile.ZIP_DEFLATED, compresslevel)
+                elif info.flag_bits & 0x01:
+                    zout.writestr(info, zin.read(name))
+                else:
+                    _copy_raw(zin, zout, info)
+    return out.getvalue()
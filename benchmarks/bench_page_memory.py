@@ -0,0 +1,78 @@
+"""
+注文PDFのページ走査のメモリ使用量がページ数に比例しないことを確認する。
+
+    python benchmarks/bench_page_memory.py --pages 2 200 --ceiling-mb 48
+
+ページ数ごとに新しいプロセスで synthetic_pdfs の注文PDFを作り、貼り付け用シートの抽出と
+弁当表・クライアント情報の走査 (collect_page_tasks) を tracemalloc を有効にして実行する。
+Pythonヒープの最大使用量が --ceiling-mb (既定: PDF_MEMORY_CEILING_MB または 48) を
+超えたページ数があれば終了コード 1 を返すので、CIなどでの上限の確認に使える。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, resource, sys, time, tracemalloc
+sys.path.insert(0, %(root)r)
+sys.path.insert(0, %(benchmarks)r)
+from synthetic_pdfs import order_pdf
+from api.pdf_utils import ParsedOrderPdf, collect_page_tasks, pdf_to_excel_data_for_paste_sheet
+data = order_pdf(pages=%(pages)d, clients=%(clients)d, seed=0)
+tracemalloc.start()
+base = tracemalloc.get_traced_memory()[0]
+start = time.perf_counter()
+with ParsedOrderPdf(data) as pdf:
+    pdf_to_excel_data_for_paste_sheet(pdf)
+    outcome = collect_page_tasks(('bento_table', 'client_info'), pdf, workers=0)
+elapsed = time.perf_counter() - start
+peak = tracemalloc.get_traced_memory()[1] - base
+print(json.dumps({
+    'pages': %(pages)d, 'seconds': elapsed, 'py_peak_mib': peak / 2**20,
+    'rss_peak_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'clients': len(outcome['client_info'][0]), 'tables': len(outcome['bento_table'][0]),
+}))
+'''
+
+
+def probe(pages, clients, env):
+    code = PROBE % {'root': ROOT, 'benchmarks': os.path.join(ROOT, 'benchmarks'), 'pages': pages, 'clients': clients}
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=env)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, nargs='+', default=[2, 200], help='測定するページ数')
+    parser.add_argument('--clients', type=int, default=20, help='1ページあたりのクライアント数')
+    parser.add_argument('--ceiling-mb', type=float,
+                        default=float(os.environ.get('PDF_MEMORY_CEILING_MB', '48')),
+                        help='Pythonヒープの最大使用量の上限 (MiB)')
+    parser.add_argument('--keep', type=int, help='PDF_PAGE_KEEP_PARSED の値')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.keep is not None:
+        env['PDF_PAGE_KEEP_PARSED'] = str(args.keep)
+
+    print(f"{'pages':>6} {'seconds':>8} {'py_peak[MiB]':>13} {'rss_peak[MiB]':>14} {'clients':>8}")
+    exceeded = []
+    for pages in args.pages:
+        result = probe(pages, args.clients, env)
+        print(f"{pages:>6} {result['seconds']:>8.2f} {result['py_peak_mib']:>13.1f} {result['rss_peak_mib']:>14.1f} "
+              f"{result['clients']:>8}")
+        if result['py_peak_mib'] > args.ceiling_mb:
+            exceeded.append(pages)
+    if exceeded:
+        print(f"\nceiling {args.ceiling_mb} MiB exceeded for pages: {exceeded}")
+        return 1
+    print(f"\nall within {args.ceiling_mb} MiB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+注文PDFのページ並列処理 (PDF_PAGE_WORKERS) のスケーリングを測定する。
+
+    python benchmarks/bench_page_parallel.py path/to/order.pdf --max-workers 4 --chunk-size 4
+
+ワーカー数 1 (逐次処理) から --max-workers まで、クライアント抽出と弁当表抽出の
+所要時間を表示し、並列処理の結果が逐次処理と一致することを確認する。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.pdf_utils import extract_detailed_client_info_from_pdf, extract_table_from_pdf_for_bento
+
+
+def run_once(pdf_bytes, workers, chunk_size):
+    start = time.perf_counter()
+    clients = extract_detailed_client_info_from_pdf(pdf_bytes, workers=workers, chunk_size=chunk_size)
+    tables = extract_table_from_pdf_for_bento(pdf_bytes, workers=workers, chunk_size=chunk_size)
+    return time.perf_counter() - start, (clients, tables)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf', help='注文PDFのパス')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with open(args.pdf, 'rb') as f:
+        pdf_bytes = f.read()
+
+    baseline_time, baseline = None, None
+    print(f"{'workers':>7} {'best[s]':>9} {'speedup':>8}  identical")
+    for workers in range(1, args.max_workers + 1):
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, result = run_once(pdf_bytes, workers, args.chunk_size)
+            timings.append(elapsed)
+        best = min(timings)
+        if baseline is None:
+            baseline_time, baseline = best, result
+        print(f"{workers:>7} {best:>9.3f} {baseline_time / best:>7.2f}x  {result == baseline}")
+
+
+if __name__ == '__main__':
+    main()
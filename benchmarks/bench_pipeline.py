@@ -0,0 +1,193 @@
+"""
+注文PDF → 数出表・納品書、シールPDF → シールデータの各段階の所要時間とメモリを測定する。
+
+    python benchmarks/bench_pipeline.py --pages 4 --clients 20 --seal-pages 2
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/pipeline-20251201-120000.json
+
+PDFは synthetic_pdfs で毎回同じ内容 (--seed) を生成する。各段階を --repeat 回実行して
+最短・中央値を取り、別に1回 tracemalloc を有効にしてPythonヒープの最大使用量を測る。
+結果はJSON (既定: benchmarks/results/pipeline-<日時>.json) に保存し、--compare で以前の結果との比を表示する。
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.masters import load_master_csv
+from api.order_pipeline import (
+    ASSETS_DIR, NOUHINSYO_NAME, TEMPLATE_NAME, bento_sheet_for_nouhinsyo, convert_order_pdf, load_order_resources,
+)
+from api.pdf_utils import (
+    MATCH_COLUMNS, ParsedOrderPdf, export_detailed_client_data_to_dataframe, extract_bento_range_for_bento,
+    extract_detailed_client_info_from_pdf, extract_seal_blocks_from_pdf, extract_table_from_pdf_for_bento,
+    find_correct_anchor_for_bento, match_bento_data, pdf_to_excel_data_for_paste_sheet,
+)
+from api.product_matcher import ProductMatcher
+from api.seal import build_seal_workbook
+from api.workbooks import PreparedTemplate, build_workbook
+from api.xlsx_patch import SheetPatch
+
+from synthetic_pdfs import order_pdf, seal_pdf
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def measure(name, func, setup=None, repeat=3, trace_memory=True):
+    """setup() の戻り値を func に渡して repeat 回計測する (setup の時間は含めない)"""
+    timings, result = [], None
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        result = func(arg) if setup else func()
+        timings.append(time.perf_counter() - start)
+    peak = None
+    if trace_memory:
+        arg = setup() if setup else None
+        tracemalloc.start()
+        func(arg) if setup else func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    stage = {
+        'stage': name,
+        'best_s': round(min(timings), 4),
+        'median_s': round(statistics.median(timings), 4),
+        'peak_mib': round(peak / 2**20, 2) if peak is not None else None,
+    }
+    print(f"{name:<28} {stage['best_s']:>9.4f} {stage['median_s']:>9.4f} {stage['peak_mib'] if peak is not None else '-':>9}")
+    return stage, result
+
+
+def bento_list_of(parsed):
+    tables = extract_table_from_pdf_for_bento(parsed)
+    main_table = max(tables, key=len)
+    return extract_bento_range_for_bento(main_table, find_correct_anchor_for_bento(main_table))
+
+
+def run(args):
+    order_data = order_pdf(pages=args.pages, clients=args.clients, bentos=args.bentos, seed=args.seed)
+    seal_data, _ = seal_pdf(pages=args.seal_pages, seed=args.seed)
+    product_master, _ = load_master_csv(args.assets, '商品マスタ')
+    customer_master, _ = load_master_csv(args.assets, '得意先マスタ')
+    stages = []
+
+    def stage(name, func, setup=None, repeat=None):
+        result, value = measure(name, func, setup, repeat or args.repeat, not args.no_memory)
+        stages.append(result)
+        return value
+
+    fresh = lambda: ParsedOrderPdf(order_data)  # noqa: E731  ページのキャッシュを使わないよう毎回開き直す
+
+    print(f"{'stage':<28} {'best[s]':>9} {'median[s]':>9} {'peak[MiB]':>9}")
+    stage('order.parse', fresh)
+    df_paste = stage('order.paste_sheet', pdf_to_excel_data_for_paste_sheet, setup=fresh)
+    bento_list = stage('order.bento_table', bento_list_of, setup=fresh)
+    stage('order.matcher_build', lambda: ProductMatcher.from_master_df(product_master))
+    matched = stage('order.match', lambda: match_bento_data(bento_list, product_master))
+    df_bento = pd.DataFrame(matched, columns=MATCH_COLUMNS)
+    df_client = stage('order.client_info',
+                      lambda p: export_detailed_client_data_to_dataframe(extract_detailed_client_info_from_pdf(p)),
+                      setup=fresh)
+
+    masters = {'商品マスタ': product_master, '得意先マスタ': customer_master}
+    template = stage('template.prepare',
+                     lambda: PreparedTemplate(os.path.join(args.assets, TEMPLATE_NAME), True, masters),
+                     repeat=1)
+    nouhinsyo = PreparedTemplate(os.path.join(args.assets, NOUHINSYO_NAME), False, {'得意先マスタ': customer_master})
+    stage('template.save', lambda: template.clone().save(io.BytesIO()), repeat=1)
+    template.package, nouhinsyo.package  # パッチ書き込みの元を先に作っておく
+
+    template_patches = {'貼り付け用': SheetPatch.paste(df_paste), '注文弁当の抽出': SheetPatch.safe_write(df_bento),
+                        'クライアント抽出': SheetPatch.safe_write(df_client)}
+    nouhinsyo_patches = {'貼り付け用': SheetPatch.paste(df_paste), 'クライアント抽出': SheetPatch.safe_write(df_client)}
+    df_bento_nouhin = bento_sheet_for_nouhinsyo(df_bento, product_master)
+    if df_bento_nouhin is not None:
+        nouhinsyo_patches['注文弁当の抽出'] = SheetPatch.safe_write(df_bento_nouhin)
+    for engine in ('patch', 'openpyxl'):
+        stage(f'workbook.fill_save[{engine}]', lambda: (
+            build_workbook(template, {k: v for k, v in template_patches.items() if k in template.sheetnames}, engine),
+            build_workbook(nouhinsyo, {k: v for k, v in nouhinsyo_patches.items() if k in nouhinsyo.sheetnames}, engine),
+        ))
+
+    resources = load_order_resources(args.assets)
+    stage('order.end_to_end', lambda: convert_order_pdf(order_data, resources))
+
+    blocks = stage('seal.extract_local', lambda: extract_seal_blocks_from_pdf(seal_data))
+    stage('seal.workbook', lambda: build_seal_workbook(blocks, os.path.join(args.assets, 'seal.xlsx')))
+    return stages
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(stages, previous_path):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = {s['stage']: s for s in json.load(f)['stages']}
+    print(f"\n{'stage':<28} {'before[s]':>9} {'after[s]':>9} {'ratio':>7}")
+    for s in stages:
+        before = previous.get(s['stage'])
+        if before is None or not before['best_s']:
+            continue
+        print(f"{s['stage']:<28} {before['best_s']:>9.4f} {s['best_s']:>9.4f} {s['best_s'] / before['best_s']:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=4, help='注文PDFのページ数')
+    parser.add_argument('--clients', type=int, default=20, help='注文PDFの1ページあたりのクライアント数')
+    parser.add_argument('--bentos', type=int, default=6, help='注文PDFの弁当の種類数')
+    parser.add_argument('--seal-pages', type=int, default=2, help='シールPDFのページ数 (1ページ20ブロック)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--assets', default=ASSETS_DIR, help='マスタ・テンプレートのディレクトリ')
+    parser.add_argument('--no-memory', action='store_true', help='tracemalloc による計測を省く')
+    parser.add_argument('--output', help='結果のJSONの保存先')
+    parser.add_argument('--compare', help='比較する以前の結果のJSON')
+    parser.add_argument('--save-pdfs', help='生成したPDFを保存するディレクトリ')
+    args = parser.parse_args(argv)
+
+    if args.save_pdfs:
+        os.makedirs(args.save_pdfs, exist_ok=True)
+        with open(os.path.join(args.save_pdfs, 'order.pdf'), 'wb') as f:
+            f.write(order_pdf(pages=args.pages, clients=args.clients, bentos=args.bentos, seed=args.seed))
+        with open(os.path.join(args.save_pdfs, 'seal.pdf'), 'wb') as f:
+            f.write(seal_pdf(pages=args.seal_pages, seed=args.seed)[0])
+
+    stages = run(args)
+    now = datetime.datetime.now()
+    result = {
+        'benchmark': 'pipeline',
+        'timestamp': now.isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: getattr(args, k) for k in ('pages', 'clients', 'bentos', 'seal_pages', 'seed', 'repeat')},
+        'stages': stages,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{now:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nsaved: {output}")
+    if args.compare:
+        compare(stages, args.compare)
+
+
+if __name__ == '__main__':
+    main()
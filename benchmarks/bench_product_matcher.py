@@ -0,0 +1,115 @@
+"""
+match_bento_data の照合方式を比較する (従来の線形走査 vs ProductMatcher)。
+
+    python benchmarks/bench_product_matcher.py --rows 10000 50000 100000
+
+合成した商品マスタに対し、完全一致・部分一致・不一致が混在する弁当名リストを照合し、
+構築時間・照合時間と結果の一致を表示する。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from api.product_matcher import MATCH_COLUMNS, ProductMatcher
+
+_SYLLABLES = list('アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン')
+_SUFFIXES = ['弁当', '幼児食', 'ランチ', '御膳', 'キャラ弁', '（大盛）', ' ごはん少なめ']
+
+
+def make_master(rows: int, seed: int = 0) -> pd.DataFrame:
+    rnd = random.Random(seed)
+    names = [''.join(rnd.choices(_SYLLABLES, k=rnd.randint(2, 6))) + rnd.choice(_SUFFIXES) for _ in range(rows)]
+    return pd.DataFrame({
+        '商品予定名': names,
+        'パン箱入数': [str(rnd.randint(1, 40)) for _ in range(rows)],
+        '売価単価': [str(rnd.randint(300, 800)) for _ in range(rows)],
+        '弁当区分': [rnd.choice(['幼稚園', '保育園', '小学校']) for _ in range(rows)],
+    })
+
+
+def make_queries(master: pd.DataFrame, count: int, seed: int = 1):
+    rnd = random.Random(seed)
+    names = master['商品予定名'].tolist()
+    queries = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            queries.append(rnd.choice(names))
+        elif kind == 1:
+            queries.append('【限定】' + rnd.choice(names) + ' 特製')
+        else:
+            queries.append(''.join(rnd.choices(_SYLLABLES, k=8)))
+    return queries
+
+
+def legacy_match(pdf_bento_list, master_df):
+    """最適化前の match_bento_data と同じ線形走査"""
+    master_tuples = master_df[MATCH_COLUMNS].astype(str).to_records(index=False).tolist()
+    norm_master = [
+        (unicodedata.normalize('NFKC', name).replace(" ", ""), name, pan_box, price, bento_type)
+        for name, pan_box, price, bento_type in master_tuples
+    ]
+    results = []
+    for pdf_name in pdf_bento_list:
+        stripped = pdf_name.strip()
+        norm_pdf = unicodedata.normalize('NFKC', stripped).replace(" ", "")
+        best_match = None
+        for norm_m, orig_m, pan_box, price, bento_type in norm_master:
+            if norm_m == norm_pdf:
+                best_match = [orig_m, pan_box, price, bento_type]
+                break
+        if not best_match:
+            candidates = [(o, p, pr, b) for n, o, p, pr, b in norm_master if n and n in norm_pdf]
+            if candidates:
+                best_match = max(candidates, key=lambda x: len(x[0]))
+        results.append(best_match or [stripped, "", "", ""])
+    return results
+
+
+def matcher_match(pdf_bento_list, matcher):
+    results = []
+    for pdf_name in pdf_bento_list:
+        stripped = pdf_name.strip()
+        norm_pdf = unicodedata.normalize('NFKC', stripped).replace(" ", "")
+        row = matcher.exact(norm_pdf)
+        best_match = list(row) if row is not None else matcher.longest_substring(norm_pdf)
+        results.append(best_match or [stripped, "", "", ""])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--queries', type=int, default=60)
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>7} {'legacy[s]':>10} {'build[s]':>9} {'match[s]':>9} {'speedup':>8}  identical")
+    for rows in args.rows:
+        master = make_master(rows)
+        queries = make_queries(master, args.queries)
+
+        start = time.perf_counter()
+        expected = legacy_match(queries, master)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = ProductMatcher.from_master_df(master)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = matcher_match(queries, matcher)
+        match_time = time.perf_counter() - start
+
+        print(f"{rows:>7} {legacy_time:>10.3f} {build_time:>9.3f} {match_time:>9.4f} "
+              f"{legacy_time / match_time:>7.0f}x  {actual == expected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Streamlit アプリの起動時間 (コールドスタート) と再実行時間を測定する。
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --compare benchmarks/results/startup-20251201-120000.json
+
+毎回新しいPythonプロセスで streamlit.testing の AppTest を使って streamlit_app.py を実行し、
+- import: スクリプト冒頭の import とモジュール読み込みにかかった時間 (AppTest の読み込みは含めない)
+- first_render: 最初の1回の実行 (アップロード前の画面の表示) にかかった時間
+- rerun: 同じセッションで再実行したときの時間
+- modules: 最初の実行後に読み込まれていた重いモジュール
+を測る。結果はJSON (既定: benchmarks/results/startup-<日時>.json) に保存する。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'pdfplumber', 'pdfminer', 'pypdfium2', 'google.generativeai']
+
+# 子プロセスで実行するコード。結果を1行のJSONで標準出力に書く
+PROBE = r'''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+heavy = %(heavy)r
+at = AppTest.from_file(%(app)r, default_timeout=120)
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+loaded = [m for m in heavy if m in sys.modules]
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+errors = [str(e.value) for e in at.exception]
+print(json.dumps({'first_render_s': first, 'rerun_s': rerun, 'modules': loaded, 'errors': errors}))
+'''
+
+
+def probe(env):
+    code = PROBE % {'heavy': HEAVY_MODULES, 'app': os.path.join(ROOT, 'streamlit_app.py')}
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def import_time(env):
+    """streamlit_app.py の import 文だけを実行した時間 (streamlit 自体の import は除く)"""
+    code = (
+        "import ast, time, streamlit\n"
+        f"src = open({os.path.join(ROOT, 'streamlit_app.py')!r}, encoding='utf-8').read()\n"
+        "tree = ast.parse(src)\n"
+        "body = [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom, ast.Try))]\n"
+        "code = compile(ast.Module(body=body, type_ignores=[]), 'streamlit_app.py', 'exec')\n"
+        "start = time.perf_counter(); exec(code, {'__name__': 'app'}); print(time.perf_counter() - start)\n"
+    )
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    return float(out.decode().strip().splitlines()[-1])
+
+
+def summarize(name, values):
+    stage = {'stage': name, 'best_s': round(min(values), 4), 'median_s': round(statistics.median(values), 4)}
+    print(f"{name:<16} {stage['best_s']:>9.4f} {stage['median_s']:>9.4f}")
+    return stage
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--api-key', action='store_true', help='GOOGLE_API_KEY にダミーを設定して測る')
+    parser.add_argument('--output', help='結果のJSONの保存先')
+    parser.add_argument('--compare', help='比較する以前の結果のJSON')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.pop('CONVERSION_SERVICE_URL', None)
+    if args.api_key:
+        env['GOOGLE_API_KEY'] = 'dummy-key-for-benchmark'
+    else:
+        env['GOOGLE_API_KEY'] = ''
+
+    imports, firsts, reruns, modules, errors = [], [], [], None, []
+    for _ in range(args.repeat):
+        imports.append(import_time(env))
+        result = probe(env)
+        firsts.append(result['first_render_s'])
+        reruns.append(result['rerun_s'])
+        modules = result['modules']
+        errors = result['errors']
+
+    print(f"{'stage':<16} {'best[s]':>9} {'median[s]':>9}")
+    stages = [summarize('import', imports), summarize('first_render', firsts), summarize('rerun', reruns)]
+    print(f"\nloaded after first render: {', '.join(modules) or '-'}")
+    if errors:
+        print(f"app errors: {errors}")
+
+    now = datetime.datetime.now()
+    result = {
+        'benchmark': 'startup',
+        'timestamp': now.isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'repeat': args.repeat, 'api_key': args.api_key},
+        'stages': stages,
+        'modules': modules,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{now:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nsaved: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = {s['stage']: s for s in json.load(f)['stages']}
+        print(f"\n{'stage':<16} {'before[s]':>9} {'after[s]':>9} {'ratio':>7}")
+        for s in stages:
+            before = previous.get(s['stage'])
+            if before and before['best_s']:
+                print(f"{s['stage']:<16} {before['best_s']:>9.4f} {s['best_s']:>9.4f} {s['best_s'] / before['best_s']:>6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+テスト・ベンチマーク用の合成PDF (注文PDF・シールPDF) を作る。
+
+外部ライブラリを使わずにPDFを直接書き出す。文字は埋め込みなしの日本語CIDフォント
+(HeiseiKakuGo-W5 / UniJIS-UCS2-H) で描くため、pdfplumber で抽出できる。
+
+注文PDF: 1ページごとに 園名 / 赤 / 飯あり・飯なし / 弁当名 / おやつ の見出し、番号行と園名行が交互に並ぶ
+クライアント行、10001 の終端行を罫線付きの表として描く (抽出関数が前提とする配置)。
+シールPDF: A4縦を 4列 × 5行 に分け、各ブロックに クライアント名(〜様) / 準備物 / クラス名 /
+弁当数 / 日付 / 学年 を描く。
+"""
+import random
+import zlib
+from typing import Dict, List, Tuple
+
+BENTO_NAMES = ['カレー', 'ハンバーグ', '唐揚げ', '幼児食', 'キャラ弁']
+SEAL_CLIENTS = ['博多南小学校様', 'さくら幼稚園様', 'ひまわり保育園様', '中央こども園様']
+SEAL_PREPARATIONS = ['パン箱入数', 'ご飯150g', 'おかずのみ']
+SEAL_CLASSES = ['チューリップ', 'さくら', 'ひまわり', 'たんぽぽ', 'すみれ', 'もも']
+SEAL_GRADES = ['年長', '年中', '年少', '未満児']
+
+
+class MiniPdf:
+    """テキストと直線だけを描ける最小限のPDFライター (座標は左上原点)"""
+
+    def __init__(self, width: float = 842, height: float = 595):
+        self.width, self.height = width, height
+        self.pages: List[List[str]] = []
+
+    def new_page(self):
+        self.pages.append([])
+
+    def text(self, x: float, y: float, s: str, size: float = 9):
+        hexs = s.encode('utf-16-be').hex().upper()
+        self.pages[-1].append(f"BT /F1 {size} Tf {x:.2f} {self.height - y - size:.2f} Td <{hexs}> Tj ET")
+
+    def line(self, x0: float, y0: float, x1: float, y1: float):
+        self.pages[-1].append(f"{x0:.2f} {self.height - y0:.2f} m {x1:.2f} {self.height - y1:.2f} l S")
+
+    def tobytes(self) -> bytes:
+        objs: List[bytes] = []
+
+        def add(obj: bytes) -> int:
+            objs.append(obj)
+            return len(objs)
+
+        font_desc = add(b"<< /Type /FontDescriptor /FontName /HeiseiKakuGo-W5 /Flags 4 /FontBBox [-92 -250 1010 922]"
+                        b" /ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 700 /StemV 80 >>")
+        cid = add(f"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /HeiseiKakuGo-W5 /CIDSystemInfo << /Registry (Adobe)"
+                  f" /Ordering (Japan1) /Supplement 2 >> /FontDescriptor {font_desc} 0 R /DW 1000 >>".encode())
+        font = add(f"<< /Type /Font /Subtype /Type0 /BaseFont /HeiseiKakuGo-W5-UniJIS-UCS2-H /Encoding /UniJIS-UCS2-H"
+                   f" /DescendantFonts [{cid} 0 R] >>".encode())
+        pages_id = len(objs) + 1 + 2 * len(self.pages)
+        page_ids = []
+        for ops in self.pages:
+            data = zlib.compress("\n".join(ops).encode())
+            contents = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+            page_ids.append(add(f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {self.width} {self.height}]"
+                                f" /Resources << /Font << /F1 {font} 0 R >> >> /Contents {contents} 0 R >>".encode()))
+        kids = " ".join(f"{p} 0 R" for p in page_ids)
+        add(f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+        catalog = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+        out = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for i, obj in enumerate(objs, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, catalog, xref)
+        return bytes(out)
+
+
+def order_pdf(pages: int = 2, clients: int = 8, bentos: int = 5, seed: int = 0) -> bytes:
+    """注文PDF (A4横)。1ページに clients 件のクライアントと bentos 種類の弁当列を持つ"""
+    rnd = random.Random(seed)
+    pdf = MiniPdf(842, 595)
+    cols = [40, 140, 180, 220] + [260 + 60 * i for i in range(bentos)] + [260 + 60 * bentos, 300 + 60 * bentos]
+    header = ['園名', '赤', '', ''] + [
+        BENTO_NAMES[i % len(BENTO_NAMES)] + ('' if i < len(BENTO_NAMES) else str(i)) for i in range(bentos)
+    ] + ['おやつ']
+    sub_header = ['', '飯あり', '飯なし', ''] + [''] * bentos + ['']
+    row_height = 16
+    for page_no in range(pages):
+        pdf.new_page()
+        pdf.text(40, 20, f'注文書 2025/12 ページ{page_no + 1}')
+        rows = [header, sub_header]
+        for c in range(clients):
+            rows.append([str(1000 + page_no * 100 + c)] + [str(rnd.randint(0, 40)) for _ in range(len(cols) - 2)])
+            rows.append([f'さくら保育園{page_no}-{c}'] + [str(rnd.randint(0, 3)) for _ in range(2)] + [''] * (len(cols) - 4))
+        rows.append(['10001'] + [''] * (len(cols) - 2))
+        top = 40
+        for r, row in enumerate(rows):
+            for ci, value in enumerate(row):
+                if value:
+                    pdf.text(cols[ci] + 2, top + r * row_height + 3, value, size=8)
+        bottom = top + len(rows) * row_height
+        for x in cols:
+            pdf.line(x, top, x, bottom)
+        for r in range(len(rows) + 1):
+            pdf.line(cols[0], top + r * row_height, cols[-1], top + r * row_height)
+    return pdf.tobytes()
+
+
+def seal_pdf(pages: int = 1, blocks_per_page: int = 20, seed: int = 0) -> Tuple[bytes, List[Dict]]:
+    """シールPDF (A4縦、4列 × 5行) と、描いたブロックの正解データ"""
+    rnd = random.Random(seed)
+    pdf = MiniPdf(595, 842)
+    cell_width, cell_height = 595 / 4, 842 / 5
+    truth = []
+    for _ in range(pages):
+        pdf.new_page()
+        for i in range(min(blocks_per_page, 20)):
+            row, col = divmod(i, 4)
+            x, y = col * cell_width + 12, row * cell_height + 14
+            block = {
+                'client_name': rnd.choice(SEAL_CLIENTS),
+                'preparations': rnd.sample(SEAL_PREPARATIONS, rnd.randint(1, 2)),
+                'class_name': rnd.choice(SEAL_CLASSES),
+                'meal_count': str(rnd.randint(5, 40)) + rnd.choice(['', '', '+1']),
+                'date': f'{rnd.randint(1, 12)}/{rnd.randint(1, 28)}',
+                'grade': rnd.choice(SEAL_GRADES),
+            }
+            pdf.text(x, y, block['client_name'], 8)
+            pdf.text(x, y + 16, ' '.join(block['preparations']), 7)
+            pdf.text(x + 10, y + 40, block['class_name'], 16)
+            pdf.text(x + 30, y + 70, block['meal_count'], 14)
+            pdf.text(x, y + 120, block['date'], 8)
+            pdf.text(x + 90, y + 120, block['grade'], 8)
+            truth.append(block)
+    return pdf.tobytes(), truth
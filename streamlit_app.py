@@ -1,41 +1,28 @@
 import streamlit as st
 import os
-import json
-import base64
-import io
-import pandas as pd
-import google.generativeai as genai
-from openpyxl import load_workbook, Workbook
+import importlib.util
 from dotenv import load_dotenv
-import unicodedata
-import glob
-
-# Try to import pdf_utils with error handling for Streamlit Cloud
-try:
-    from api.pdf_utils import (
-        safe_write_df, pdf_to_excel_data_for_paste_sheet, extract_table_from_pdf_for_bento,
-        find_correct_anchor_for_bento, extract_bento_range_for_bento, match_bento_data, 
-        extract_detailed_client_info_from_pdf, export_detailed_client_data_to_dataframe,
-        paste_dataframe_to_sheet
-    )
-    PDF_UTILS_AVAILABLE = True
-except Exception as e:
-    PDF_UTILS_AVAILABLE = False
-    PDF_UTILS_ERROR = str(e)
-    # Define dummy functions
-    def safe_write_df(*args, **kwargs): pass
-    def pdf_to_excel_data_for_paste_sheet(*args, **kwargs): return None
-    def extract_table_from_pdf_for_bento(*args, **kwargs): return []
-    def find_correct_anchor_for_bento(*args, **kwargs): return -1
-    def extract_bento_range_for_bento(*args, **kwargs): return []
-    def match_bento_data(*args, **kwargs): return []
-    def extract_detailed_client_info_from_pdf(*args, **kwargs): return []
-    def export_detailed_client_data_to_dataframe(*args, **kwargs): return pd.DataFrame()
-    def paste_dataframe_to_sheet(*args, **kwargs): pass
-
-# Load environment variables
+
+# Load environment variables (before importing api, which reads its settings at import time)
 load_dotenv()
 
+# Only light modules are imported here. pandas, openpyxl, pdfplumber and google.generativeai are
+# imported by the handlers that need them, so the first paint and the master tab do not wait for them.
+from api.masters import find_master_file
+from api.master_store import list_master_versions
+from api.tracing import RunTrace
+from api.artifacts import get_artifact_store
+from api.seal import (
+    SEAL_HEADERS, extract_seal_blocks, extract_seal_blocks_by_page, extract_seal_blocks_local,
+    extract_seal_blocks_streaming, SealExtraction, get_gemini_model,
+    build_seal_workbook, seal_row,
+)
+
+# Check the PDF processing dependencies without importing them (for Streamlit Cloud)
+PDF_UTILS_MISSING = [name for name in ('pdfplumber', 'openpyxl', 'pandas') if importlib.util.find_spec(name) is None]
+PDF_UTILS_AVAILABLE = not PDF_UTILS_MISSING
+PDF_UTILS_ERROR = f"{', '.join(PDF_UTILS_MISSING)} が見つかりません" if PDF_UTILS_MISSING else ""
+
 # Configure page
 icon_path = os.path.join("static", "icons", "app-icon.jpg")
 page_icon = icon_path if os.path.exists(icon_path) else "🍱"
@@ -128,50 +115,74 @@ ICON_MAIN = """<svg xmlns="http://www.w3.org/2000/svg" width="32" height="32" vi
 
 # --- Utility Functions ---
 
-def load_master_csv(base_path, file_pattern):
-    """Load master CSV from assets directory."""
-    search_path = os.path.join(base_path, f'*{file_pattern}*.csv')
-    list_of_files = glob.glob(search_path)
-    if not list_of_files:
-        return pd.DataFrame(), None
-    latest_file = max(list_of_files, key=os.path.getmtime)
-    encodings = ['utf-8-sig', 'utf-8', 'cp932', 'shift_jis']
-    for encoding in encodings:
-        try:
-            df = pd.read_csv(latest_file, encoding=encoding, dtype=str).fillna('')
-            if not df.empty:
-                df.columns = df.columns.str.strip()
-                return df, os.path.basename(latest_file)
-        except Exception:
-            continue
-    return pd.DataFrame(), None
-
 def save_master_file(base_path, uploaded_file, file_pattern):
-    """Save uploaded master file to assets directory, removing old ones."""
-    # 1. Delete existing files matching the pattern
-    search_path = os.path.join(base_path, f'*{file_pattern}*.csv')
-    old_files = glob.glob(search_path)
-    for f in old_files:
-        try:
-            os.remove(f)
-        except Exception as e:
-            st.error(f"旧ファイルの削除に失敗しました: {str(e)}")
-            return False
-
-    # 2. Save new file
-    save_path = os.path.join(base_path, uploaded_file.name)
+    """Save uploaded master file to assets directory, replacing old ones and keeping it as a version."""
     try:
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return True
+        # Old CSVs are replaced; the upload is kept in api/assets/masters with its match index
+        from api.master_store import save_master_version
+        entry = save_master_version(base_path, file_pattern, uploaded_file.name, uploaded_file.getvalue())
+        # Cached conversions were made with the old master
+        from api.order_cache import get_order_cache
+        get_order_cache().clear()
+        return entry
     except Exception as e:
         st.error(f"ファイルの保存に失敗しました: {str(e)}")
-        return False
+        return None
+
+def run_order_conversion(pdf_bytes, filename):
+    """Convert via the conversion service when configured, otherwise (or if it is unavailable) in-process"""
+    from api.order_cache import get_order_cache
+    from api.order_pipeline import load_order_resources
+    from api.service_client import CONVERSION_SERVICE_URL, ServiceUnavailable, convert_order_remote
+    if CONVERSION_SERVICE_URL:
+        try:
+            outputs, st.session_state.order_trace = convert_order_remote(pdf_bytes, filename)
+            return outputs
+        except ServiceUnavailable as e:
+            st.info(f"変換サービスに接続できないため、この画面で変換します。({e})")
+    # Masters and templates are cached per version; see api/order_pipeline.py
+    trace = RunTrace('order', file=filename)
+    try:
+        resources = load_order_resources(ASSETS_DIR, trace=trace)
+        outputs, cached = get_order_cache().get_or_convert(pdf_bytes, resources, trace=trace)
+        if cached:
+            st.info("同じPDF・マスタでの変換結果を再利用しました。")
+        return outputs
+    finally:
+        trace.log()
+        st.session_state.order_trace = trace.records
 
-def clear_sheet(ws):
-    """Clear all cells in a worksheet."""
-    if ws.max_row > 0:
-        ws.delete_rows(1, ws.max_row)
+def _clear_download_ready(key):
+    st.session_state[f"{key}_ready"] = False
+
+def artifact_download_button(label, handle, file_name, mime, key):
+    """Download button that loads the output from the artifact store only when the user asks for it"""
+    # st.download_button copies the bytes into the media file storage on every rerun it is rendered,
+    # so the file is attached only after "準備" and released again once it has been downloaded
+    ready_key = f"{key}_ready"
+    if not st.session_state.get(ready_key):
+        if st.button(f"{file_name} を用意する", key=f"{key}_prepare"):
+            st.session_state[ready_key] = True
+            st.rerun()
+        return
+    path = get_artifact_store().path(handle)
+    if path is None:
+        st.session_state[ready_key] = False
+        st.warning(f"{file_name} の保存期限が切れました。もう一度変換してください。")
+        return
+    with open(path, 'rb') as f:
+        st.download_button(label=label, data=f, file_name=file_name, mime=mime, key=key,
+                           on_click=_clear_download_ready, args=(key,))
+
+def show_trace(records):
+    """Show the per-stage timing of the last run"""
+    if not records:
+        return
+    import pandas as pd
+    with st.expander("処理時間の内訳"):
+        df = pd.DataFrame(records)
+        df['stage'] = ['\u3000' * depth + stage for depth, stage in zip(df['depth'], df['stage'])]
+        st.dataframe(df.drop(columns=['depth']), use_container_width=True, hide_index=True)
 
 # --- Main App Logic ---
 
@@ -191,7 +202,6 @@ with st.sidebar:
     if api_key:
         api_key = api_key.strip()  # Remove any whitespace
         st.success(f"API Key: 設定済み (長さ: {len(api_key)}, 先頭: {api_key[:10]}...)")
-        genai.configure(api_key=api_key)
     else:
         st.error("API Key: 未設定 (.envを確認してください)")
     
@@ -209,13 +219,13 @@ if not os.path.exists(ASSETS_DIR):
 # Initialize Session State
 if 'main_process_done' not in st.session_state:
     st.session_state.main_process_done = False
-    st.session_state.template_bytes = None
-    st.session_state.nouhinsyo_bytes = None
+    st.session_state.template_artifact = None
+    st.session_state.nouhinsyo_artifact = None
     st.session_state.original_filename = ""
 
 if 'seal_process_done' not in st.session_state:
     st.session_state.seal_process_done = False
-    st.session_state.seal_bytes = None
+    st.session_state.seal_artifact = None
     st.session_state.seal_filename = ""
     st.session_state.seal_blocks = []
 
@@ -233,111 +243,19 @@ with tab1:
         if st.button("変換開始", key="btn_order"):
             try:
                 with st.spinner('PDFを解析中...'):
-                    # Load Masters
-                    df_product_master, _ = load_master_csv(ASSETS_DIR, "商品マスタ")
-                    df_customer_master, _ = load_master_csv(ASSETS_DIR, "得意先マスタ")
-                    
-                    pdf_bytes_io = io.BytesIO(uploaded_file_order.getvalue())
                     original_pdf_name = os.path.splitext(uploaded_file_order.name)[0]
-                    
-                    # Load Templates
-                    template_path = os.path.join(ASSETS_DIR, "template.xlsm")
-                    nouhinsyo_path = os.path.join(ASSETS_DIR, "nouhinsyo.xlsx")
-                    
-                    if not os.path.exists(template_path) or not os.path.exists(nouhinsyo_path):
-                        st.error("テンプレートファイルが見つかりません。")
-                        st.stop()
 
-                    template_wb = load_workbook(template_path, keep_vba=True)
-                    nouhinsyo_wb = load_workbook(nouhinsyo_path)
-                    
-                    # 1. Paste Masters to Template (Clear & Paste)
-                    if not df_product_master.empty and "商品マスタ" in template_wb.sheetnames:
-                        ws = template_wb["商品マスタ"]
-                        clear_sheet(ws) # Clear existing
-                        paste_dataframe_to_sheet(ws, df_product_master)
-                        
-                    if not df_customer_master.empty and "得意先マスタ" in template_wb.sheetnames:
-                        ws = template_wb["得意先マスタ"]
-                        clear_sheet(ws) # Clear existing
-                        paste_dataframe_to_sheet(ws, df_customer_master)
-
-                    # 2. Extract Data from PDF (Rule-based)
-                    df_paste_sheet = pdf_to_excel_data_for_paste_sheet(io.BytesIO(pdf_bytes_io.getvalue()))
-                    
-                    if df_paste_sheet is None:
-                        st.error("PDFデータの抽出に失敗しました。")
+                    from api.order_pipeline import OrderConversionError
+                    try:
+                        outputs = run_order_conversion(uploaded_file_order.getvalue(), uploaded_file_order.name)
+                    except OrderConversionError as e:
+                        st.error(str(e))
                         st.stop()
-                        
-                    # Extract Bento Data
-                    df_bento_sheet = None
-                    tables = extract_table_from_pdf_for_bento(io.BytesIO(pdf_bytes_io.getvalue()))
-                    if tables:
-                        main_table = max(tables, key=len)
-                        anchor_col = find_correct_anchor_for_bento(main_table)
-                        if anchor_col != -1:
-                            bento_list = extract_bento_range_for_bento(main_table, anchor_col)
-                            if bento_list:
-                                matched_data = match_bento_data(bento_list, df_product_master)
-                                df_bento_sheet = pd.DataFrame(matched_data, columns=['商品予定名', 'パン箱入数', '売価単価', '弁当区分'])
-                    
-                    # Extract Client Data
-                    df_client_sheet = None
-                    client_data = extract_detailed_client_info_from_pdf(io.BytesIO(pdf_bytes_io.getvalue()))
-                    if client_data:
-                        df_client_sheet = export_detailed_client_data_to_dataframe(client_data)
-                        
-                    # 3. Write to Template
-                    ws_paste = template_wb["貼り付け用"]
-                    for r_idx, row in df_paste_sheet.iterrows():
-                        for c_idx, value in enumerate(row):
-                            ws_paste.cell(row=r_idx + 1, column=c_idx + 1, value=value)
-                            
-                    if df_bento_sheet is not None and "注文弁当の抽出" in template_wb.sheetnames:
-                        safe_write_df(template_wb["注文弁当の抽出"], df_bento_sheet)
-                        
-                    if df_client_sheet is not None and "クライアント抽出" in template_wb.sheetnames:
-                        safe_write_df(template_wb["クライアント抽出"], df_client_sheet)
-                        
-                    # 4. Write to Nouhinsyo
-                    # Paste Masters to Nouhinsyo (Clear & Paste)
-                    if not df_customer_master.empty and "得意先マスタ" in nouhinsyo_wb.sheetnames:
-                        ws = nouhinsyo_wb["得意先マスタ"]
-                        clear_sheet(ws) # Clear existing
-                        paste_dataframe_to_sheet(ws, df_customer_master)
-                    
-                    # Note: Nouhinsyo might not have "商品マスタ" sheet, but if it does, we should update it too.
-                    # Based on previous code, it only updated "得意先マスタ".
-                    
-                    ws_paste_n = nouhinsyo_wb["貼り付け用"]
-                    for r_idx, row in df_paste_sheet.iterrows():
-                        for c_idx, value in enumerate(row):
-                            ws_paste_n.cell(row=r_idx + 1, column=c_idx + 1, value=value)
-                            
-                    # Map Bento Names for Nouhinsyo
-                    df_bento_for_nouhin = None
-                    if df_bento_sheet is not None:
-                        master_df = df_product_master.copy()
-                        if not master_df.empty and '商品名' in master_df.columns:
-                            master_map = master_df.drop_duplicates(subset=['商品予定名']).set_index('商品予定名')['商品名'].to_dict()
-                            df_bento_for_nouhin = df_bento_sheet.copy()
-                            df_bento_for_nouhin['商品名'] = df_bento_for_nouhin['商品予定名'].map(master_map)
-                            df_bento_for_nouhin = df_bento_for_nouhin[['商品予定名', 'パン箱入数', '商品名']]
-                            
-                    if df_bento_for_nouhin is not None and "注文弁当の抽出" in nouhinsyo_wb.sheetnames:
-                        safe_write_df(nouhinsyo_wb["注文弁当の抽出"], df_bento_for_nouhin)
-                        
-                    if df_client_sheet is not None and "クライアント抽出" in nouhinsyo_wb.sheetnames:
-                        safe_write_df(nouhinsyo_wb["クライアント抽出"], df_client_sheet)
 
-                    # 5. Save to Session State
-                    out_template = io.BytesIO()
-                    template_wb.save(out_template)
-                    st.session_state.template_bytes = out_template.getvalue()
-                    
-                    out_nouhin = io.BytesIO()
-                    nouhinsyo_wb.save(out_nouhin)
-                    st.session_state.nouhinsyo_bytes = out_nouhin.getvalue()
+                    # Keep only handles in the session; the workbooks live in the artifact store
+                    store = get_artifact_store()
+                    st.session_state.template_artifact = store.put(outputs.template_bytes)
+                    st.session_state.nouhinsyo_artifact = store.put(outputs.nouhinsyo_bytes)
                     
                     st.session_state.original_filename = original_pdf_name
                     st.session_state.main_process_done = True
@@ -351,23 +269,25 @@ with tab1:
 
     # Display Download Buttons (Persistent)
     if st.session_state.main_process_done:
+        from api.order_pipeline import output_filenames
         col1, col2 = st.columns(2)
         with col1:
-            st.download_button(
-                label="数出表をダウンロード",
-                data=st.session_state.template_bytes,
-                file_name=f"{st.session_state.original_filename}_数出表.xlsm",
-                mime="application/vnd.ms-excel.sheet.macroEnabled.12",
-                key="dl_template"
+            artifact_download_button(
+                "数出表をダウンロード",
+                st.session_state.template_artifact,
+                output_filenames(st.session_state.original_filename)[0],
+                "application/vnd.ms-excel.sheet.macroEnabled.12",
+                "dl_template"
             )
         with col2:
-            st.download_button(
-                label="納品書ダウンロード",
-                data=st.session_state.nouhinsyo_bytes,
-                file_name=f"{st.session_state.original_filename}_納品書.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                key="dl_nouhin"
+            artifact_download_button(
+                "納品書ダウンロード",
+                st.session_state.nouhinsyo_artifact,
+                output_filenames(st.session_state.original_filename)[1],
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                "dl_nouhin"
             )
+        show_trace(st.session_state.get('order_trace'))
 
 # --- Tab 2: Seal Processing (AI) ---
 with tab2:
@@ -375,112 +295,87 @@ with tab2:
     st.markdown('<div class="card">PDFからシール用データを抽出し、Excelを作成します。</div>', unsafe_allow_html=True)
     
     uploaded_file_seal = st.file_uploader("シールPDFをアップロード", type=['pdf'], key="seal_pdf")
+    seal_method = st.radio(
+        "抽出方法", ["ルールベース (低信頼度のみAI)", "AI (Gemini)"], index=0, key="seal_method", horizontal=True,
+        help="ルールベースはPDFの文字配置から直接読み取ります。読み取りに自信がないブロックだけAIで読み直します (APIキーがなければ読み直しません)。"
+    )
+    use_local_seal = seal_method.startswith("ルールベース")
+    bypass_seal_cache = st.checkbox("キャッシュを使わずに再解析する", value=False, key="seal_bypass_cache",
+                                    help="同じPDF・モデルの解析結果は保存され、次回から再利用されます。")
+    split_seal_pages = st.checkbox("ページごとに分割して並列に解析する", value=False, key="seal_split_pages",
+                                   help="ページ数の多いPDFで速く、出力が途中で切れにくくなります。")
+    stream_seal = st.checkbox("抽出したブロックを順次表示する", value=True, key="seal_stream",
+                              help="AIの出力を受け取りながら、完成したブロックから表示します。")
     
     if uploaded_file_seal:
         if st.button("変換開始", key="btn_seal"):
             try:
-                with st.spinner('AIが解析中... これには数分かかる場合があります。'):
-                    model = genai.GenerativeModel(model_name)
+                spinner_text = ('PDFの文字配置から読み取り中...' if use_local_seal
+                                else 'AIが解析中... これには数分かかる場合があります。')
+                with st.spinner(spinner_text):
+                    # genai is imported and configured once per process, on the first seal run
+                    model = get_gemini_model(model_name, api_key or '')
                     pdf_bytes = uploaded_file_seal.getvalue()
-                    
-                    seal_prompt = """
-このPDFはシール表です。横4つ × 縦5つ(合計約20個)のブロックで構成されています。
-各ブロックには以下の情報が含まれています:
-1. クライアント名 (最上部): 小学校名または幼稚園名 + 「様」
-2. 準備物 (クライアント名のすぐ下): パン箱入数、ご飯150gなど
-3. クラス名 (中央、大きめの文字): チューリップ、さくらなど
-4. 弁当数 (クラス名の下): 数値(例: 35、35+1)
-5. 日付 (ブロック左下): MM/DD形式
-6. 学年 (ブロック右下): 年長、年中など
-
-以下のJSON形式で、全てのブロック情報を抽出してください:
-{
-  "blocks": [
-    {
-      "client_name": "博多南衆参コース様",
-      "preparations": ["パン箱入数", "ご飯150g"],
-      "class_name": "チューリップ",
-      "meal_count": "35",
-      "date": "12/10",
-      "grade": "年長"
-    }
-  ]
-}
-重要: 全てのブロックを抽出してください。完全で有効なJSONのみを返してください。
-"""
-                    response = model.generate_content([
-                        {"mime_type": "application/pdf", "data": pdf_bytes},
-                        seal_prompt
-                    ], generation_config={"response_mime_type": "application/json"})
-                    
-                    text = response.text.strip()
-                    if text.startswith("```json"): text = text[7:]
-                    if text.endswith("```"): text = text[:-3]
-                    
-                    # Try to parse JSON, with recovery for truncated responses
-                    try:
-                        data = json.loads(text)
-                    except json.JSONDecodeError as e:
-                        st.warning(f"AI出力が途中で切れました。部分的なデータを回復中...")
-                        # Try to recover partial JSON
-                        # Find the last complete block by looking for "},"
-                        last_complete = text.rfind("},")
-                        if last_complete != -1:
-                            # Try to close the JSON properly
-                            recovered_text = text[:last_complete + 1] + "]}"
-                            try:
-                                data = json.loads(recovered_text)
-                                st.info(f"部分的なデータを回復しました。")
-                            except:
-                                # Try another approach - wrap as array
-                                recovered_text = text[:last_complete + 1] + "]"
-                                try:
-                                    data = json.loads(recovered_text)
-                                except:
-                                    raise e
+                    trace = RunTrace('seal', file=uploaded_file_seal.name, model=model_name)
+
+                    from api.service_client import CONVERSION_SERVICE_URL, ServiceUnavailable, convert_seal_remote
+                    remote = None
+                    if CONVERSION_SERVICE_URL and (use_local_seal or split_seal_pages or not stream_seal):
+                        # The service does not stream, so streamed extraction always runs here
+                        method = 'local' if use_local_seal else ('pages' if split_seal_pages else 'gemini')
+                        try:
+                            remote = convert_seal_remote(pdf_bytes, uploaded_file_seal.name, method, model_name,
+                                                         use_cache=not bypass_seal_cache)
+                        except ServiceUnavailable as e:
+                            st.info(f"変換サービスに接続できないため、この画面で変換します。({e})")
+
+                    with trace.span('extract', method=seal_method):
+                        # Results are cached on disk per PDF/model/prompt; see api/gemini_cache.py
+                        if remote is not None:
+                            extraction = SealExtraction(remote['blocks'], remote['recovered'], remote['cached'],
+                                                        remote['low_confidence'])
+                            if extraction.low_confidence:
+                                st.warning(f"読み取りの信頼度が低いブロックが{extraction.low_confidence}件あります。プレビューで確認してください。")
+                        elif use_local_seal:
+                            extraction = extract_seal_blocks_local(pdf_bytes, model, model_name, use_cache=not bypass_seal_cache)
+                            if extraction.low_confidence:
+                                st.warning(f"読み取りの信頼度が低いブロックが{extraction.low_confidence}件あります。プレビューで確認してください。")
+                        elif model is None:
+                            st.error("API Keyが未設定のため、AIで解析できません。")
+                            st.stop()
+                        elif split_seal_pages:
+                            extraction = extract_seal_blocks_by_page(pdf_bytes, model, model_name, use_cache=not bypass_seal_cache)
+                        elif stream_seal:
+                            # Show each block as soon as it is closed in the streamed output
+                            preview = st.empty()
+                            streamed_rows = []
+                            import pandas as pd
+                            def show_block(block):
+                                streamed_rows.append(seal_row(block))
+                                preview.dataframe(pd.DataFrame(streamed_rows, columns=SEAL_HEADERS), use_container_width=True)
+                            extraction = extract_seal_blocks_streaming(
+                                pdf_bytes, model, model_name, use_cache=not bypass_seal_cache, on_block=show_block
+                            )
+                            preview.empty()
                         else:
-                            raise e
-                    
-                    blocks = data if isinstance(data, list) else data.get('blocks', [])
+                            extraction = extract_seal_blocks(pdf_bytes, model, model_name, use_cache=not bypass_seal_cache)
+                    if extraction.cached:
+                        st.info("キャッシュ済みの解析結果を使用しました。")
+                    if extraction.recovered:
+                        st.warning("AI出力が途中で切れました。部分的なデータを回復しました。")
+                    blocks = extraction.blocks
                     
                     # Create Excel
-                    seal_path = os.path.join(ASSETS_DIR, "seal.xlsx")
-                    if os.path.exists(seal_path):
-                        wb = load_workbook(seal_path)
-                    else:
-                        wb = Workbook()
-                    
-                    target_sheet_name = "Gemini抽出データ"
-                    if target_sheet_name in wb.sheetnames:
-                        ws = wb[target_sheet_name]
-                        ws.sheet_state = 'visible'  # Make sure sheet is visible
-                        ws.delete_rows(1, ws.max_row + 1)
+                    if remote is not None:
+                        seal_bytes = remote['xlsx']
+                        st.session_state.seal_trace = remote['stages']
                     else:
-                        ws = wb.create_sheet(title=target_sheet_name)
-                    
-                    try:
-                        wb.active = ws
-                    except ValueError:
-                        pass  # Ignore if can't set active
-                    headers = ['クライアント名', 'クラス名', '準備物', '弁当数', '日付', '学年']
-                    ws.append(headers)
+                        with trace.span('workbook', blocks=len(blocks)):
+                            seal_bytes = build_seal_workbook(blocks, os.path.join(ASSETS_DIR, "seal.xlsx"))
+                        trace.log()
+                        st.session_state.seal_trace = trace.records
                     
-                    for block in blocks:
-                        prep = block.get('preparations', [])
-                        prep_text = ', '.join(prep) if isinstance(prep, list) else str(prep)
-                        ws.append([
-                            block.get('client_name', ''),
-                            block.get('class_name', ''),
-                            prep_text,
-                            block.get('meal_count', ''),
-                            block.get('date', ''),
-                            block.get('grade', '')
-                        ])
-                    
-                    out_seal = io.BytesIO()
-                    wb.save(out_seal)
-                    
-                    st.session_state.seal_bytes = out_seal.getvalue()
+                    st.session_state.seal_artifact = get_artifact_store().put(seal_bytes)
                     st.session_state.seal_filename = uploaded_file_seal.name.replace('.pdf', '') + '_seal.xlsx'
                     st.session_state.seal_blocks = blocks
                     st.session_state.seal_process_done = True
@@ -494,15 +389,16 @@ with tab2:
 
     if st.session_state.seal_process_done:
         st.write(f"抽出されたデータ数: {len(st.session_state.seal_blocks)}件")
-        st.download_button(
-            label="シールデータ (Excel) をダウンロード",
-            data=st.session_state.seal_bytes,
-            file_name=st.session_state.seal_filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="dl_seal"
+        artifact_download_button(
+            "シールデータ (Excel) をダウンロード",
+            st.session_state.seal_artifact,
+            st.session_state.seal_filename,
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            "dl_seal"
         )
         with st.expander("抽出データプレビュー"):
             st.json(st.session_state.seal_blocks)
+        show_trace(st.session_state.get('seal_trace'))
 
 # --- Tab 3: Master Management ---
 with tab3:
@@ -511,8 +407,10 @@ with tab3:
     
     # Show current files
     st.subheader("現在のマスタファイル")
-    _, prod_file = load_master_csv(ASSETS_DIR, "商品マスタ")
-    _, cust_file = load_master_csv(ASSETS_DIR, "得意先マスタ")
+    # Only the file names are needed here, so the CSVs are not parsed
+    prod_file = find_master_file(ASSETS_DIR, "商品マスタ")
+    cust_file = find_master_file(ASSETS_DIR, "得意先マスタ")
+    prod_file, cust_file = [os.path.basename(f) if f else None for f in (prod_file, cust_file)]
     
     col1, col2 = st.columns(2)
     with col1:
@@ -520,6 +418,19 @@ with tab3:
     with col2:
         st.info(f"得意先マスタ: {cust_file if cust_file else 'なし'}")
 
+    with st.expander("保存されている版"):
+        for kind in ("商品マスタ", "得意先マスタ"):
+            versions = list_master_versions(ASSETS_DIR, kind)
+            st.markdown(f"**{kind}**")
+            if versions:
+                # Plain lines: a table widget would load pandas/pyarrow on first paint
+                st.markdown("\n".join(
+                    f"- {v['saved_at']} {v['filename']} ({v['rows']}行, 変更 {v['changed_rows'] if v['changed_rows'] is not None else '-'}行) `{v['version']}`"
+                    for v in versions
+                ))
+            else:
+                st.write("なし")
+
     # Uploaders
     st.subheader("マスタ更新")
     st.markdown("※アップロードすると、古いマスタファイルは削除され、新しいファイルが保存されます。")
@@ -0,0 +1,32 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+ASSETS_DIR = os.path.join(ROOT, 'api', 'assets')
+
+
+@pytest.fixture
+def assets_dir(tmp_path):
+    """api/assets のマスタ・テンプレートだけを複製した作業用ディレクトリ (キャッシュ・保管庫は含めない)"""
+    target = tmp_path / 'assets'
+    target.mkdir()
+    for name in os.listdir(ASSETS_DIR):
+        path = os.path.join(ASSETS_DIR, name)
+        if os.path.isfile(path):
+            shutil.copy2(path, target / name)
+    return str(target)
+
+
+@pytest.fixture
+def order_cache(tmp_path, monkeypatch):
+    """既定の変換結果キャッシュを作業用ディレクトリに向ける"""
+    from api import order_cache as module
+    cache = module.OrderResultCache(str(tmp_path / 'orders'))
+    monkeypatch.setattr(module, '_DEFAULT_CACHE', cache)
+    return cache
@@ -0,0 +1,67 @@
+import os
+import time
+
+import pytest
+
+from api.artifacts import ArtifactStore
+from api.disk_cache import DiskLRU
+
+
+def _write(data):
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+    return write
+
+
+def _age(lru, key, seconds):
+    past = time.time() - seconds
+    os.utime(lru.path(key), (past, past))
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    lru = DiskLRU(str(tmp_path), '.bin', max_bytes=300)
+    for i, key in enumerate(['a', 'b', 'c']):
+        lru.write(key, _write(b'x' * 100))
+        _age(lru, key, 30 - i)
+    # 読み出しで最終利用時刻が新しくなるので、次に削除されるのは b
+    assert lru.lookup('a') is not None
+    lru.write('d', _write(b'x' * 100))
+    assert [lru.lookup(key) is not None for key in 'abcd'] == [True, False, True, True]
+
+
+def test_expired_entries_are_not_returned(tmp_path):
+    lru = DiskLRU(str(tmp_path), '.bin', max_bytes=10 ** 6, max_age=60)
+    lru.write('old', _write(b'1'))
+    lru.write('new', _write(b'2'))
+    _age(lru, 'old', 120)
+    assert lru.lookup('old') is None and not os.path.exists(lru.path('old'))
+    assert lru.lookup('new') == lru.path('new')
+
+
+def test_keep_survives_its_own_eviction(tmp_path):
+    lru = DiskLRU(str(tmp_path), max_bytes=10)
+    lru.write('big', _write(b'x' * 100), keep=True)
+    assert lru.lookup('big') is not None
+    lru.write('other', _write(b'y' * 100))
+    assert lru.lookup('big') is None and lru.lookup('other') is None
+
+
+def test_failed_write_leaves_no_files(tmp_path):
+    lru = DiskLRU(str(tmp_path), '.bin', max_bytes=10 ** 6)
+
+    def broken(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(b'partial')
+        raise OSError('disk full')
+    with pytest.raises(OSError):
+        lru.write('key', broken)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_artifact_store_shares_identical_outputs(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=10 ** 6, max_age=3600)
+    handle = store.put(b'data')
+    assert store.put(b'data') == handle
+    assert store.read(handle) == b'data' and len(os.listdir(str(tmp_path))) == 1
+    assert store.read('0' * 64) is None and store.read(None) is None
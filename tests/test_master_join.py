@@ -0,0 +1,128 @@
+import io
+import re
+
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.worksheet.formula import ArrayFormula
+from synthetic_pdfs import order_pdf
+
+from api.master_join import join_customer_master, join_product_master, order_product_names
+from api.masters import load_master_csv
+from api.order_pipeline import convert_order_pdf, load_order_resources
+
+
+def excel_wildcard_lookup(master: pd.DataFrame, query: str):
+    """VLOOKUP("*"&SUBSTITUTE(SUBSTITUTE(q," ",""),"　","")&"*",商品マスタ!D:E,2,FALSE) と同じ行 (なければ None)"""
+    needle = query.replace(' ', '').replace('　', '').casefold()
+    for planned, row in zip(master['商品予定名'], master.itertuples(index=False)):
+        if needle in str(planned).casefold():
+            return tuple(row)
+    return None
+
+
+@pytest.fixture
+def product_master(assets_dir):
+    df, _ = load_master_csv(assets_dir, '商品マスタ')
+    return df
+
+
+@pytest.mark.parametrize('query', ['キ ャラ', 'キャラ', 'カ レ ー', 'ハンバ　ーグ', '唐 揚', '幼児 食'])
+def test_joined_lookup_matches_full_master(product_master, query):
+    names = order_product_names(pd.DataFrame({'商品予定名': [query]}), None)
+    joined = join_product_master(product_master, names)
+    assert len(joined) < len(product_master)
+    assert excel_wildcard_lookup(joined, query) == excel_wildcard_lookup(product_master, query)
+
+
+def test_spaced_query_keeps_all_matching_rows(product_master):
+    joined = join_product_master(product_master, {'キ ャラ'})
+    full_matches = product_master['商品予定名'].str.replace(r'\s', '', regex=True).str.contains('キャラ')
+    assert full_matches.sum() > 0
+    assert len(joined) >= full_matches.sum()
+
+
+def test_customer_join_keeps_client_rows(assets_dir):
+    df, _ = load_master_csv(assets_dir, '得意先マスタ')
+    code, name = df['得意先ＣＤ'].iloc[3], df['得意先名'].iloc[7]
+    joined = join_customer_master(df, [{'client_id': code, 'client_name': name.replace('　', ' ')}])
+    assert set(joined.index) >= {3, 7}
+    assert len(joined) < len(df)
+
+
+# テンプレートの数式がマスタを引く箇所: (VLOOKUP|MATCH)(検索値, 商品マスタ!D:… のような形
+_LOOKUP_RE = re.compile(r'(?:VLOOKUP|MATCH)\(((?:[^(),]|\([^()]*(?:\([^()]*\))?[^()]*\))+?),\s*(商品マスタ|得意先マスタ)!\$?([A-Z]+)')
+_REF = r'\$?[A-Z]{1,3}\$?\d+'
+# 検索値の形 -> (数式の検索値を作る変換, ワイルドカード検索か)。参照先のセルはどれも注文の値から作られる
+_KEY_FORMS = [
+    (re.compile(r'^"\*([^"*]+)\*"$'), None, True),
+    (re.compile(r'^"\*"&(' + _REF + r')&"\*"$'), lambda s: s, True),
+    (re.compile(r'^"\*"&SUBSTITUTE\((' + _REF + r'),"\s?","　"\)&"\*"$'), lambda s: s.replace(' ', '　'), True),
+    (re.compile(r'^"\*"&SUBSTITUTE\(SUBSTITUTE\((' + _REF + r')," ",""\),"　",""\)&"\*"$'),
+     lambda s: s.replace(' ', '').replace('　', ''), True),
+    (re.compile(r'^(' + _REF + r')$'), lambda s: s, False),
+]
+_INPUT_SHEETS = ['貼り付け用', '注文弁当の抽出', 'クライアント抽出']
+
+
+def _master_lookups(wb):
+    """ブック中のマスタ検索の (マスタ, 列, 固定の検索値 or 変換, ワイルドカードか) の集合"""
+    lookups = set()
+    for ws in wb.worksheets:
+        if ws.title.endswith('マスタ'):
+            continue
+        for row in ws.iter_rows():
+            for cell in row:
+                value = cell.value.text if isinstance(cell.value, ArrayFormula) else cell.value
+                if not (isinstance(value, str) and 'マスタ!' in value):
+                    continue
+                for key, master, column in _LOOKUP_RE.findall(value):
+                    for form, transform, wildcard in _KEY_FORMS:
+                        match = form.match(key.strip())
+                        if match:
+                            lookups.add((master, column, match.group(1) if transform is None else transform, wildcard))
+                            break
+                    else:
+                        pytest.fail(f'{ws.title}!{cell.coordinate}: 未対応の検索値 {key}')
+    return lookups
+
+
+def _candidate_keys(wb, master):
+    """数式の検索値になりうる注文の値 (得意先マスタは貼り付け用の左端の列、商品マスタは数量以外の文字列)"""
+    if master == '得意先マスタ':
+        return {str(row[0]) for row in wb['貼り付け用'].iter_rows(values_only=True) if row[0] is not None}
+    keys = set()
+    for name in _INPUT_SHEETS:
+        for row in wb[name].iter_rows(values_only=True):
+            keys.update(str(v).strip() for v in row if isinstance(v, str) and not v.startswith('='))
+    return {k for k in keys if k and not k.isdigit()}
+
+
+def _first_match(rows, column, key, wildcard):
+    """Excel の VLOOKUP(…,FALSE) / MATCH(…,0) が返す最初の行 (大文字・小文字は区別しない)"""
+    key = key.casefold()
+    for row in rows:
+        cell = '' if row[column] is None else str(row[column]).casefold()
+        if (key in cell) if wildcard else cell == key:
+            return row
+    return None
+
+
+def test_joined_masters_give_the_same_lookups_as_full(assets_dir):
+    pdf = order_pdf(pages=2, clients=6, seed=1)
+    outputs = {
+        mode: convert_order_pdf(pdf, load_order_resources(assets_dir, master_paste=mode), page_workers=0)
+        for mode in ('full', 'joined')
+    }
+    for attr in ('template_bytes', 'nouhinsyo_bytes'):
+        full, joined = (openpyxl.load_workbook(io.BytesIO(getattr(outputs[mode], attr))) for mode in ('full', 'joined'))
+        lookups = _master_lookups(joined)
+        assert lookups
+        for master, column, key, wildcard in lookups:
+            full_rows = list(full[master].iter_rows(min_row=2, values_only=True))
+            joined_rows = list(joined[master].iter_rows(min_row=2, values_only=True))
+            col = openpyxl.utils.column_index_from_string(column) - 1
+            keys = [key] if isinstance(key, str) else {key(k) for k in _candidate_keys(joined, master)}
+            for k in keys:
+                assert _first_match(joined_rows, col, k, wildcard) == _first_match(full_rows, col, k, wildcard), \
+                    (attr, master, column, k)
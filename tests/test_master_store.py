@@ -0,0 +1,75 @@
+import glob
+import os
+
+from api import product_matcher
+from api.master_store import MasterIndex, get_master_index, list_master_versions, save_master_version
+from api.masters import find_master_file, read_master_file
+from api.product_matcher import ProductMatcher, normalize_product_name
+
+
+def _product_csv(assets_dir):
+    path = find_master_file(assets_dir, '商品マスタ')
+    with open(path, 'rb') as f:
+        return os.path.basename(path), f.read()
+
+
+def test_save_records_versions_and_changed_rows(assets_dir):
+    name, data = _product_csv(assets_dir)
+    first = save_master_version(assets_dir, '商品マスタ', name, data)
+    assert first['changed_rows'] == first['rows']
+
+    lines = data.split(b'\n')
+    lines[5] = lines[5].replace(b',', b',X', 1)
+    second = save_master_version(assets_dir, '商品マスタ', 'new_商品マスタ.csv', b'\n'.join(lines))
+    assert second['changed_rows'] == 1
+    assert [v['version'] for v in list_master_versions(assets_dir, '商品マスタ')] == [second['version'], first['version']]
+    # 古いCSVは置き換えられる
+    assert [os.path.basename(p) for p in glob.glob(os.path.join(assets_dir, '*商品マスタ*.csv'))] == ['new_商品マスタ.csv']
+
+
+def test_stored_index_matches_fresh_matcher(assets_dir):
+    name, data = _product_csv(assets_dir)
+    save_master_version(assets_dir, '商品マスタ', name, data)
+    df = read_master_file(find_master_file(assets_dir, '商品マスタ'))
+    index = get_master_index(df, '商品マスタ')
+    fresh = ProductMatcher.from_master_df(df)
+    for query in ['カレー', 'キャラ弁当', '唐揚げ', '存在しない弁当']:
+        assert index.matcher.exact(query) == fresh.exact(query)
+        assert index.matcher.longest_substring(query) == fresh.longest_substring(query)
+
+
+def test_conversion_lookup_does_not_register_versions(assets_dir):
+    # 手で置いたマスタを変換で読み込んでも、保管庫には書き込まない
+    df = read_master_file(find_master_file(assets_dir, '商品マスタ'))
+    index = get_master_index(df, '商品マスタ')
+    assert isinstance(index, MasterIndex)
+    assert list_master_versions(assets_dir, '商品マスタ') == []
+    assert not os.path.exists(os.path.join(assets_dir, 'masters'))
+
+
+def test_one_row_edit_reuses_normalized_names(assets_dir, monkeypatch):
+    df = read_master_file(find_master_file(assets_dir, '商品マスタ'))
+    previous = MasterIndex('商品マスタ', 'v1', df)
+    edited = df.copy()
+    old_name = edited.at[5, '商品予定名']
+    edited.at[5, '商品予定名'] = old_name + '　改'
+
+    calls = []
+
+    def counting(name):
+        calls.append(name)
+        return normalize_product_name(name)
+    monkeypatch.setattr(product_matcher, 'normalize_product_name', counting)
+    index = MasterIndex('商品マスタ', 'v2', edited, previous)
+    # 正規化し直すのは変わった1行の名前だけ
+    assert index.changed_rows == 1
+    assert calls == [old_name + '　改']
+    assert index.matcher is not previous.matcher
+
+    monkeypatch.setattr(product_matcher, 'normalize_product_name', normalize_product_name)
+    cold = ProductMatcher.from_master_df(edited)
+    queries = {normalize_product_name(name) for name in edited['商品予定名'].astype(str)}
+    queries |= {normalize_product_name(q) for q in ['カレー', 'キャラ弁当', '唐揚げ', old_name, '存在しない弁当']}
+    for query in sorted(queries):
+        assert index.matcher.exact(query) == cold.exact(query)
+        assert index.matcher.longest_substring(query) == cold.longest_substring(query)
@@ -0,0 +1,33 @@
+import pytest
+
+from api import order_cache as cache_module
+from api.order_pipeline import OrderOutputs, load_order_resources
+
+
+@pytest.fixture
+def conversions(monkeypatch):
+    calls = []
+
+    def convert(pdf_data, resources, *args):
+        calls.append(pdf_data)
+        return OrderOutputs(b'template-%d' % len(calls), b'nouhinsyo-%d' % len(calls))
+    monkeypatch.setattr(cache_module, 'convert_order_pdf', convert)
+    return calls
+
+
+@pytest.mark.parametrize('name, value', [
+    ('PIPELINE_VERSION', 2), ('XLSX_WRITER', 'openpyxl'), ('COMPRESSLEVEL', 1),
+])
+def test_pipeline_and_writer_settings_change_the_key(assets_dir, order_cache, conversions, monkeypatch,
+                                                     name, value):
+    resources = load_order_resources(assets_dir)
+    pdf = b'%PDF-order'
+    first, cached = order_cache.get_or_convert(pdf, resources)
+    assert not cached and len(conversions) == 1
+    assert order_cache.get_or_convert(pdf, resources) == (first, True)
+
+    assert getattr(cache_module, name) != value
+    monkeypatch.setattr(cache_module, name, value)
+    # 変換処理の版・出力方式・圧縮レベルのどれが変わっても、前の結果は使わない
+    second, cached = order_cache.get_or_convert(pdf, resources)
+    assert not cached and second != first and len(conversions) == 2
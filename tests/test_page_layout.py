@@ -0,0 +1,18 @@
+import pytest
+from synthetic_pdfs import order_pdf
+
+from api import pdf_utils
+from api.order_pipeline import convert_order_pdf, load_order_resources
+
+
+@pytest.mark.parametrize('keep', [1, 100])
+def test_words_are_extracted_once_per_page(assets_dir, monkeypatch, keep):
+    monkeypatch.setattr(pdf_utils, 'PAGE_KEEP_PARSED', keep)
+    resources = load_order_resources(assets_dir)
+    pages = 5
+    data = order_pdf(pages=pages, clients=8, seed=0)
+
+    pdf_utils.reset_layout_stats()
+    # 貼り付け用シート・弁当表・クライアント情報のすべての抽出を通して、各ページのレイアウトは1回だけ作る
+    convert_order_pdf(data, resources, page_workers=0)
+    assert pdf_utils.LAYOUT_STATS['word_extractions'] == pages
@@ -0,0 +1,30 @@
+import os
+import tracemalloc
+
+from synthetic_pdfs import order_pdf
+
+from api.pdf_utils import ParsedOrderPdf, collect_page_tasks, pdf_to_excel_data_for_paste_sheet
+
+CEILING_MIB = float(os.environ.get('PDF_MEMORY_CEILING_MB', '48'))
+
+
+def _peak_mib(pages):
+    data = order_pdf(pages=pages, clients=20, seed=0)
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        with ParsedOrderPdf(data) as pdf:
+            pdf_to_excel_data_for_paste_sheet(pdf)
+            outcome = collect_page_tasks(('bento_table', 'client_info'), pdf, workers=0)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    assert len(outcome['client_info'][0]) == pages * 20
+    return peak / 2**20
+
+
+def test_page_scan_memory_stays_under_ceiling():
+    small, large = _peak_mib(4), _peak_mib(24)
+    assert large < CEILING_MIB
+    # 解析済みのページを保持し続けないので、ページ数を増やしても最大使用量はほとんど増えない
+    assert large < small * 2
@@ -0,0 +1,57 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from synthetic_pdfs import order_pdf
+
+from api import pdf_utils
+from api.pdf_utils import ParsedOrderPdf, collect_pages
+
+TASKS = ('bento_table', 'client_info')
+
+
+@pytest.fixture(scope='module')
+def order():
+    return order_pdf(pages=6, clients=8, seed=4)
+
+
+def _collect(data, **kwargs):
+    with ParsedOrderPdf(data) as pdf:
+        return {task: collect_pages(task, pdf, [], **kwargs) for task in TASKS}
+
+
+def test_parallel_pages_match_sequential_and_reuse_the_pool(order):
+    expected = _collect(order, workers=0)
+    try:
+        assert _collect(order, workers=2, chunk_size=2) == expected
+        pool = pdf_utils._PAGE_POOL
+        assert pool is not None
+        assert _collect(order, workers=2, chunk_size=3) == expected
+        assert pdf_utils._PAGE_POOL is pool
+    finally:
+        pdf_utils._reset_page_pool()
+
+
+def test_broken_pool_falls_back_to_this_process(order, monkeypatch):
+    class BrokenPool:
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool('worker died')
+
+    expected = _collect(order, workers=0)
+    monkeypatch.setattr(pdf_utils, '_get_page_pool', lambda workers: BrokenPool())
+    assert _collect(order, workers=2, chunk_size=2) == expected
+
+
+@pytest.mark.parametrize('garble', [
+    lambda text: text.replace('園', '\ufffd'),
+    lambda text: ''.join(c if c.isascii() else '?' for c in text),
+], ids=['replacement-char', 'no-cjk'])
+def test_pages_pdfium_cannot_read_are_still_processed(order, monkeypatch, garble):
+    import pypdfium2
+    expected = _collect(order, workers=0)
+    get_text_range = pypdfium2.PdfTextPage.get_text_range
+    # pdfplumber では読める「園名」を pdfium が読めない
+    monkeypatch.setattr(pypdfium2.PdfTextPage, 'get_text_range',
+                        lambda self, *args, **kwargs: garble(get_text_range(self, *args, **kwargs)))
+    with ParsedOrderPdf(order) as pdf:
+        assert pdf.keyword_pages()['園名'] == list(range(len(pdf.pages)))
+    assert _collect(order, workers=0) == expected
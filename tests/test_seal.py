@@ -0,0 +1,225 @@
+import io
+import json
+import threading
+
+import pdfplumber
+import pytest
+from synthetic_pdfs import SEAL_CLIENTS, MiniPdf, seal_pdf
+
+from api import seal
+from api.gemini_cache import GeminiResponseCache
+from api.pdf_utils import extract_seal_blocks_from_pdf
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Geminiの代わり: 送られたPDFの文字をそのまま client_name にしたブロックを返す。
+    failures[ページの文字] の回数だけ、順に 'error' (例外) か 'truncated' (途中で切れた出力) を返す。
+    """
+
+    def __init__(self, failures=None):
+        self.failures = {k: list(v) for k, v in (failures or {}).items()}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, parts, generation_config=None):
+        text = page_text(parts[0]['data'])
+        with self._lock:
+            self.calls.append(text)
+            pending = self.failures.get(text)
+            failure = pending.pop(0) if pending else None
+        if failure == 'error':
+            raise RuntimeError('quota exceeded')
+        body = json.dumps({'blocks': [{'client_name': text}, {'client_name': text + '-2'}]}, ensure_ascii=False)
+        if failure == 'truncated':
+            body = body[:body.rfind('},') + 2] + '{"client_na'
+        return FakeResponse(body)
+
+
+def page_text(pdf_data):
+    with pdfplumber.open(io.BytesIO(pdf_data)) as pdf:
+        return ' '.join(page.extract_text() or '' for page in pdf.pages)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeminiResponseCache(str(tmp_path / 'gemini'))
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    monkeypatch.setattr(seal, 'SEAL_RETRY_WAIT', 0)
+    pdf_data, _ = seal_pdf(pages=3, blocks_per_page=1, seed=5)
+    texts = [page_text(chunk) for _, chunk in seal.split_pdf_pages(pdf_data)]
+    assert len(set(texts)) == 3
+    return pdf_data, texts
+
+
+def _names(extraction):
+    return [block['client_name'] for block in extraction.blocks]
+
+
+def test_cached_blocks_skip_the_model(cache):
+    pdf_data, _ = seal_pdf(pages=1, blocks_per_page=1, seed=1)
+    model = FakeModel()
+    first = seal.extract_seal_blocks(pdf_data, model, 'fake', cache=cache)
+    assert not first.cached and len(model.calls) == 1
+
+    second = seal.extract_seal_blocks(pdf_data, model, 'fake', cache=cache)
+    assert second.cached and second.blocks == first.blocks
+    assert len(model.calls) == 1
+    # モデル名・プロンプトが違えば別のキー
+    seal.extract_seal_blocks(pdf_data, model, 'other', cache=cache)
+    assert len(model.calls) == 2
+    # use_cache=False は読み出しだけを飛ばす
+    seal.extract_seal_blocks(pdf_data, model, 'fake', cache=cache, use_cache=False)
+    assert len(model.calls) == 3
+
+
+def test_truncated_output_is_not_cached(cache):
+    pdf_data, _ = seal_pdf(pages=1, blocks_per_page=1, seed=2)
+    text = page_text(pdf_data)
+    model = FakeModel({text: ['truncated']})
+    first = seal.extract_seal_blocks(pdf_data, model, 'fake', cache=cache)
+    assert first.recovered and _names(first) == [text]
+
+    second = seal.extract_seal_blocks(pdf_data, model, 'fake', cache=cache)
+    assert not second.cached and not second.recovered and _names(second) == [text, text + '-2']
+
+
+def test_by_page_keeps_page_order_and_retries_failed_pages(cache, pages):
+    pdf_data, texts = pages
+    model = FakeModel({texts[0]: ['error'], texts[2]: ['truncated', 'error']})
+    result = seal.extract_seal_blocks_by_page(pdf_data, model, 'fake', cache=cache, max_concurrency=3, retries=2)
+    assert _names(result) == [name for text in texts for name in (text, text + '-2')]
+    assert not result.recovered and not result.cached
+    assert sorted(model.calls) == sorted([texts[0]] * 2 + [texts[1]] + [texts[2]] * 3)
+
+    again = seal.extract_seal_blocks_by_page(pdf_data, model, 'fake', cache=cache)
+    assert again.cached and again.blocks == result.blocks
+    assert len(model.calls) == 6
+
+
+def test_by_page_partial_failure_reuses_finished_pages(cache, pages):
+    pdf_data, texts = pages
+    model = FakeModel({texts[1]: ['error'] * 2})
+    with pytest.raises(RuntimeError, match='2ページ目'):
+        seal.extract_seal_blocks_by_page(pdf_data, model, 'fake', cache=cache, max_concurrency=1, retries=1)
+    assert model.calls.count(texts[1]) == 2
+
+    # 失敗したページだけを解析し直す
+    model.calls.clear()
+    result = seal.extract_seal_blocks_by_page(pdf_data, model, 'fake', cache=cache, retries=1)
+    assert model.calls == [texts[1]]
+    assert not result.cached and len(result.blocks) == 6
+
+
+def test_by_page_truncated_after_retries_is_reported(cache, pages):
+    pdf_data, texts = pages
+    model = FakeModel({texts[0]: ['truncated'] * 2})
+    result = seal.extract_seal_blocks_by_page(pdf_data, model, 'fake', cache=cache, retries=1)
+    assert result.recovered
+    assert _names(result) == [texts[0]] + [name for text in texts[1:] for name in (text, text + '-2')]
+
+
+def test_by_page_negative_retries_still_tries_once(cache, pages):
+    pdf_data, texts = pages
+    model = FakeModel({texts[0]: ['truncated'], texts[1]: ['error']})
+    with pytest.raises(RuntimeError, match='2ページ目'):
+        seal.extract_seal_blocks_by_page(pdf_data, model, 'fake', cache=cache, max_concurrency=1, retries=-1)
+    assert model.calls.count(texts[1]) == 1
+
+    # 再試行なしでも各ページ1回は解析し、切れた出力はそのまま返す
+    result = seal.extract_seal_blocks_by_page(pdf_data, FakeModel({texts[0]: ['truncated']}), 'fake',
+                                              cache=cache, use_cache=False, retries=-1)
+    assert result.recovered and len(result.blocks) == 5
+
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 10 ** 6])
+def test_stream_parser_emits_only_blocks_elements(chunk_size):
+    body = json.dumps({
+        'title': 'blocks', 'notes': [{'client_name': 'note'}],
+        'meta': {'blocks': [{'client_name': 'nested'}]},
+        'blocks': [{'client_name': 'A', 'items': [{'n': 1}]}, {'client_name': 'B "x" {'}],
+        'extra': [{'client_name': 'after'}],
+    }, ensure_ascii=False)
+    for text, expected in [('```json\n' + body + '\n```', ['A', 'B "x" {']),
+                           (json.dumps([{'client_name': 'C'}]), ['C'])]:
+        parser = seal.BlockStreamParser()
+        emitted = []
+        for i in range(0, len(text), chunk_size):
+            emitted += parser.feed(text[i:i + chunk_size])
+        assert [block['client_name'] for block in emitted] == expected
+        assert parser.complete and parser.blocks == emitted
+
+
+def _ruled_seal_pdf(xs, ys):
+    """罫線で不均等な格子に区切ったシールPDF (各ブロックは区画の左上から描く)"""
+    pdf = MiniPdf(595, 842)
+    pdf.new_page()
+    for x in xs:
+        pdf.line(x, ys[0], x, ys[-1])
+    for y in ys:
+        pdf.line(xs[0], y, xs[-1], y)
+    truth = []
+    for row, (top, _) in enumerate(zip(ys, ys[1:])):
+        for col, (left, _) in enumerate(zip(xs, xs[1:])):
+            block = {'client_name': SEAL_CLIENTS[(row + col) % 4], 'class_name': 'さくら',
+                     'meal_count': str(10 + row * 3 + col), 'date': f'{row + 1}/{col + 1}', 'grade': '年長'}
+            pdf.text(left + 10, top + 10, block['client_name'], 8)
+            pdf.text(left + 10, top + 26, 'ご飯150g', 7)
+            pdf.text(left + 20, top + 50, block['class_name'], 16)
+            pdf.text(left + 40, top + 80, block['meal_count'], 14)
+            pdf.text(left + 10, top + 120, block['date'], 8)
+            pdf.text(left + 100, top + 120, block['grade'], 8)
+            truth.append(dict(block, row=row, col=col, bbox=(left, top)))
+    return pdf.tobytes(), truth
+
+
+def test_local_blocks_follow_ruled_grid():
+    xs, ys = [30, 250, 400, 565], [40, 330, 480, 800]
+    pdf_data, truth = _ruled_seal_pdf(xs, ys)
+    blocks = extract_seal_blocks_from_pdf(pdf_data)
+    assert len(blocks) == len(truth)
+    for block, expected in zip(blocks, truth):
+        for key in ('client_name', 'class_name', 'meal_count', 'date', 'grade', 'row', 'col'):
+            assert block[key] == expected[key], key
+        assert block['confidence'] == 1.0
+    # 区画の内側の罫線が境界になる (外側の区画はページ端まで広げる)
+    assert blocks[4]['bbox'] == pytest.approx((250, 330, 400, 480), abs=1)
+
+
+class ScriptedModel:
+    """読み直しの応答を順に返す (ブロックの画像ごとに1回)"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate_content(self, parts, generation_config=None):
+        self.calls += 1
+        return FakeResponse(self.responses.pop(0))
+
+
+def test_local_reread_keeps_rule_based_block_on_unusable_results(cache):
+    pdf_data, _ = seal_pdf(pages=1, blocks_per_page=3, seed=7)
+    rule_based = extract_seal_blocks_from_pdf(pdf_data)
+    model = ScriptedModel(['[]', '{"blocks": ["not a block"]}', '{"blocks": [{"client_name": "読み直し様"}]}'])
+    result = seal.extract_seal_blocks_local(pdf_data, model, 'fake', cache=cache, threshold=1.1, max_concurrency=1)
+    assert result.blocks[:2] == rule_based[:2]
+    assert result.blocks[2]['client_name'] == '読み直し様' and result.blocks[2]['source'] == 'gemini'
+    assert result.low_confidence == 2
+
+    # 使えない結果はキャッシュにも残さない
+    cache.put(seal.response_cache_key(pdf_data, 'fake', seal.SEAL_BLOCK_PROMPT, part='block=0-0-1'), [3], model='fake')
+    model = ScriptedModel(['[]'])
+    again = seal.extract_seal_blocks_local(pdf_data, model, 'fake', cache=cache, threshold=1.1, max_concurrency=1)
+    assert model.calls == 1
+    assert again.blocks[1] == rule_based[1]
+    assert again.blocks[2]['client_name'] == '読み直し様'
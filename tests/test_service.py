@@ -0,0 +1,79 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl
+import pytest
+from synthetic_pdfs import order_pdf
+
+from api import index, jobs
+from api.masters import find_master_file
+
+MARKER = 'テスト用の新しい商品名'
+
+
+def _product_names(template_bytes):
+    wb = openpyxl.load_workbook(io.BytesIO(template_bytes), read_only=True)
+    return {row[2] for row in wb['商品マスタ'].iter_rows(min_row=2, values_only=True)}
+
+
+def test_worker_reloads_masters_after_upload(assets_dir, order_cache):
+    jobs.init_worker(assets_dir)
+    pdf = order_pdf(pages=1, seed=3)
+    before = jobs.run_order_job(pdf)
+    assert MARKER not in _product_names(before['template'])
+
+    path = find_master_file(assets_dir, '商品マスタ')
+    lines = open(path, 'rb').read().split(b'\n')
+    fields = lines[1].split(b',')
+    fields[2] = MARKER.encode('cp932')
+    lines[1] = b','.join(fields)
+    stat = os.stat(path)
+    with open(path, 'wb') as f:
+        f.write(b'\n'.join(lines))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    # 同じPDFでも新しいマスタで変換し直す
+    after = jobs.run_order_job(pdf)
+    assert MARKER in _product_names(after['template'])
+
+
+@pytest.fixture
+def thread_pool(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(index, '_get_executor', lambda: pool)
+    monkeypatch.setattr(index, '_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(index, '_pending', 0)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_timed_out_job_keeps_its_slot(thread_pool, monkeypatch):
+    monkeypatch.setattr(index, 'CONVERT_TIMEOUT', 0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(TimeoutError):
+            index._run(release.wait)
+        # タイムアウトしてもジョブは実行中なので、次のジョブは受け付けない
+        assert index._run(lambda: 'next') is None
+        assert index._pending == 1
+    finally:
+        release.set()
+    for _ in range(100):
+        if index._pending == 0:
+            break
+        time.sleep(0.01)
+    assert index._pending == 0
+    assert index._run(lambda: 'next') == 'next'
+
+
+def test_seal_without_api_key_returns_503(monkeypatch):
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    monkeypatch.setattr(index, '_run', lambda job, *args, **kwargs: job(*args, **kwargs))
+    client = index.app.test_client()
+    response = client.post('/convert/seal?method=gemini',
+                           data={'file': (io.BytesIO(b'%PDF-1.4'), 'seal.pdf')})
+    assert response.status_code == 503
+    assert 'GOOGLE_API_KEY' in response.get_json()['error']
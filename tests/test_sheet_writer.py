@@ -0,0 +1,94 @@
+import datetime
+import math
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Font
+
+from api.pdf_utils import paste_dataframe_to_sheet, safe_write_df
+
+
+def _frame():
+    return pd.DataFrame({
+        '名前': ['弁当　園児', '=A1', '#N/A', None, 'x' * 40000],
+        '数量': [1, 2, 3, 4, 5],
+        '単価': [250.5, float('nan'), 0.0, -1.25, 1e10],
+        '混在': ['文字', 7, None, np.int64(8), True],
+        '日付': [datetime.datetime(2025, 12, 3), None, None, None, datetime.datetime(2026, 1, 5, 8, 30)],
+    })
+
+
+def _styled_sheet():
+    """書き込み先の一部にあらかじめ書式と値があるシート (テンプレートの貼り付け先と同じ状況)"""
+    ws = openpyxl.Workbook().active
+    for row in range(1, 9):
+        for col in (1, 3, 6):
+            cell = ws.cell(row=row, column=col, value='old')
+            cell.font = Font(bold=True)
+            cell.number_format = '0.00'
+    return ws
+
+
+def _old_paste(ws, df, start_row=1, start_col=1):
+    """変更前の paste_dataframe_to_sheet (ws.cell() でセルごとに書き込む)"""
+    for c_idx, col_name in enumerate(df.columns, start=start_col):
+        ws.cell(row=start_row, column=c_idx, value=col_name)
+    for r_idx, row in df.iterrows():
+        for c_idx, value in enumerate(row, start=start_col):
+            ws.cell(row=start_row + r_idx + 1, column=c_idx, value=value)
+
+
+def _old_safe_write(ws, df, start_row=1):
+    """変更前の safe_write_df"""
+    num_cols = df.shape[1]
+    if ws.max_row >= start_row:
+        for row_idx in range(start_row, ws.max_row + 2):
+            for col_idx in range(1, num_cols + 2):
+                ws.cell(row=row_idx, column=col_idx).value = None
+    for r_idx, row_data in enumerate(df.itertuples(index=False), start=start_row):
+        for c_idx, value in enumerate(row_data, start=1):
+            ws.cell(row=r_idx, column=c_idx, value=value)
+
+
+def _value(value):
+    # NaN は自分自身と等しくないため、比較用に置き換える
+    return 'NaN' if isinstance(value, float) and math.isnan(value) else value
+
+
+def _cells(ws):
+    """
+    値が入っているか書式のあるセルの (値, 型, 書式)。変更前の safe_write_df は消去のために既存の最終行の
+    1行先まで空のセルを作っていたが、clear_values は既存のセルだけを空にするため、空のセルは比べない
+    """
+    return {
+        key: (_value(cell.value), cell.data_type, cell.font.b, cell.number_format)
+        for key, cell in ws._cells.items() if cell.value is not None or cell.has_style
+    }
+
+
+@pytest.mark.parametrize('write, old_write, kwargs', [
+    (paste_dataframe_to_sheet, _old_paste, {'start_row': 2, 'start_col': 2}),
+    (safe_write_df, _old_safe_write, {'start_row': 3}),
+])
+def test_bulk_write_matches_cell_by_cell_write(write, old_write, kwargs):
+    df = _frame()
+    expected, actual = _styled_sheet(), _styled_sheet()
+    old_write(expected, df, **kwargs)
+    write(actual, df, **kwargs)
+    # 値・型 (NaN / None・数値・文字列) が一致し、既存セルの書式 (太字・表示形式) が残っている
+    assert _cells(actual) == _cells(expected)
+    assert actual.cell(row=4, column=3).font.b and actual.cell(row=4, column=3).number_format == '0.00'
+
+
+def test_bulk_paste_keeps_the_sheet_extent():
+    df = _frame()
+    expected, actual = _styled_sheet(), _styled_sheet()
+    _old_paste(expected, df, start_row=2, start_col=2)
+    paste_dataframe_to_sheet(actual, df, start_row=2, start_col=2)
+    assert (actual.max_row, actual.max_column) == (expected.max_row, expected.max_column)
+    # ws.append はどちらの書き込みの後でも同じ行に追記する
+    expected.append(['next'])
+    actual.append(['next'])
+    assert _cells(actual) == _cells(expected)
@@ -0,0 +1,22 @@
+import pytest
+
+from api.tracing import RunTrace, current_rss_mib
+
+pytestmark = pytest.mark.skipif(current_rss_mib() is None, reason='/proc/self/statm is not available')
+
+
+def test_spans_report_current_rss_delta():
+    trace = RunTrace('test')
+    with trace.span('outer'):
+        with trace.span('allocate'):
+            # 触ったページだけがRSSに載るので、確保したうえで書き込む
+            block = bytearray(64 * 2**20)
+            block[::4096] = b'x' * len(block[::4096])
+        with trace.span('release'):
+            del block
+    outer, allocate, release = trace.records
+    assert allocate['rss_delta_mib'] > 48
+    assert release['rss_delta_mib'] < -48
+    # プロセスの最大RSSではなく、その段階の増減なので外側の段階ではほぼ相殺される
+    assert abs(outer['rss_delta_mib']) < 16
+    assert 'rss_peak_mib' not in allocate
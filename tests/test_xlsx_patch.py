@@ -0,0 +1,110 @@
+import io
+import logging
+import os
+import zipfile
+
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.worksheet.formula import ArrayFormula
+from synthetic_pdfs import order_pdf
+
+from api import workbooks, xlsx_patch
+from api.masters import load_master_csv
+from api.pdf_utils import (
+    ParsedOrderPdf, export_detailed_client_data_to_dataframe, extract_bento_range_for_bento,
+    extract_detailed_client_info_from_pdf, extract_table_from_pdf_for_bento, find_correct_anchor_for_bento,
+    match_bento_data, pdf_to_excel_data_for_paste_sheet,
+)
+from api.xlsx_patch import SheetPatch
+
+
+def _value(value):
+    if isinstance(value, ArrayFormula):
+        return ('array', value.ref, value.text)
+    return value
+
+
+def _cells(data):
+    wb = openpyxl.load_workbook(io.BytesIO(data))
+    return {ws.title: {cell.coordinate: _value(cell.value) for row in ws.iter_rows() for cell in row
+                       if cell.value is not None}
+            for ws in wb.worksheets}
+
+
+def _order_patches(data, df_product_master):
+    """streamlit_app の変換と同じ貼り付け用・注文弁当の抽出・クライアント抽出のパッチ"""
+    with ParsedOrderPdf(data) as pdf:
+        df_paste_sheet = pdf_to_excel_data_for_paste_sheet(pdf)
+        tables = extract_table_from_pdf_for_bento(pdf)
+        client_data = extract_detailed_client_info_from_pdf(pdf)
+    main_table = max(tables, key=len)
+    bento_list = extract_bento_range_for_bento(main_table, find_correct_anchor_for_bento(main_table))
+    df_bento_sheet = pd.DataFrame(match_bento_data(bento_list, df_product_master),
+                                  columns=['商品予定名', 'パン箱入数', '売価単価', '弁当区分'])
+    return {
+        "貼り付け用": SheetPatch.paste(df_paste_sheet),
+        "注文弁当の抽出": SheetPatch.safe_write(df_bento_sheet),
+        "クライアント抽出": SheetPatch.safe_write(export_detailed_client_data_to_dataframe(client_data)),
+    }
+
+
+def test_patch_writer_matches_openpyxl_writer(assets_dir, caplog):
+    df_product_master, _ = load_master_csv(assets_dir, "商品マスタ")
+    df_customer_master, _ = load_master_csv(assets_dir, "得意先マスタ")
+    patches = _order_patches(order_pdf(pages=2, clients=8, bentos=5, seed=11), df_product_master)
+    jobs = [
+        (os.path.join(assets_dir, 'template.xlsm'),
+         {"商品マスタ": df_product_master, "得意先マスタ": df_customer_master}, True),
+        (os.path.join(assets_dir, 'nouhinsyo.xlsx'), {"得意先マスタ": df_customer_master}, False),
+    ]
+    for path, masters, keep_vba in jobs:
+        prepared = workbooks.get_prepared_template(path, masters, keep_vba=keep_vba)
+        sheet_patches = {name: patch for name, patch in patches.items() if name in prepared.sheetnames}
+        reference = workbooks.build_workbook(prepared, sheet_patches, engine='openpyxl')
+        with caplog.at_level(logging.WARNING, logger=workbooks.__name__):
+            patched = workbooks.build_workbook(prepared, sheet_patches, engine='patch')
+        # openpyxl への切り替えなしにパッチで書き込めていること
+        assert not caplog.records
+
+        actual_cells, reference_cells = _cells(patched), _cells(reference)
+        assert list(actual_cells) == list(reference_cells)
+        for title, cells in reference_cells.items():
+            # 値と数式 ("=" で始まる文字列) がセルごとに一致する
+            assert actual_cells[title] == cells, title
+
+
+def test_warm_builds_the_patch_package_once(assets_dir):
+    df_customer_master, _ = load_master_csv(assets_dir, "得意先マスタ")
+    prepared = workbooks.PreparedTemplate(os.path.join(assets_dir, 'nouhinsyo.xlsx'), False,
+                                          {"得意先マスタ": df_customer_master})
+    prepared.warm('openpyxl')
+    assert prepared._package is None
+    prepared.warm('patch')
+    package = prepared._package
+    assert package is not None
+    prepared.warm('patch')
+    assert prepared.package is package
+
+
+@pytest.mark.parametrize('raw_copy', [True, False])
+def test_untouched_parts_are_copied_verbatim(assets_dir, monkeypatch, raw_copy):
+    monkeypatch.setattr(xlsx_patch, '_RAW_COPY', raw_copy and xlsx_patch._RAW_COPY)
+    df_customer_master, _ = load_master_csv(assets_dir, "得意先マスタ")
+    prepared = workbooks.get_prepared_template(os.path.join(assets_dir, 'template.xlsm'),
+                                               {"得意先マスタ": df_customer_master}, keep_vba=True)
+    patched = xlsx_patch.patch_workbook(prepared.package, {})
+    with zipfile.ZipFile(io.BytesIO(prepared.package)) as zin, zipfile.ZipFile(io.BytesIO(patched)) as zout:
+        assert zout.testzip() is None
+        # 書き換えたパートも元の日時のままなので、同じ入力からは同じバイト列になる
+        assert zout.getinfo('xl/workbook.xml').date_time == zin.getinfo('xl/workbook.xml').date_time
+        rewritten = {'xl/workbook.xml', xlsx_patch.CALC_CHAIN_PART, '[Content_Types].xml', 'xl/_rels/workbook.xml.rels'}
+        untouched = [info for info in zin.infolist() if info.filename not in rewritten]
+        assert any(info.filename == 'xl/vbaProject.bin' for info in untouched)
+        for info in untouched:
+            copied = zout.getinfo(info.filename)
+            assert zout.read(copied) == zin.read(info)
+            assert (copied.CRC, copied.date_time) == (info.CRC, info.date_time)
+            if xlsx_patch._RAW_COPY:
+                # 圧縮データのままコピーしたパートは圧縮後の大きさも元と同じ
+                assert copied.compress_size == info.compress_size